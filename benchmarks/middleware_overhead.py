@@ -0,0 +1,94 @@
+"""Per-request overhead of the response header middleware
+
+Compares a bare Starlette app with the same app behind the former BaseHTTPMiddleware
+based RobotsMiddleware and behind the pure ASGI SecurityHeadersMiddleware, for a small
+response and for a streamed one. Requests are driven in-process, without a server, so
+the numbers are the middleware cost alone.
+
+    python benchmarks/middleware_overhead.py [requests]
+
+Run from the project directory (main.py reads config.yaml from there).
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from main import SECURITY_HEADERS, SecurityHeadersMiddleware
+
+class RobotsMiddleware(BaseHTTPMiddleware):
+    """The middleware SecurityHeadersMiddleware replaced"""
+    async def dispatch(self, request, call_next):
+        response = await call_next(request)
+        response.headers["X-Robots-Tag"] = "noindex, nofollow, noarchive, nosnippet"
+        return response
+
+async def small(request):
+    return PlainTextResponse("ok")
+
+async def streamed(request):
+    async def chunks():
+        for _ in range(20):
+            yield b"x" * 4096
+    return StreamingResponse(chunks(), media_type="text/csv")
+
+def build_app(middleware):
+    app = Starlette(routes=[Route("/small", small), Route("/streamed", streamed)])
+    if middleware is RobotsMiddleware:
+        app.add_middleware(RobotsMiddleware)
+    elif middleware is SecurityHeadersMiddleware:
+        app.add_middleware(SecurityHeadersMiddleware, headers=SECURITY_HEADERS)
+    return app
+
+async def request(app, path):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"localhost")], "client": ("127.0.0.1", 1234), "server": ("localhost", 80)
+    }
+    received = False
+
+    async def receive():
+        nonlocal received
+        if received:
+            # Only asked for by BaseHTTPMiddleware, which watches for a disconnect
+            await asyncio.sleep(3600)
+        received = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+async def measure(app, path, count):
+    for _ in range(200):
+        await request(app, path)
+    started = time.perf_counter()
+    for _ in range(count):
+        await request(app, path)
+    return (time.perf_counter() - started) / count * 1e6
+
+async def main(count):
+    print(f"{count} requests each, microseconds per request")
+    print(f"{'middleware':<28}{'small':>10}{'streamed':>12}")
+    baseline = {}
+    for name, middleware in [("none", None), ("RobotsMiddleware (before)", RobotsMiddleware),
+                             ("SecurityHeadersMiddleware", SecurityHeadersMiddleware)]:
+        app = build_app(middleware)
+        results = {path: await measure(app, path, count) for path in ("/small", "/streamed")}
+        baseline = baseline or results
+        print(f"{name:<28}" + "".join(
+            f"{results[path]:>8.1f}{'':2}" if middleware is None else
+            f"{results[path]:>8.1f} (+{results[path] - baseline[path]:.1f})"
+            for path in ("/small", "/streamed")))
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
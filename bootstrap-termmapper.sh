@@ -224,10 +224,7 @@ server {
     listen [::]:80;
     server_name ${DOMAIN} www.${DOMAIN};
 
-    add_header X-Content-Type-Options "nosniff" always;
-    add_header X-Frame-Options "DENY" always;
-    add_header Referrer-Policy "strict-origin-when-cross-origin" always;
-    add_header Permissions-Policy "geolocation=(), microphone=(), camera=()" always;
+    # Security headers (and HSTS with session.https_only) are set by the app, see SECURITY_HEADERS in main.py
 
     location / {
         limit_req zone=req_limit burst=20 nodelay;
@@ -258,15 +255,6 @@ certbot --nginx \
   -d "${DOMAIN}" -d "www.${DOMAIN}" \
   --non-interactive --agree-tos -m "${EMAIL_TOS}" --redirect
 
-# Harden HTTPS headers
-sed -i '/server_name .*;/a \
-    add_header Strict-Transport-Security "max-age=63072000; includeSubDomains; preload" always; \
-    add_header X-Content-Type-Options "nosniff" always; \
-    add_header X-Frame-Options "DENY" always; \
-    add_header Referrer-Policy "strict-origin-when-cross-origin" always; \
-    add_header Permissions-Policy "geolocation=(), microphone=(), camera=()" always; \
-' "${SITE_AVAIL}" || true
-nginx -t && systemctl reload nginx
 systemctl list-timers | grep certbot || true
 certbot renew --dry-run || true
 
@@ -344,3 +332,4 @@ ok "All done. App should be live at https://${DOMAIN}"
 echo "Deploy updates:"
 echo "  sudo -u ${SERVICE_USER} git -C ${APP_DIR} pull && sudo systemctl restart ${SERVICE_USER}"
 echo "Remember to SSH with: ssh -p ${SSH_PORT} ${ADMIN_USER}@${DOMAIN}"
+echo "Set session.https_only: true in ${APP_DIR}/config.yaml: the app then sends HSTS and a Secure session cookie"
@@ -0,0 +1,96 @@
+"""Server-side code validation rules (SNOMED CT, ICD-10, LOINC)
+
+Kept apart from main.py and free of side effects on import: the bulk validation sweep
+runs validate_codes() in spawned processes, which import this module and not the app.
+"""
+import re
+
+# Bump when the rules change so the sweep re-checks old rows
+VALIDATOR_VERSION = 1
+# Same patterns as detectVocabulary() in static/js/session.js
+DETECT_PATTERNS = [
+    ('SNOMED', re.compile(r'^\d{6,18}$')),
+    ('ICD10', re.compile(r'^[A-TV-Z]\d{2}(\.\d{1,4}[A-Z]?)?$', re.IGNORECASE)),
+    ('LOINC', re.compile(r'^(LP)?\d{4,6}-\d$', re.IGNORECASE)),
+]
+SNOMED_CONCEPT_PARTITIONS = ('00', '10')
+ICD10_PATTERN = re.compile(r'^[A-Z]\d{2}(\.\d{1,4}[A-Z]?)?$')
+LOINC_PATTERN = re.compile(r'^(LP)?(\d{1,7})-(\d)$')
+VERHOEFF_D = [
+    [0, 1, 2, 3, 4, 5, 6, 7, 8, 9], [1, 2, 3, 4, 0, 6, 7, 8, 9, 5], [2, 3, 4, 0, 1, 7, 8, 9, 5, 6],
+    [3, 4, 0, 1, 2, 8, 9, 5, 6, 7], [4, 0, 1, 2, 3, 9, 5, 6, 7, 8], [5, 9, 8, 7, 6, 0, 4, 3, 2, 1],
+    [6, 5, 9, 8, 7, 1, 0, 4, 3, 2], [7, 6, 5, 9, 8, 2, 1, 0, 4, 3], [8, 7, 6, 5, 9, 3, 2, 1, 0, 4],
+    [9, 8, 7, 6, 5, 4, 3, 2, 1, 0],
+]
+VERHOEFF_P = [
+    [0, 1, 2, 3, 4, 5, 6, 7, 8, 9], [1, 5, 7, 6, 2, 8, 3, 0, 9, 4], [5, 8, 0, 3, 7, 9, 6, 1, 4, 2],
+    [8, 9, 1, 6, 0, 4, 3, 5, 2, 7], [9, 4, 5, 3, 1, 2, 6, 8, 7, 0], [4, 2, 8, 6, 5, 7, 3, 9, 0, 1],
+    [2, 7, 9, 3, 8, 0, 6, 4, 1, 5], [7, 0, 4, 6, 9, 1, 3, 2, 5, 8],
+]
+
+def detect_vocabulary(code):
+    """Vocabulary a code looks like, or None"""
+    code = code.strip()
+    for vocabulary, pattern in DETECT_PATTERNS:
+        if pattern.match(code):
+            return vocabulary
+    return None
+
+def verhoeff_valid(digits):
+    """True if the last digit is the Verhoeff check digit of the others (SNOMED CT identifiers)"""
+    check = 0
+    for i, digit in enumerate(reversed(digits)):
+        check = VERHOEFF_D[check][VERHOEFF_P[i % 8][int(digit)]]
+    return check == 0
+
+def loinc_check_digit(number):
+    """LOINC mod-10 check digit of the digits before the dash"""
+    total = 0
+    for i, digit in enumerate(reversed(number)):
+        value = int(digit) * (2 if i % 2 == 0 else 1)
+        total += value // 10 + value % 10
+    return (10 - total % 10) % 10
+
+def validate_code(vocabulary, code):
+    """Normalize a submitted code and check it, returns (normalized_code, is_valid, error)
+
+    is_valid is None for vocabularies without rules (custom ones, proposed concepts).
+    """
+    code = code or ''
+    if vocabulary not in ('SNOMED', 'ICD10', 'LOINC') or not code.strip():
+        return code.strip(), None, None
+    normalized = re.sub(r'\s+', '', code).upper()
+    detected = detect_vocabulary(normalized)
+
+    if vocabulary == 'SNOMED':
+        if not normalized.isdigit() or not 6 <= len(normalized) <= 18 or normalized[0] == '0':
+            error = 'not a SNOMED CT identifier (6-18 digits)'
+        elif not verhoeff_valid(normalized):
+            error = 'wrong SNOMED CT check digit'
+        elif normalized[-3:-1] not in SNOMED_CONCEPT_PARTITIONS:
+            error = f'not a concept id (partition {normalized[-3:-1]})'
+        else:
+            error = None
+    elif vocabulary == 'ICD10':
+        # Drop dagger/asterisk/exclamation marks and the '.-' of category headings, add a missing dot
+        normalized = re.sub(r'(\.-|-)$', '', normalized.rstrip('†‡*!+'))
+        if re.match(r'^[A-Z]\d{3,5}[A-Z]?$', normalized):
+            normalized = normalized[:3] + '.' + normalized[3:]
+        error = None if ICD10_PATTERN.match(normalized) else 'not an ICD-10 code'
+    else:
+        match = LOINC_PATTERN.match(normalized)
+        if not match:
+            error = 'not a LOINC code (number-check digit)'
+        elif not match.group(1) and loinc_check_digit(match.group(2)) != int(match.group(3)):
+            # Part numbers (LP...) are only checked for their format
+            error = 'wrong LOINC check digit'
+        else:
+            error = None
+
+    if error and detected and detected != vocabulary:
+        error += f', looks like {detected}'
+    return normalized, error is None, error
+
+def validate_codes(rows):
+    """Validate (id, vocabulary, code) rows, returns UPDATE parameters; runs in the validation process pool"""
+    return [(*validate_code(vocabulary, code), VALIDATOR_VERSION, code_id) for code_id, vocabulary, code in rows]
@@ -0,0 +1,28 @@
+"""gunicorn settings for main:app (read automatically from the working directory)
+
+    gunicorn main:app
+
+Workers are separate processes, so the Prometheus metrics shown at /metrics are
+written to files in PROMETHEUS_MULTIPROC_DIR and added up over all workers.
+"""
+import os
+import shutil
+import tempfile
+
+bind = '127.0.0.1:5000'
+workers = 2
+worker_class = 'uvicorn.workers.UvicornWorker'
+timeout = 60
+
+# Must be set before the workers import prometheus_client
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                                    os.path.join(tempfile.gettempdir(), 'termmapper-metrics'))
+
+def on_starting(server):
+    # Files of a previous run would otherwise be added to this run's metrics
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
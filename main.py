@@ -1,24 +1,58 @@
-from fastapi import FastAPI, Request, Form, Depends, HTTPException, UploadFile, File
-from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request, Form, Depends, HTTPException, Query
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse, Response
 from fastapi.templating import Jinja2Templates
-from starlette.middleware.sessions import SessionMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import Headers, MutableHeaders
+from pydantic import BaseModel
+from starlette.requests import HTTPConnection
+from starlette.concurrency import run_in_threadpool
+import asyncio
 import sqlite3
 import secrets
 import csv
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Optional, List
 import json
 import io
+import re
+import codecs
+import tempfile
+import zlib
+import gzip
+import hashlib
+import mimetypes
+import contextvars
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
 import sys
 import yaml
+import numpy as np
+from multipart.multipart import MultipartParser, parse_options_header
+from multipart.exceptions import MultipartParseError
 import ssl
 import traceback
+import threading
+import time
+import heapq
+import unicodedata
+import random
+import multiprocessing
+from array import array
+from collections import OrderedDict
+from itertools import chain
+from types import SimpleNamespace
+from jinja2 import FileSystemBytecodeCache
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from code_validation import VALIDATOR_VERSION, validate_code, validate_codes
 
 # Load configuration from YAML file
 CONFIG_FILE = 'config.yaml'
@@ -45,50 +79,940 @@ config = load_config()
 
 # Extract configuration sections
 DATABASE = config['database']['path']
+DB_THREADS = config['database'].get('threads', 4)
+DB_QUERY_TIMEOUT = config['database'].get('query_timeout', 10)
+DB_ADMIN_TIMEOUT = config['database'].get('admin_query_timeout', 300)
+DB_POOL_SIZE = config['database'].get('pool_size', DB_THREADS + 2)
+DB_STATEMENT_CACHE = config['database'].get('statement_cache_size', 256)
+DB_WRITE_WINDOW_MS = config['database'].get('write_window_ms', 5)
+DB_WRITE_BATCH_SIZE = config['database'].get('write_batch_size', 50)
+SLOW_QUERY_MS = config['database'].get('slow_query_ms', 0)
+SLOW_QUERY_LOG = config['database'].get('slow_query_log', 'slow_queries.jsonl')
+SLOW_QUERY_LOG_MAX_BYTES = config['database'].get('slow_query_log_max_mb', 50) * 1024 * 1024
+DB_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -16000,
+    'mmap_size': 134217728,
+    **config['database'].get('pragmas', {})
+}
 GLOBAL_PASSWORD = config['passwords']['global_password']
 ADMIN_PASSWORD = config['passwords']['admin_password']
 DATA_IMPORT_CONFIG = config['data_import']
+IMPORT_BATCH_SIZE = DATA_IMPORT_CONFIG.get('batch_size', 1000)
+IMPORT_MAX_ISSUES = DATA_IMPORT_CONFIG.get('max_reported_issues', 20)
+MAX_UPLOAD_BYTES = DATA_IMPORT_CONFIG.get('max_upload_mb', 50) * 1024 * 1024
 MAPPING_CONFIG = config.get('mapping', {})
 REQUIRED_RATERS = MAPPING_CONFIG.get('required_raters', 2)
+LEASE_SECONDS = MAPPING_CONFIG.get('lease_minutes', 60) * 60
+ASSIGNMENT_RESYNC_SECONDS = MAPPING_CONFIG.get('assignment_resync_seconds', 10)
+SIMILAR_TERMS_SHOWN = MAPPING_CONFIG.get('similar_terms', 5)
+SIMILAR_TERMS_MIN_SIMILARITY = MAPPING_CONFIG.get('similar_terms_min_similarity', 0.4)
+SIMILAR_TERMS_CANDIDATES = 50
+VALIDATION_PROCESSES = MAPPING_CONFIG.get('validation_processes', 2)
+VALIDATION_BATCH_SIZE = MAPPING_CONFIG.get('validation_batch_size', 2000)
 IMPRINT_CONFIG = config['imprint']
 DATENSCHUTZ_CONFIG = config['datenschutz']
 CONTACT_CONFIG = config['contact']
 EMAIL_CONFIG = config['email']
+EMAIL_TIMEOUT = EMAIL_CONFIG.get('timeout', 30)
+EMAIL_MAX_ATTEMPTS = EMAIL_CONFIG.get('max_attempts', 8)
+EMAIL_RETRY_BASE_SECONDS = EMAIL_CONFIG.get('retry_base_seconds', 30)
+EMAIL_RETRY_MAX_SECONDS = EMAIL_CONFIG.get('retry_max_seconds', 3600)
+EMAIL_POLL_SECONDS = EMAIL_CONFIG.get('poll_seconds', 10)
+EMAIL_IDLE_SECONDS = EMAIL_CONFIG.get('idle_disconnect_seconds', 60)
+EMAIL_CLAIM_SECONDS = EMAIL_TIMEOUT * 4 + 60
+TERMINOLOGY_CONFIG = config.get('terminology', {})
+TERMINOLOGY_DATABASE = TERMINOLOGY_CONFIG.get('path', 'terminology.db')
+TERMINOLOGY_SEARCH_LIMIT = TERMINOLOGY_CONFIG.get('search_limit', 15)
+TERMINOLOGY_MIN_QUERY = TERMINOLOGY_CONFIG.get('min_query_length', 2)
+TERMINOLOGY_CANDIDATES = TERMINOLOGY_CONFIG.get('ranked_candidates', 500)
+TERMINOLOGY_MMAP_MB = TERMINOLOGY_CONFIG.get('mmap_mb', 256)
+SESSION_CONFIG = config.get('session', {})
+SESSION_TTL = int(SESSION_CONFIG.get('ttl_hours', 12) * 3600)
+CACHE_CONFIG = config.get('cache', {})
+PAGE_CACHE_MAX_ENTRIES = CACHE_CONFIG.get('page_variants', 1000)
+TEMPLATE_BYTECODE_DIR = CACHE_CONFIG.get('template_bytecode_dir')
+METRICS_CONFIG = config.get('metrics', {})
+METRICS_ENABLED = METRICS_CONFIG.get('enabled', True)
+METRICS_ALLOWED_IPS = set(METRICS_CONFIG.get('allowed_ips', []))
+METRICS_TRUSTED_PROXIES = set(METRICS_CONFIG.get('trusted_proxies', ['127.0.0.1']))
+
+# Prometheus metrics; with PROMETHEUS_MULTIPROC_DIR set (see gunicorn.conf.py) every worker
+# writes them to files there and /metrics adds up all workers
+REQUESTS = Counter('http_requests_total', 'HTTP requests', ['method', 'route', 'status'])
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Time until the response was sent',
+                             ['method', 'route'],
+                             buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+REQUESTS_IN_PROGRESS = Gauge('http_requests_in_progress', 'HTTP requests being served',
+                             multiprocess_mode='livesum')
+DB_CALL_DURATION = Histogram('db_call_duration_seconds', 'Time spent in a database helper on the DB thread pool',
+                             ['helper'], buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 5, 30))
+DB_TIMEOUTS = Counter('db_timeouts_total', 'Database helper calls aborted by their deadline', ['helper'])
+MAPPINGS_WRITTEN = Counter('mappings_written_total', 'Mappings stored (duplicates excluded)')
+MAPPING_BATCH_SIZE = Histogram('mapping_write_batch_size', 'Mappings per group-commit transaction',
+                               buckets=(1, 2, 5, 10, 20, 50, 100))
+
+class SecurityHeadersMiddleware:
+    """Adds X-Robots-Tag, security headers and a Server-Timing entry to every response
+
+    Pure ASGI: only the http.response.start message is touched, bodies (including
+    streamed exports) pass through unchanged.
+    """
+
+    def __init__(self, app, headers):
+        self.app = app
+        self.headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+        self.names = {name for name, _ in self.headers}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+
+        async def send_with_headers(message):
+            if message['type'] == 'http.response.start':
+                # Time until the response headers are sent, in milliseconds
+                timing = f'app;dur={(time.perf_counter() - started) * 1000:.2f}'.encode('latin-1')
+                headers = [header for header in message.get('headers', []) if header[0].lower() not in self.names]
+                message = {**message, 'headers': headers + self.headers + [(b'server-timing', timing)]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+# The only place these headers are set; the nginx site written by bootstrap-termmapper.sh adds none
+SECURITY_HEADERS = {
+    'X-Robots-Tag': 'noindex, nofollow, noarchive, nosnippet',
+    'X-Content-Type-Options': 'nosniff',
+    'X-Frame-Options': 'DENY',
+    'Referrer-Policy': 'same-origin',
+    'Permissions-Policy': 'geolocation=(), microphone=(), camera=()'
+}
+if SESSION_CONFIG.get('https_only', False):
+    SECURITY_HEADERS['Strict-Transport-Security'] = 'max-age=63072000; includeSubDomains'
+
+def _accepted_encodings(accept_encoding):
+    """Content codings of an Accept-Encoding header, without the ones refused with q=0"""
+    return {part.split(';')[0].strip() for part in accept_encoding.split(',')
+            if not part.replace(' ', '').endswith(';q=0')}
+
+def negotiated_response(request_headers, variants, media_type, headers):
+    """Serve the best of a file's precompressed variants ({encoding: (body, etag)}), or 304 if unchanged"""
+    accepted = _accepted_encodings(request_headers.get('accept-encoding', ''))
+    encoding = next(name for name in ('br', 'gzip', 'identity')
+                    if name in variants and (name == 'identity' or name in accepted))
+    body, etag = variants[encoding]
+    headers = {**headers, 'ETag': etag}
+    if_none_match = request_headers.get('if-none-match', '')
+    if if_none_match.strip() == '*' or etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+        return Response(status_code=304, headers=headers)
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return Response(body, media_type=media_type, headers=headers)
+
+class CompressionMiddleware:
+    """gzip for rendered pages and JSON; streamed and already compressed responses pass through"""
+    compressible = ('text/html', 'application/json')
+
+    def __init__(self, app, minimum_size=1024, level=6):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or 'gzip' not in _accepted_encodings(Headers(scope=scope).get('accept-encoding', '')):
+            await self.app(scope, receive, send)
+            return
 
-# Middleware to add X-Robots-Tag header to all responses
-class RobotsMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        response.headers["X-Robots-Tag"] = "noindex, nofollow, noarchive, nosnippet"
-        return response
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message['type'] == 'http.response.start':
+                # Held back until the body shows whether it is worth compressing
+                start = message
+                return
+            if start is not None:
+                headers = MutableHeaders(raw=start['headers'])
+                body = message.get('body', b'')
+                if (not message.get('more_body') and len(body) >= self.minimum_size
+                        and 'content-encoding' not in headers
+                        and headers.get('content-type', '').split(';')[0] in self.compressible):
+                    body = gzip.compress(body, self.level)
+                    headers['Content-Encoding'] = 'gzip'
+                    headers['Content-Length'] = str(len(body))
+                    headers.add_vary_header('Accept-Encoding')
+                    message = {**message, 'body': body}
+                await send(start)
+                start = None
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+# The request being served, for naming the route of slow queries run on its behalf
+_request_scope = contextvars.ContextVar('request_scope', default=None)
+_route_paths = {}  # endpoint -> route path
+
+def route_path(scope):
+    """Route template ("/session", "/static") that handled a request, not its URL"""
+    endpoint = scope.get('endpoint')
+    if endpoint is None:
+        return 'unmatched'
+    if endpoint not in _route_paths:
+        for route in scope['app'].routes:
+            _route_paths[getattr(route, 'endpoint', None) or route.app] = route.path
+    return _route_paths.get(endpoint, 'unmatched')
+
+class MetricsMiddleware:
+    """Counts requests and records their duration per route template (not per URL)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        _request_scope.set(scope)
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            route = route_path(scope)
+            REQUEST_DURATION.labels(scope['method'], route).observe(time.perf_counter() - started)
+            REQUESTS.labels(scope['method'], route, status).inc()
+
+class StaticAssets:
+    """Serves static/ from memory: fingerprinted, precompressed and cached for good
+
+    build() reads every file once at startup. static_url('css/style.css') gives
+    /static/css/style.<hash>.css, which is cached by browsers as immutable since any
+    change to the file changes its name. The plain name keeps working and is revalidated
+    through its ETag.
+    """
+    compressible = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._urls = {}   # path -> fingerprinted URL
+        self._files = {}  # served path -> (variants, media_type, immutable)
+
+    def build(self):
+        urls, files = {}, {}
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, self.directory).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    body = f.read()
+                digest = hashlib.sha256(body).hexdigest()
+                media_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                variants = {'identity': (body, f'"{digest[:32]}"')}
+                if media_type.startswith(self.compressible):
+                    compressed = gzip.compress(body, compresslevel=9, mtime=0)
+                    if len(compressed) < len(body):
+                        variants['gzip'] = (compressed, f'"{digest[:32]}-gzip"')
+                    if brotli is not None:
+                        compressed = brotli.compress(body)
+                        if len(compressed) < len(body):
+                            variants['br'] = (compressed, f'"{digest[:32]}-br"')
+                stem, ext = os.path.splitext(path)
+                fingerprinted = f'{stem}.{digest[:12]}{ext}'
+                files[path] = (variants, media_type, False)
+                files[fingerprinted] = (variants, media_type, True)
+                urls[path] = f'/static/{fingerprinted}'
+        self._urls, self._files = urls, files
+
+    def url(self, path):
+        """URL of a static file, fingerprinted once build() has run"""
+        return self._urls.get(path, f'/static/{path}')
+
+    async def __call__(self, scope, receive, send):
+        entry = self._files.get(scope['path'].lstrip('/'))
+        if scope['method'] not in ('GET', 'HEAD'):
+            response = Response(status_code=405, headers={'Allow': 'GET, HEAD'})
+        elif entry is None:
+            response = Response('Not Found', status_code=404, media_type='text/plain')
+        else:
+            variants, media_type, immutable = entry
+            response = negotiated_response(Headers(scope=scope), variants, media_type, {
+                'Cache-Control': 'public, max-age=31536000, immutable' if immutable else 'no-cache',
+                'Vary': 'Accept-Encoding'
+            })
+        await response(scope, receive, send)
 
 app = FastAPI()
-app.add_middleware(RobotsMiddleware)
-app.add_middleware(SessionMiddleware, secret_key=secrets.token_hex(32))
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.add_middleware(CompressionMiddleware)
+static_assets = StaticAssets("static")
+app.mount("/static", static_assets, name="static")
 templates = Jinja2Templates(directory="templates")
+templates.env.globals['static_url'] = static_assets.url
+# Compiled templates are shared on disk, so new workers skip compiling them
+if TEMPLATE_BYTECODE_DIR:
+    os.makedirs(TEMPLATE_BYTECODE_DIR, exist_ok=True)
+templates.env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_BYTECODE_DIR)
+
+# Blocking sqlite3 work runs on this bounded pool so the event loop keeps serving requests
+db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix='db')
+_db_local = threading.local()
+
+class DatabaseTimeout(Exception):
+    """Raised when a database call exceeds its time budget"""
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool"""
+    pool = None
+    checked_out = False
+    borrowed_by = None  # run_db() list tracking this checkout, see get_db()
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+def sql_fingerprint(sql):
+    """Statement with comments, literals and parameter lists normalized, and a short hash of it"""
+    normalized = re.sub(r'--[^\n]*|/\*.*?\*/', ' ', sql, flags=re.S)
+    normalized = re.sub(r"'(?:[^']|'')*'", '?', normalized)
+    normalized = re.sub(r'\b\d+(?:\.\d+)?\b', '?', normalized)
+    normalized = re.sub(r'\?\d*', '?', normalized)
+    normalized = re.sub(r'\(\s*\?(?:\s*,\s*\?)+\s*\)', '(?, ...)', normalized)
+    normalized = ' '.join(normalized.split())
+    return normalized, hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12]
+
+class SlowQueryLog:
+    """JSON lines log of slow SQL statements, appended to by all workers
+
+    Only normalized statements are written, never bound values. The first time a
+    worker logs a fingerprint, the entry also carries its EXPLAIN QUERY PLAN.
+    """
+
+    def __init__(self, path, threshold_ms, max_bytes):
+        self.path = path
+        self.threshold = threshold_ms / 1000
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._explained = set()
+
+    def _explain(self, conn, sql, parameters):
+        try:
+            # A plain cursor, so the EXPLAIN is neither timed nor traced as a statement of its own
+            rows = sqlite3.Cursor(conn).execute('EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+        except (sqlite3.Error, ValueError) as e:
+            return [f'EXPLAIN QUERY PLAN failed: {e}']
+        depth = {}
+        plan = []
+        for node, parent, _, detail in rows:
+            depth[node] = depth.get(parent, -1) + 1
+            plan.append('  ' * depth[node] + detail)
+        return plan
+
+    def record(self, conn, sql, parameters, elapsed, traced):
+        normalized, fingerprint = sql_fingerprint(sql)
+        entry = {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'ms': round(elapsed * 1000, 2),
+            'fingerprint': fingerprint,
+            'sql': normalized,
+            'helper': getattr(_db_local, 'helper', None),
+            'route': getattr(_db_local, 'route', None),
+            # Statement programs SQLite started for this call: one, plus one per trigger fired
+            'statements': len(traced)
+        }
+        with self._lock:
+            first = fingerprint not in self._explained
+            self._explained.add(fingerprint)
+        if first:
+            entry['plan'] = self._explain(conn, sql, parameters)
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                full = f.tell() > self.max_bytes
+            if full:
+                os.replace(self.path, self.path + '.1')
+
+    def top(self, limit=10):
+        """Fingerprints with the most total time in the log, slowest first"""
+        offenders = {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # partly written line
+                    offender = offenders.setdefault(entry['fingerprint'], {
+                        'fingerprint': entry['fingerprint'], 'sql': entry['sql'], 'count': 0,
+                        'total_ms': 0.0, 'max_ms': 0.0, 'helpers': set(), 'routes': set(), 'plan': None
+                    })
+                    offender['count'] += 1
+                    offender['total_ms'] += entry['ms']
+                    offender['max_ms'] = max(offender['max_ms'], entry['ms'])
+                    offender['last_seen'] = entry['time']
+                    if entry.get('helper'):
+                        offender['helpers'].add(entry['helper'])
+                    if entry.get('route'):
+                        offender['routes'].add(entry['route'])
+                    if entry.get('plan'):
+                        offender['plan'] = entry['plan']
+        except FileNotFoundError:
+            return []
+        ranked = sorted(offenders.values(), key=lambda offender: offender['total_ms'], reverse=True)[:limit]
+        for offender in ranked:
+            offender['mean_ms'] = offender['total_ms'] / offender['count']
+            offender['helpers'] = sorted(offender['helpers'])
+            offender['routes'] = sorted(offender['routes'])
+        return ranked
+
+slow_query_log = SlowQueryLog(SLOW_QUERY_LOG, SLOW_QUERY_MS, SLOW_QUERY_LOG_MAX_BYTES)
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that times each statement, from execute() through its fetches, for the slow-query log"""
+    _sql = None
+    _parameters = ()
+    _elapsed = 0.0
+    _logged = False
+
+    def _check(self):
+        if self._sql is not None and not self._logged and self._elapsed >= slow_query_log.threshold:
+            self._logged = True
+            slow_query_log.record(self.connection, self._sql, self._parameters, self._elapsed,
+                                  self.connection.traced)
+
+    def _timed(self, method, sql, parameters, explain_parameters):
+        self.connection.traced = []
+        started = time.perf_counter()
+        try:
+            return method(sql, parameters)
+        finally:
+            self._sql, self._parameters, self._logged = sql, explain_parameters, False
+            self._elapsed = time.perf_counter() - started
+            self._check()
+
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, sql, parameters, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        # The first parameter set is kept for EXPLAIN without consuming a generator
+        rows = iter(seq_of_parameters)
+        first = next(rows, None)
+        if first is None:
+            return self._timed(super().executemany, sql, [], ())
+        return self._timed(super().executemany, sql, chain([first], rows), first)
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._elapsed += time.perf_counter() - started
+            self._check()
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+class TracedConnection(PooledConnection):
+    """Pooled connection whose statements run through TracedCursor (database.slow_query_ms > 0)"""
+    traced = None
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute() would bypass cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def trace_statement(self, statement):
+        if self.traced is not None:
+            self.traced.append(None)
+
+class ConnectionPool:
+    """Per-worker pool of long-lived, pragma-tuned SQLite connections"""
+
+    def __init__(self, path, size, pragmas, cached_statements, factory=PooledConnection):
+        self.path = path
+        self.size = size
+        self.pragmas = pragmas
+        self.cached_statements = cached_statements
+        self.factory = factory
+        self._idle = []
+        self._lock = threading.Condition()
+        self._open = 0
+        self._stats = {'created': 0, 'acquired': 0, 'reused': 0, 'waits': 0}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, factory=self.factory, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        if isinstance(conn, TracedConnection):
+            conn.set_trace_callback(conn.trace_statement)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        conn.pool = self
+        return conn
+
+    def acquire(self, timeout=None):
+        with self._lock:
+            while not self._idle and self._open >= self.size:
+                self._stats['waits'] += 1
+                if not self._lock.wait(timeout):
+                    raise DatabaseTimeout("No database connection available")
+            self._stats['acquired'] += 1
+            if self._idle:
+                self._stats['reused'] += 1
+                conn = self._idle.pop()
+                conn.checked_out = True
+                return conn
+            self._open += 1
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._lock:
+                self._open -= 1
+                self._lock.notify()
+            raise
+        with self._lock:
+            self._stats['created'] += 1
+        conn.checked_out = True
+        return conn
+
+    def release(self, conn):
+        if not conn.checked_out:
+            return
+        # Handed back by the helper itself: run_db() must not release it again once
+        # another thread may have checked it out
+        if conn.borrowed_by is not None:
+            conn.borrowed_by.remove(conn)
+            conn.borrowed_by = None
+        conn.checked_out = False
+        conn.set_progress_handler(None, 0)
+        try:
+            # Never hand out a connection with a half-finished transaction
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.pool = None
+            conn.close()
+            with self._lock:
+                self._open -= 1
+                self._lock.notify()
+            return
+        with self._lock:
+            self._idle.append(conn)
+            self._lock.notify()
+
+    def close_all(self):
+        with self._lock:
+            for conn in self._idle:
+                conn.pool = None
+                conn.close()
+            self._open -= len(self._idle)
+            self._idle = []
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                'size': self.size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle)
+            }
+
+db_pool = ConnectionPool(DATABASE, DB_POOL_SIZE, DB_PRAGMAS, DB_STATEMENT_CACHE,
+                         factory=TracedConnection if SLOW_QUERY_MS else PooledConnection)
 
 def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
+    """Get a pooled database connection, close() returns it to the pool"""
+    conn = db_pool.acquire(timeout=DB_QUERY_TIMEOUT)
+    # Remember the connection so run_db() can return it even if the helper raised
+    borrowed = getattr(_db_local, 'borrowed', None)
+    if borrowed is not None:
+        borrowed.append(conn)
+        conn.borrowed_by = borrowed
+    _apply_deadline(conn)
     return conn
 
-def send_contact_email(name: str, email: str, subject: str, message: str):
-    """Send contact form email"""
-    if not CONTACT_CONFIG.get('send_email', False):
-        return False
-    
+def _apply_deadline(conn):
+    """Abort long-running statements once the deadline of the current run_db() call has passed"""
+    deadline = getattr(_db_local, 'deadline', None)
+    if deadline is not None:
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+    else:
+        conn.set_progress_handler(None, 0)
+
+def _call_with_deadline(timeout, func, args, kwargs, route=None):
+    """Run func in a DB worker thread with a per-call deadline"""
+    _db_local.deadline = time.monotonic() + timeout if timeout else None
+    _db_local.borrowed = []
+    helper = getattr(func, '__qualname__', func.__name__)
+    _db_local.helper, _db_local.route = helper, route
+    started = time.perf_counter()
     try:
-        # Create message
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f"[Kontaktformular] {subject}"
-        msg['From'] = f"{EMAIL_CONFIG['from_name']} <{EMAIL_CONFIG['from_email']}>"
-        msg['To'] = CONTACT_CONFIG['email']
-        msg['Reply-To'] = email
-        
-        # Create email body
-        text_body = f"""
+        return func(*args, **kwargs)
+    except sqlite3.OperationalError as e:
+        if _db_local.deadline is not None and time.monotonic() > _db_local.deadline:
+            DB_TIMEOUTS.labels(helper).inc()
+            raise DatabaseTimeout(f"{func.__name__} exceeded {timeout}s") from e
+        raise
+    finally:
+        DB_CALL_DURATION.labels(helper).observe(time.perf_counter() - started)
+        _db_local.deadline = None
+        _db_local.helper = _db_local.route = None
+        # Only connections the helper did not close itself are still listed
+        for conn in list(_db_local.borrowed):
+            db_pool.release(conn)
+        _db_local.borrowed = None
+
+def current_route():
+    """Route of the current request (its path while not yet routed), named in the slow-query log"""
+    scope = _request_scope.get() if SLOW_QUERY_MS else None
+    if scope is None:
+        return None
+    return route_path(scope) if scope.get('endpoint') else scope['path']
+
+async def run_db(func, *args, timeout=DB_QUERY_TIMEOUT, route=None, **kwargs):
+    """Run a blocking database helper on the DB thread pool with a per-query timeout
+
+    route overrides the current request's route for work done on behalf of other tasks.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(db_executor, _call_with_deadline, timeout, func, args, kwargs,
+                                  route or current_route())
+    try:
+        # The progress handler interrupts the statement itself; wait_for is the backstop
+        return await asyncio.wait_for(future, timeout + 5 if timeout else None)
+    except (DatabaseTimeout, asyncio.TimeoutError):
+        print(f"Database timeout in {func.__name__}", file=sys.stderr)
+        raise HTTPException(status_code=503, detail="Database is busy, please try again")
+
+class SQLiteSessionBackend:
+    """Server-side session storage in the web_sessions table (shared by all workers)"""
+    blocking = True
+
+    def load(self, session_id):
+        conn = get_db()
+        row = conn.execute('SELECT data, expires_at FROM web_sessions WHERE id = ? AND expires_at > ?',
+                           (session_id, time.time())).fetchone()
+        conn.close()
+        return (json.loads(row[0]), row[1]) if row else (None, None)
+
+    def save(self, session_id, data, expires_at):
+        conn = get_db()
+        conn.execute('INSERT OR REPLACE INTO web_sessions (id, data, expires_at) VALUES (?, ?, ?)',
+                     (session_id, json.dumps(data), expires_at))
+        conn.commit()
+        conn.close()
+
+    def delete(self, session_id):
+        conn = get_db()
+        conn.execute('DELETE FROM web_sessions WHERE id = ?', (session_id,))
+        conn.commit()
+        conn.close()
+
+    def purge_expired(self):
+        conn = get_db()
+        removed = conn.execute('DELETE FROM web_sessions WHERE expires_at <= ?', (time.time(),)).rowcount
+        conn.commit()
+        conn.close()
+        return removed
+
+    def count_active(self):
+        conn = get_db()
+        count = conn.execute('SELECT COUNT(*) FROM web_sessions WHERE expires_at > ?', (time.time(),)).fetchone()[0]
+        conn.close()
+        return count
+
+class MemorySessionBackend:
+    """Per-worker LRU session storage with TTL (single worker or sticky sessions only)"""
+    blocking = False
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def load(self, session_id):
+        entry = self._entries.get(session_id)
+        if entry is None or entry[1] <= time.time():
+            self._entries.pop(session_id, None)
+            return None, None
+        self._entries.move_to_end(session_id)
+        return json.loads(entry[0]), entry[1]
+
+    def save(self, session_id, data, expires_at):
+        self._entries[session_id] = (json.dumps(data), expires_at)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, session_id):
+        self._entries.pop(session_id, None)
+
+    def purge_expired(self):
+        now = time.time()
+        expired = [key for key, entry in self._entries.items() if entry[1] <= now]
+        for key in expired:
+            del self._entries[key]
+        return len(expired)
+
+    def count_active(self):
+        now = time.time()
+        return sum(1 for entry in self._entries.values() if entry[1] > now)
+
+class ServerSessionMiddleware:
+    """Keeps request.session on the server; the cookie only carries an opaque session id"""
+
+    def __init__(self, app, backend, ttl, cookie_name='session', same_site='lax', https_only=False):
+        self.app = app
+        self.backend = backend
+        self.ttl = ttl
+        self.cookie_name = cookie_name
+        self.security_flags = 'httponly; samesite=' + same_site + ('; secure' if https_only else '')
+
+    async def _call_backend(self, method, *args):
+        if self.backend.blocking:
+            return await run_db(method, *args)
+        return method(*args)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] not in ('http', 'websocket'):
+            await self.app(scope, receive, send)
+            return
+
+        session_id = HTTPConnection(scope).cookies.get(self.cookie_name)
+        data, expires_at = (None, None)
+        if session_id:
+            data, expires_at = await self._call_backend(self.backend.load, session_id)
+        if data is None:
+            session_id = None
+        scope['session'] = data or {}
+        snapshot = json.dumps(scope['session'], sort_keys=True)
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                await self._persist(scope, message, session_id, snapshot, expires_at)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def rotate(request):
+        """Move the session to a new id when the response is sent (call on login, against session fixation)"""
+        request.scope['session_rotate'] = True
+
+    async def _persist(self, scope, message, session_id, snapshot, expires_at):
+        session = scope['session']
+        headers = MutableHeaders(scope=message)
+        now = time.time()
+        rotate = scope.get('session_rotate', False)
+        if session:
+            changed = rotate or json.dumps(session, sort_keys=True) != snapshot
+            # Unchanged sessions are only re-saved once a tenth of their lifetime has passed
+            stale = expires_at is None or expires_at - now < self.ttl * 0.9
+            if rotate and session_id is not None:
+                await self._call_backend(self.backend.delete, session_id)
+                session_id = None
+            if session_id is None:
+                session_id = secrets.token_urlsafe(32)
+            if changed or stale:
+                await self._call_backend(self.backend.save, session_id, session, now + self.ttl)
+                headers.append('Set-Cookie', f'{self.cookie_name}={session_id}; path=/; '
+                                             f'Max-Age={self.ttl}; {self.security_flags}')
+        elif session_id is not None:
+            # The session has been cleared
+            await self._call_backend(self.backend.delete, session_id)
+            headers.append('Set-Cookie', f'{self.cookie_name}=null; path=/; '
+                                         f'expires=Thu, 01 Jan 1970 00:00:00 GMT; {self.security_flags}')
+
+if SESSION_CONFIG.get('backend', 'sqlite') == 'memory':
+    session_backend = MemorySessionBackend(SESSION_CONFIG.get('max_entries', 10000))
+else:
+    session_backend = SQLiteSessionBackend()
+
+app.add_middleware(ServerSessionMiddleware, backend=session_backend, ttl=SESSION_TTL,
+                   https_only=SESSION_CONFIG.get('https_only', False))
+app.add_middleware(MetricsMiddleware)
+# Outermost, so Server-Timing includes loading and saving the session
+app.add_middleware(SecurityHeadersMiddleware, headers=SECURITY_HEADERS)
+
+async def purge_sessions_periodically():
+    """Evict abandoned server-side sessions"""
+    while True:
+        await asyncio.sleep(SESSION_CONFIG.get('purge_interval_seconds', 600))
+        try:
+            if session_backend.blocking:
+                await run_db(session_backend.purge_expired)
+            else:
+                session_backend.purge_expired()
+        except Exception as e:
+            print(f"Error purging sessions: {e}", file=sys.stderr)
+
+class AggregateCache:
+    """In-memory cache for dashboard aggregates with single-flight recomputation.
+
+    Global entries carry the SQLite data_version they were computed at, which changes
+    whenever any connection of any worker commits. Per-user entries are dropped when the
+    user writes through this worker and otherwise expire after a short TTL. Concurrent
+    misses for the same key wait for one shared recomputation.
+    """
+
+    def __init__(self, user_ttl):
+        self.user_ttl = user_ttl
+        self._entries = {}     # key -> (value, version, stored_at)
+        self._inflight = {}    # key -> future of the running recomputation
+        self._generation = {}  # key -> bumped on invalidation
+        self._user_generation = {}  # user_id -> bumped by invalidate_user, covers keys not stored yet
+        self._watch = None
+        self._watch_lock = threading.Lock()
+
+    def data_version(self):
+        """Current PRAGMA data_version as seen by a dedicated watch connection (blocking)"""
+        with self._watch_lock:
+            if self._watch is None:
+                self._watch = sqlite3.connect(DATABASE, check_same_thread=False)
+            return self._watch.execute('PRAGMA data_version').fetchone()[0]
+
+    async def get(self, key, loader, *args, version=None, ttl=None):
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry and entry[1] == version and (ttl is None or now - entry[2] < ttl):
+            return entry[0]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generations(key)
+        try:
+            value = await run_db(loader, *args)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # waiters re-raise it; avoid "never retrieved" warnings
+            raise
+        finally:
+            del self._inflight[key]
+        # Don't store a result that was invalidated while it was being computed
+        if self._generations(key) == generation:
+            self._entries[key] = (value, version, now)
+        future.set_result(value)
+        return value
+
+    def _generations(self, key):
+        user_generation = self._user_generation.get(key[1], 0) if isinstance(key, tuple) else 0
+        return self._generation.get(key, 0), user_generation
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+        self._generation[key] = self._generation.get(key, 0) + 1
+
+    def invalidate_user(self, user_id):
+        self._user_generation[user_id] = self._user_generation.get(user_id, 0) + 1
+        for key in [key for key in self._entries if isinstance(key, tuple) and key[1] == user_id]:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        for key in set(self._entries) | set(self._inflight):
+            self.invalidate(key)
+
+aggregate_cache = AggregateCache(CACHE_CONFIG.get('user_ttl_seconds', 30))
+
+class PageCache:
+    """Pages whose content only depends on the configuration, rendered once and served from memory
+
+    The shared layout shows the logged-in username, so each page is kept per username
+    (None for visitors), the anonymous variants are rendered at startup. Every variant
+    has a strong ETag and precompressed copies.
+    """
+    # Per-user variants are rendered on the event loop; quality 11 takes tens of ms per page
+    brotli_quality = 5
+
+    def __init__(self, pages, max_entries):
+        self.pages = pages          # name -> (template, context)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def _render(self, name, username):
+        template, context = self.pages[name]
+        session = {'username': username} if username else {}
+        body = templates.get_template(template).render({
+            **context,
+            'request': SimpleNamespace(session=session),
+            'user': {'username': username} if username else None
+        }).encode('utf-8')
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        variants = {
+            'identity': (body, f'"{etag}"'),
+            'gzip': (gzip.compress(body, compresslevel=9, mtime=0), f'"{etag}-gzip"')
+        }
+        if brotli is not None:
+            variants['br'] = (brotli.compress(body, quality=self.brotli_quality), f'"{etag}-br"')
+        return variants
+
+    def prerender(self):
+        self._entries.clear()
+        for name in self.pages:
+            self._entries[(name, None)] = self._render(name, None)
+
+    def response(self, request, name):
+        user = get_current_user(request)
+        key = (name, user['username'] if user else None)
+        variants = self._entries.get(key)
+        if variants is None:
+            variants = self._entries[key] = self._render(*key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+
+        # Same URL, different page when logged in, so browsers only and always revalidated
+        return negotiated_response(request.headers, variants, 'text/html', {
+            'Cache-Control': 'private, no-cache',
+            'Vary': 'Accept-Encoding, Cookie'
+        })
+
+page_cache = PageCache({
+    'login': ('login.html', {'required_raters': REQUIRED_RATERS}),
+    'imprint': ('imprint.html', {'imprint': IMPRINT_CONFIG}),
+    'datenschutz': ('datenschutz.html', {'datenschutz': DATENSCHUTZ_CONFIG}),
+    'manual': ('manual.html', {})
+}, PAGE_CACHE_MAX_ENTRIES)
+
+def build_contact_email(name: str, email: str, subject: str, message: str):
+    """Compose the notification email for a contact form submission"""
+    # Create message
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = f"[Kontaktformular] {subject}"
+    msg['From'] = f"{EMAIL_CONFIG['from_name']} <{EMAIL_CONFIG['from_email']}>"
+    msg['To'] = CONTACT_CONFIG['email']
+    msg['Reply-To'] = email
+    
+    # Create email body
+    text_body = f"""
 Neue Nachricht über das Kontaktformular
 
 Von: {name}
@@ -101,8 +1025,8 @@ Nachricht:
 ---
 Diese E-Mail wurde über das Kontaktformular auf {DATENSCHUTZ_CONFIG.get('website', 'terminology-mapper.de')} gesendet.
 """
-        
-        html_body = f"""
+    
+    html_body = f"""
 <html>
 <head>
     <style>
@@ -143,62 +1067,174 @@ Diese E-Mail wurde über das Kontaktformular auf {DATENSCHUTZ_CONFIG.get('websit
 </body>
 </html>
 """
-        
-        # Attach both plain text and HTML versions
-        part1 = MIMEText(text_body, 'plain')
-        part2 = MIMEText(html_body, 'html')
-        msg.attach(part1)
-        msg.attach(part2)
-        
-        # Send email using TLS or SSL
-        use_tls = EMAIL_CONFIG.get('use_tls', True)
-        use_ssl = EMAIL_CONFIG.get('use_ssl', False)
-        smtp_server = EMAIL_CONFIG['smtp_server']
-        smtp_port = EMAIL_CONFIG['smtp_port']
-        username = EMAIL_CONFIG['username']
-        password = EMAIL_CONFIG['password']
-        
-        # Create SSL context
+    
+    # Attach both plain text and HTML versions
+    part1 = MIMEText(text_body, 'plain')
+    part2 = MIMEText(html_body, 'html')
+    msg.attach(part1)
+    msg.attach(part2)
+    
+    return msg
+
+class SMTPDelivery:
+    """One SMTP connection reused across outbox messages, reopened when the server drops it"""
+
+    def __init__(self, config):
+        self.config = config
+        self.server = None
+        self.last_used = 0
+
+    def _connect(self):
+        smtp_server = self.config['smtp_server']
+        smtp_port = self.config['smtp_port']
+        username = self.config.get('username')
         context = ssl.create_default_context()
-        
-        # Determine envelope sender (can be different from From header)
-        envelope_from = EMAIL_CONFIG.get('envelope_from', EMAIL_CONFIG['from_email'])
-        recipients = [CONTACT_CONFIG['email']]
-        
-        if use_ssl or smtp_port == 465:
+
+        if self.config.get('use_ssl', False) or smtp_port == 465:
             # Use SSL (port 465 typically)
-            with smtplib.SMTP_SSL(smtp_server, smtp_port, context=context, timeout=30) as server:
-                server.login(username, password)
-                refused = server.sendmail(envelope_from, recipients, msg.as_string())
-                if refused:
-                    print(f"Refused recipients: {refused}", file=sys.stderr)
+            server = smtplib.SMTP_SSL(smtp_server, smtp_port, context=context, timeout=EMAIL_TIMEOUT)
         else:
             # Use STARTTLS (port 587 typically) or plain SMTP
-            with smtplib.SMTP(smtp_server, smtp_port, timeout=30) as server:
+            server = smtplib.SMTP(smtp_server, smtp_port, timeout=EMAIL_TIMEOUT)
+            server.ehlo()
+            if self.config.get('use_tls', True):
+                server.starttls(context=context)
                 server.ehlo()
-                if use_tls:
-                    server.starttls(context=context)
-                    server.ehlo()
-                server.login(username, password)
-                refused = server.sendmail(envelope_from, recipients, msg.as_string())
-                if refused:
-                    print(f"Refused recipients: {refused}", file=sys.stderr)
-        
-        return True
-    except smtplib.SMTPResponseException as e:
-        print(f"SMTP error {e.smtp_code}: {e.smtp_error!r}", file=sys.stderr)
-        traceback.print_exc()
-        return False
-    except Exception as e:
-        print(f"Error sending email: {e}", file=sys.stderr)
-        traceback.print_exc()
-        return False
+        # Local relays and test servers usually need no login
+        if username:
+            server.login(username, self.config['password'])
+        return server
+
+    def send(self, envelope_from, recipients, message):
+        """Send one message, returns the refused recipients"""
+        for attempt in (1, 2):
+            if self.server is None:
+                self.server = self._connect()
+            try:
+                refused = self.server.sendmail(envelope_from, recipients, message)
+                self.last_used = time.monotonic()
+                return refused
+            except smtplib.SMTPServerDisconnected:
+                # The server closed the idle connection; retry once on a fresh one
+                self.server = None
+                if attempt == 2:
+                    raise
+            except smtplib.SMTPResponseException:
+                # The connection itself is still usable after a rejected message
+                raise
+            except Exception:
+                self.close()
+                raise
+
+    def close_if_idle(self, idle_seconds):
+        if self.server is not None and time.monotonic() - self.last_used > idle_seconds:
+            self.close()
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+def queue_email(c, msg, recipients, contact_message_id=None):
+    """Add an email to the outbox on the caller's transaction"""
+    envelope_from = EMAIL_CONFIG.get('envelope_from', EMAIL_CONFIG['from_email'])
+    c.execute('''INSERT INTO email_outbox (contact_message_id, envelope_from, recipients, message, next_attempt_at)
+                 VALUES (?, ?, ?, ?, ?)''',
+              (contact_message_id, envelope_from, json.dumps(recipients), msg.as_string(), time.time()))
+
+def claim_outbox_emails(limit):
+    """Mark due outbox emails as being sent by this worker and return them"""
+    conn = get_db()
+    now = time.time()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        # 'sending' rows whose claim ran out belong to a worker that died mid-delivery
+        rows = conn.execute('''SELECT id, envelope_from, recipients, message, attempts FROM email_outbox
+                               WHERE status IN ('pending', 'sending') AND next_attempt_at <= ?
+                               ORDER BY next_attempt_at LIMIT ?''', (now, limit)).fetchall()
+        conn.executemany("UPDATE email_outbox SET status = 'sending', next_attempt_at = ? WHERE id = ?",
+                         [(now + EMAIL_CLAIM_SECONDS, row['id']) for row in rows])
+        conn.commit()
+    finally:
+        conn.close()
+    return [dict(row) for row in rows]
 
-def init_db():
-    """Initialize database with schema"""
+def record_email_result(outbox_id, attempts, error=None, permanent=False):
+    """Store the outcome of a delivery attempt, scheduling a retry with backoff if needed"""
     conn = get_db()
-    c = conn.cursor()
+    if error is None:
+        conn.execute('''UPDATE email_outbox SET status = 'sent', attempts = ?, sent_at = CURRENT_TIMESTAMP, last_error = NULL
+                        WHERE id = ?''', (attempts, outbox_id))
+    elif permanent or attempts >= EMAIL_MAX_ATTEMPTS:
+        conn.execute("UPDATE email_outbox SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                     (attempts, error, outbox_id))
+    else:
+        delay = min(EMAIL_RETRY_MAX_SECONDS, EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+        conn.execute("UPDATE email_outbox SET status = 'pending', attempts = ?, last_error = ?, next_attempt_at = ? WHERE id = ?",
+                     (attempts, error, time.time() + delay, outbox_id))
+    conn.commit()
+    conn.close()
+
+def deliver_outbox(delivery, batch_size=10):
+    """Send the due outbox emails over one SMTP connection, returns how many were attempted"""
+    emails = claim_outbox_emails(batch_size)
+    for email in emails:
+        attempts = email['attempts'] + 1
+        try:
+            refused = delivery.send(email['envelope_from'], json.loads(email['recipients']), email['message'])
+            if refused:
+                print(f"Refused recipients: {refused}", file=sys.stderr)
+            record_email_result(email['id'], attempts)
+        except smtplib.SMTPResponseException as e:
+            # 5xx replies will not change on retry
+            print(f"SMTP error {e.smtp_code}: {e.smtp_error!r}", file=sys.stderr)
+            record_email_result(email['id'], attempts, f"SMTP {e.smtp_code}: {e.smtp_error!r}",
+                                permanent=500 <= e.smtp_code < 600)
+        except smtplib.SMTPRecipientsRefused as e:
+            print(f"Refused recipients: {e.recipients}", file=sys.stderr)
+            record_email_result(email['id'], attempts, f"Recipients refused: {e.recipients}", permanent=True)
+        except Exception as e:
+            print(f"Error sending email: {e}", file=sys.stderr)
+            record_email_result(email['id'], attempts, str(e) or type(e).__name__)
+    return len(emails)
+
+# SMTP calls block for up to EMAIL_TIMEOUT, so they get their own thread instead of the DB pool
+email_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='smtp')
+outbox_wakeup = asyncio.Event()
+
+async def deliver_outbox_periodically():
+    """Background delivery of queued emails; woken early when a new email is queued"""
+    loop = asyncio.get_running_loop()
+    delivery = SMTPDelivery(EMAIL_CONFIG)
+    try:
+        while True:
+            try:
+                if await loop.run_in_executor(email_executor, deliver_outbox, delivery):
+                    continue
+                await loop.run_in_executor(email_executor, delivery.close_if_idle, EMAIL_IDLE_SECONDS)
+            except Exception as e:
+                print(f"Error delivering emails: {e}", file=sys.stderr)
+            try:
+                await asyncio.wait_for(outbox_wakeup.wait(), EMAIL_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            outbox_wakeup.clear()
+    finally:
+        email_executor.submit(delivery.close)
+
+# Schema migrations
+#
+# Each migration is applied in its own transaction and PRAGMA user_version records the
+# last one applied. Migrations must be idempotent: databases created before versioning
+# (user_version 0) may already contain some of their tables, columns and triggers.
 
+def _column_exists(c, table, column):
+    return any(row[1] == column for row in c.execute(f'PRAGMA table_info({table})'))
+
+def _migration_base_schema(c):
     # Users table
     c.execute('''CREATE TABLE IF NOT EXISTS users (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -231,14 +1267,12 @@ def init_db():
         FOREIGN KEY (user_id) REFERENCES users(id),
         UNIQUE(term_id, user_id)
     )''')
-    
-    # Migrate existing data: add display_texts and propose_new columns if they don't exist
-    try:
-        c.execute('SELECT display_texts FROM mappings LIMIT 1')
-    except sqlite3.OperationalError:
+
+    # Older databases lack the display_texts and propose_new columns
+    if not _column_exists(c, 'mappings', 'display_texts'):
         c.execute('ALTER TABLE mappings ADD COLUMN display_texts TEXT')
+    if not _column_exists(c, 'mappings', 'propose_new'):
         c.execute('ALTER TABLE mappings ADD COLUMN propose_new BOOLEAN DEFAULT 0')
-        conn.commit()
 
     # Sessions table
     c.execute('''CREATE TABLE IF NOT EXISTS sessions (
@@ -261,66 +1295,543 @@ def init_db():
         read BOOLEAN DEFAULT 0
     )''')
 
-    conn.commit()
+def _migration_term_rater_count(c):
+    # Per-term count of unique raters, maintained by triggers in the same transaction as
+    # every mapping insert/delete so term selection and progress never re-aggregate mappings
+    if not _column_exists(c, 'terms', 'rater_count'):
+        c.execute('ALTER TABLE terms ADD COLUMN rater_count INTEGER NOT NULL DEFAULT 0')
+        rebuild_rater_counts(c.connection)
+    c.execute('CREATE INDEX IF NOT EXISTS idx_terms_rater_count ON terms(rater_count, id)')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_mappings_rater_count_insert
+        AFTER INSERT ON mappings
+        BEGIN
+            UPDATE terms SET rater_count = rater_count + 1 WHERE id = NEW.term_id;
+        END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_mappings_rater_count_delete
+        AFTER DELETE ON mappings
+        BEGIN
+            UPDATE terms SET rater_count = rater_count - 1 WHERE id = OLD.term_id;
+        END''')
+
+def _migration_term_leases(c):
+    # Terms handed out to open sessions count toward coverage until rated or expired
+    c.execute('''CREATE TABLE IF NOT EXISTS term_leases (
+        term_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        session_id INTEGER NOT NULL,
+        expires_at REAL NOT NULL,
+        PRIMARY KEY (term_id, user_id)
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_term_leases_user ON term_leases(user_id)')
+
+def _migration_web_sessions(c):
+    # Server-side web sessions, the cookie only holds the opaque id
+    c.execute('''CREATE TABLE IF NOT EXISTS web_sessions (
+        id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_web_sessions_expires ON web_sessions(expires_at)')
+
+def _migration_user_points(c):
+    # users.total_points counts the user's mappings, maintained like terms.rater_count
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_mappings_points_insert'")
+    if c.fetchone() is None:
+        c.execute('''CREATE TRIGGER trg_mappings_points_insert
+            AFTER INSERT ON mappings
+            BEGIN
+                UPDATE users SET total_points = total_points + 1 WHERE id = NEW.user_id;
+            END''')
+        c.execute('''CREATE TRIGGER trg_mappings_points_delete
+            AFTER DELETE ON mappings
+            BEGIN
+                UPDATE users SET total_points = total_points - 1 WHERE id = OLD.user_id;
+            END''')
+        rebuild_user_points(c.connection)
+    c.execute('CREATE INDEX IF NOT EXISTS idx_users_points ON users(total_points DESC, id)')
+
+def _migration_hot_query_indexes(c):
+    # User-leading lookups: dashboard stats, assignment probes and session summaries
+    c.execute('CREATE INDEX IF NOT EXISTS idx_mappings_user_term ON mappings(user_id, term_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_mappings_user_created ON mappings(user_id, created_at)')
+    # Export ordering
+    c.execute('CREATE INDEX IF NOT EXISTS idx_mappings_created ON mappings(created_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_sessions_user_completed ON sessions(user_id, completed_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_term_leases_session ON term_leases(session_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_contact_messages_created ON contact_messages(created_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_contact_messages_read ON contact_messages(read)')
+
+def _migration_mapping_codes(c):
+    # One row per submitted code so code-level questions are answered in SQL
+    c.execute('''CREATE TABLE IF NOT EXISTS mapping_codes (
+        id INTEGER PRIMARY KEY,
+        mapping_id INTEGER NOT NULL,
+        term_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        code TEXT NOT NULL,
+        vocabulary TEXT,
+        exact_match BOOLEAN,
+        display_text TEXT,
+        FOREIGN KEY (mapping_id) REFERENCES mappings(id),
+        UNIQUE(mapping_id, position)
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_mapping_codes_code ON mapping_codes(vocabulary, code)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_mapping_codes_term ON mapping_codes(term_id)')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_mappings_codes_delete
+        AFTER DELETE ON mappings
+        BEGIN
+            DELETE FROM mapping_codes WHERE mapping_id = OLD.id;
+        END''')
+
+    # Backfill from the JSON columns
+    c.execute('DELETE FROM mapping_codes')
+    rows = c.execute('SELECT id, term_id, user_id, codes, display_texts FROM mappings').fetchall()
+    for row in rows:
+        c.executemany(MAPPING_CODES_INSERT, mapping_code_rows(*row))
+
+def _migration_retired_terms(c):
+    # Terms dropped from the catalogue by a merge import are retired, keeping their mappings
+    if not _column_exists(c, 'terms', 'retired_at'):
+        c.execute('ALTER TABLE terms ADD COLUMN retired_at TIMESTAMP')
+    c.execute('DROP INDEX IF EXISTS idx_terms_rater_count')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_terms_active_rater_count ON terms(rater_count) WHERE retired_at IS NULL')
+
+def _migration_email_outbox(c):
+    # Outgoing emails are queued here and delivered by a background worker
+    c.execute('''CREATE TABLE IF NOT EXISTS email_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        contact_message_id INTEGER,
+        envelope_from TEXT NOT NULL,
+        recipients TEXT NOT NULL,
+        message TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        last_error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        sent_at TIMESTAMP,
+        FOREIGN KEY (contact_message_id) REFERENCES contact_messages(id)
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox(status, next_attempt_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_email_outbox_contact ON email_outbox(contact_message_id)')
+
+def _migration_code_validation(c):
+    # Normalized codes and validity flags, written on submit and by the validation sweep
+    for column, definition in (('normalized_code', 'TEXT'), ('is_valid', 'BOOLEAN'),
+                               ('validation_error', 'TEXT'), ('validator_version', 'INTEGER')):
+        if not _column_exists(c, 'mapping_codes', column):
+            c.execute(f'ALTER TABLE mapping_codes ADD COLUMN {column} {definition}')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_mapping_codes_validity ON mapping_codes(is_valid, vocabulary)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_mapping_codes_validator ON mapping_codes(validator_version)')
+
+def _migration_mapping_deletions(c):
+    # Count of deleted mappings, so incremental readers of new mapping ids can tell when to rebuild
+    c.execute('''CREATE TABLE IF NOT EXISTS mapping_deletions (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        deleted INTEGER NOT NULL
+    )''')
+    c.execute('INSERT OR IGNORE INTO mapping_deletions (id, deleted) VALUES (1, 0)')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_mappings_deletions
+        AFTER DELETE ON mappings
+        BEGIN
+            UPDATE mapping_deletions SET deleted = deleted + 1 WHERE id = 1;
+        END''')
+
+MIGRATIONS = [
+    (1, 'base schema', _migration_base_schema),
+    (2, 'per-term rater counts', _migration_term_rater_count),
+    (3, 'term leases', _migration_term_leases),
+    (4, 'server-side web sessions', _migration_web_sessions),
+    (5, 'per-user points', _migration_user_points),
+    (6, 'indexes for hot queries', _migration_hot_query_indexes),
+    (7, 'normalized mapping codes', _migration_mapping_codes),
+    (8, 'retired terms', _migration_retired_terms),
+    (9, 'email outbox', _migration_email_outbox),
+    (10, 'code validation', _migration_code_validation),
+    (11, 'mapping deletion counter', _migration_mapping_deletions),
+]
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn, verbose=False):
+    """Apply all pending migrations, each in its own transaction"""
+    current = get_schema_version(conn)
+    for version, description, apply in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            # Another worker may have migrated while we waited for the write lock
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            apply(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if verbose:
+            print(f"Applied migration {version:03d}: {description}")
+    return get_schema_version(conn)
+
+def init_db():
+    """Initialize database with schema"""
+    conn = get_db()
+    migrate(conn)
     conn.close()
 
-def validate_csv_file(file_path: str, encoding: str, delimiter: str):
-    """Validate CSV file format and content"""
-    errors = []
-    warnings = []
-    
+# Hot queries checked by 'python main.py migrate --check'; keep in sync with the helpers
+HOT_QUERIES = {
+    'get_user_stats: mappings': ('SELECT COUNT(*) FROM mappings WHERE user_id = ?', (1,)),
+    'get_user_stats: sessions': ('SELECT COUNT(*) FROM sessions WHERE user_id = ? AND completed_at IS NOT NULL', (1,)),
+    'get_user_stats: streak': ('''
+        SELECT COUNT(*) FROM sessions
+        WHERE user_id = ?
+        AND completed_at IS NOT NULL
+        AND completed_at > datetime('now', '-7 days')
+    ''', (1,)),
+    'get_user_progress': ('''
+        SELECT COUNT(*) FROM mappings m
+        JOIN terms t ON t.id = m.term_id
+        WHERE m.user_id = ? AND t.retired_at IS NULL
+    ''', (1,)),
+    'get_overall_progress: total': ('SELECT COUNT(*) FROM terms WHERE retired_at IS NULL', ()),
+    'get_overall_progress': ('SELECT COUNT(*) FROM terms WHERE retired_at IS NULL AND rater_count >= ?', (2,)),
+    'get_leaderboard': ('''
+        SELECT username, total_points as mappings_count
+        FROM users
+        ORDER BY total_points DESC, id ASC
+        LIMIT ?
+    ''', (10,)),
+    'get_user_rank: rank': ('SELECT COUNT(*) FROM users WHERE total_points > ?', (1,)),
+    'get_user_rank: neighbour': ('SELECT username, total_points as mappings_count FROM users WHERE total_points > ? ORDER BY total_points ASC, id DESC LIMIT 1', (1,)),
+    'TermAssigner.assign: rated probe': ('SELECT term_id FROM mappings WHERE user_id = ? AND term_id IN (?, ?)', (1, 1, 2)),
+    'get_term': ('SELECT id, category, term, rater_count as mapping_count FROM terms WHERE id = ?', (1,)),
+    'finish_session: leases': ('DELETE FROM term_leases WHERE session_id = ?', (1,)),
+    'finish_session: count': ('SELECT COUNT(*) FROM mappings WHERE user_id = ? AND created_at > (SELECT started_at FROM sessions WHERE id = ?)', (1, 1)),
+    'MappingExport (per code)': ('''
+        SELECT u.username, t.category, t.term, mc.code, mc.vocabulary, mc.exact_match, mc.display_text,
+               mc.normalized_code, mc.is_valid, m.no_code_found, m.propose_new, m.comment, m.created_at
+        FROM mappings m
+        JOIN users u ON m.user_id = u.id
+        JOIN terms t ON m.term_id = t.id
+        LEFT JOIN mapping_codes mc ON mc.mapping_id = m.id
+        ORDER BY m.created_at DESC, m.id DESC, mc.position
+    ''', ()),
+    'MappingExport': ('''
+        SELECT u.username, t.category, t.term, m.codes, m.display_texts, m.no_code_found, m.propose_new, m.comment, m.created_at
+        FROM mappings m
+        JOIN users u ON m.user_id = u.id
+        JOIN terms t ON m.term_id = t.id
+        ORDER BY m.created_at DESC, m.id DESC
+    ''', ()),
+    'get_admin_stats: categories': ('SELECT DISTINCT category FROM terms ORDER BY category', ()),
+    'get_admin_stats: vocabularies': ("SELECT vocabulary, COUNT(*) FROM mapping_codes WHERE code != '' GROUP BY vocabulary ORDER BY COUNT(*) DESC", ()),
+    'TermSimilarityIndex: new terms': ('SELECT id, term FROM terms WHERE id > ? ORDER BY id', (1,)),
+    'get_similar_mapped_terms': ('''
+        SELECT t.id, t.category, t.term, m.no_code_found, mc.code, mc.vocabulary, mc.display_text
+        FROM mappings m
+        JOIN terms t ON t.id = m.term_id
+        LEFT JOIN mapping_codes mc ON mc.mapping_id = m.id
+        WHERE m.user_id = ? AND m.term_id IN (?, ?, ?)
+        ORDER BY mc.position
+    ''', (1, 1, 2, 3)),
+    'get_admin_stats: invalid codes': ('SELECT vocabulary, COUNT(*) FROM mapping_codes WHERE is_valid = 0 GROUP BY vocabulary', ()),
+    'get_admin_stats: unvalidated codes': ('SELECT COUNT(*) FROM mapping_codes WHERE validator_version IS NULL OR validator_version < ?', (1,)),
+    'fetch_unvalidated_codes': ('''SELECT id, vocabulary, code FROM mapping_codes
+                           WHERE id > ? AND (validator_version IS NULL OR validator_version < ?)
+                           ORDER BY id LIMIT ?''', (0, 1, 2000)),
+    'get_terms_for_code': ('''
+        SELECT t.id, t.category, t.term, COUNT(DISTINCT mc.user_id) as raters
+        FROM mapping_codes mc
+        JOIN terms t ON t.id = mc.term_id
+        WHERE mc.vocabulary = ? AND mc.code = ?
+        GROUP BY t.id
+        ORDER BY raters DESC, t.id
+    ''', ('SNOMED', '38341003')),
+    'AgreementEngine.refresh: deletions': ('SELECT deleted FROM mapping_deletions WHERE id = 1', ()),
+    'AgreementEngine.refresh: mappings': ('''
+        SELECT m.id, m.term_id, m.user_id, t.category
+        FROM mappings m
+        JOIN terms t ON t.id = m.term_id
+        WHERE m.id > ?
+        ORDER BY m.id
+    ''', (1,)),
+    'AgreementEngine.refresh: codes': ("SELECT mapping_id, vocabulary, code FROM mapping_codes WHERE mapping_id > ? AND code != ''", (1,)),
+    'get_admin_stats: unread': ('SELECT COUNT(*) FROM contact_messages WHERE read = 0', ()),
+    'get_contact_messages': ('''SELECT m.id, m.name, m.email, m.subject, m.message, m.created_at, m.read,
+                        o.status as email_status, o.attempts as email_attempts, o.last_error as email_error
+                 FROM contact_messages m
+                 LEFT JOIN email_outbox o ON o.contact_message_id = m.id
+                 ORDER BY m.created_at DESC''', ()),
+    'claim_outbox_emails': ('''SELECT id, envelope_from, recipients, message, attempts FROM email_outbox
+                               WHERE status IN ('pending', 'sending') AND next_attempt_at <= ?
+                               ORDER BY next_attempt_at LIMIT ?''', (0, 10)),
+    'SQLiteSessionBackend.load': ('SELECT data, expires_at FROM web_sessions WHERE id = ? AND expires_at > ?', ('x', 0)),
+    'SQLiteSessionBackend.purge_expired': ('DELETE FROM web_sessions WHERE expires_at <= ?', (0,)),
+}
+
+def check_query_plans(conn):
+    """EXPLAIN QUERY PLAN every hot query, returns a list of (name, plan line) full scans"""
+    problems = []
+    for name, (sql, params) in HOT_QUERIES.items():
+        for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params):
+            detail = row[3]
+            # 'SCAN t USING [COVERING] INDEX' walks an index; a bare 'SCAN t' reads the table
+            if detail.startswith('SCAN ') and ' USING ' not in detail:
+                problems.append((name, detail))
+    return problems
+
+def rebuild_rater_counts(conn):
+    """Recompute terms.rater_count from the mappings table (caller commits)"""
+    # UNIQUE(term_id, user_id) makes the row count equal to the number of unique raters
+    conn.execute('''
+        UPDATE terms SET rater_count = (
+            SELECT COUNT(*) FROM mappings WHERE mappings.term_id = terms.id
+        )
+    ''')
+
+def rebuild_user_points(conn):
+    """Recompute users.total_points from the mappings table (caller commits)"""
+    conn.execute('''
+        UPDATE users SET total_points = (
+            SELECT COUNT(*) FROM mappings WHERE mappings.user_id = users.id
+        )
+    ''')
+
+class CSVImportError(Exception):
+    """Raised when a terms CSV cannot be imported; nothing has been written"""
+
+class ImportProgress:
+    """Progress and report of the latest CSV import, shared by all workers and polled by the admin console
+
+    The state is a JSON file next to the database rather than a table in it: a replace
+    import holds the database write lock until it commits. Row updates are written at most
+    every update_interval seconds, start and finish always.
+    """
+    update_interval = 0.5
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = {'running': False}
+        self._written_at = 0.0
+
+    def _write(self):
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._state, f)
+        os.replace(temp_path, self.path)
+        self._written_at = time.monotonic()
+
+    def start(self, total_bytes):
+        with self._lock:
+            self._state = {'running': True, 'bytes_read': 0, 'total_bytes': total_bytes, 'rows': 0,
+                           'started_at': time.time(), 'pid': os.getpid()}
+            self._write()
+
+    def __call__(self, bytes_read, rows):
+        with self._lock:
+            self._state.update(bytes_read=bytes_read, rows=rows)
+            if time.monotonic() - self._written_at >= self.update_interval:
+                self._write()
+
+    def finish(self, stats=None, error=None):
+        with self._lock:
+            self._state.update(running=False, finished_at=time.time(), stats=stats, error=error)
+            self._write()
+
+    def snapshot(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {'running': False}
+        if state.get('running') and not _process_alive(state.get('pid')):
+            state.update(running=False, error="The import was interrupted when its worker stopped")
+        if state.get('total_bytes'):
+            state['percentage'] = round(min(100.0, 100.0 * state['bytes_read'] / state['total_bytes']), 1)
+        return state
+
+def _process_alive(pid):
     try:
-        with open(file_path, 'r', encoding=encoding) as f:
-            reader = csv.DictReader(f, delimiter=delimiter)
-            
-            # Check if required columns exist
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, TypeError):
+        return pid is not None
+    return True
+
+import_progress = ImportProgress(f"{DATABASE}.import-progress.json")
+
+def import_terms(conn, csv_path, encoding, delimiter, progress=None, table='terms'):
+    """Validate and insert terms from a CSV file in a single streaming pass
+
+    Rows are inserted in batches with INSERT OR IGNORE on the caller's transaction; the caller
+    commits, or rolls back when CSVImportError is raised. Only the first
+    IMPORT_MAX_ISSUES problems are kept in the report, the counters cover all rows.
+    """
+    stats = {
+        'total_rows': 0,
+        'imported': 0,
+        'skipped_empty': 0,
+        'skipped_duplicate': 0,
+        'issues': [],
+        'more_issues': 0
+    }
+
+    def note(line, reason, category, term):
+        if len(stats['issues']) < IMPORT_MAX_ISSUES:
+            stats['issues'].append({'line': line, 'reason': reason, 'category': category, 'term': term})
+        else:
+            stats['more_issues'] += 1
+
+    def flush(batch):
+        inserted = conn.executemany(f'INSERT OR IGNORE INTO {table} (category, term) VALUES (?, ?)', batch).rowcount
+        stats['imported'] += inserted
+        stats['skipped_duplicate'] += len(batch) - inserted
+        batch.clear()
+
+    with open(csv_path, 'rb') as raw:
+        # Read through a binary handle so the byte position is available for progress reports
+        f = io.TextIOWrapper(raw, encoding=encoding, newline='')
+        reader = csv.DictReader(f, delimiter=delimiter)
+        line_num = 1
+        try:
             if reader.fieldnames is None:
-                errors.append("CSV file is empty or has no headers")
-                return False, errors, warnings
-            
-            if 'Kategorie' not in reader.fieldnames:
-                errors.append("Missing required column: 'Kategorie'")
-            if 'Item' not in reader.fieldnames:
-                errors.append("Missing required column: 'Item'")
-            
-            if errors:
-                return False, errors, warnings
-            
-            # Check rows
-            row_count = 0
-            empty_rows = 0
-            for i, row in enumerate(reader, start=2):  # start=2 because row 1 is header
-                row_count += 1
-                category = row.get('Kategorie', '').strip()
-                term = row.get('Item', '').strip()
-                
-                if not category and not term:
-                    empty_rows += 1
-                elif not category:
-                    warnings.append(f"Row {i}: Missing category")
-                elif not term:
-                    warnings.append(f"Row {i}: Missing term")
-            
-            if row_count == 0:
-                errors.append("CSV file has no data rows")
-                return False, errors, warnings
-            
-            if empty_rows == row_count:
-                errors.append("All rows are empty")
-                return False, errors, warnings
-            
-            # Success
-            return True, errors, warnings
-            
-    except UnicodeDecodeError as e:
-        errors.append(f"Encoding error: Unable to read file with {encoding} encoding - {str(e)}")
-        return False, errors, warnings
-    except csv.Error as e:
-        errors.append(f"CSV format error: {str(e)}")
-        return False, errors, warnings
-    except Exception as e:
-        errors.append(f"Unexpected error: {str(e)}")
-        return False, errors, warnings
+                raise CSVImportError("CSV file is empty or has no headers")
+            missing = [f"'{column}'" for column in ('Kategorie', 'Item') if column not in reader.fieldnames]
+            if missing:
+                raise CSVImportError("Missing required column: " + ", ".join(missing))
+
+            batch = []
+            for line_num, row in enumerate(reader, start=2):  # start=2 because row 1 is header
+                stats['total_rows'] += 1
+                category = (row.get('Kategorie') or '').strip()
+                term = (row.get('Item') or '').strip()
+
+                if not category or not term:
+                    stats['skipped_empty'] += 1
+                    if category or term:
+                        note(line_num, 'missing category' if term else 'missing term', category, term)
+                    continue
+
+                batch.append((category, term))
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    flush(batch)
+                    if progress:
+                        progress(raw.tell(), stats['total_rows'])
+            if batch:
+                flush(batch)
+        except UnicodeDecodeError as e:
+            raise CSVImportError(f"Encoding error after line {line_num}: Unable to read file with {encoding} encoding - {e}") from e
+        except csv.Error as e:
+            raise CSVImportError(f"CSV format error in line {line_num}: {e}") from e
+
+        if progress:
+            progress(raw.tell(), stats['total_rows'])
+
+    if stats['total_rows'] == 0:
+        raise CSVImportError("CSV file has no data rows")
+    if stats['skipped_empty'] == stats['total_rows']:
+        raise CSVImportError("All rows are empty")
+    return stats
+
+def print_import_summary(stats):
+    print(f"CSV Import Summary:")
+    print(f"  Total rows in CSV: {stats['total_rows']}")
+    print(f"  Successfully imported: {stats['imported']}")
+    print(f"  Skipped (empty): {stats['skipped_empty']}")
+    print(f"  Skipped (duplicate): {stats['skipped_duplicate']}")
+    if stats['issues']:
+        print(f"\nIssues:")
+        for issue in stats['issues']:
+            print(f"  Line {issue['line']}: {issue['reason']} - Category: '{issue['category']}', Term: '{issue['term']}'")
+        if stats['more_issues']:
+            print(f"  ... and {stats['more_issues']} more")
+
+def replace_terms_from_csv(csv_path, progress=None):
+    """Delete all data and import the terms from csv_path in one transaction"""
+    conn = get_db()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        clear_database(conn.cursor(), include_terms=True)
+        stats = import_terms(conn, csv_path, DATA_IMPORT_CONFIG['encoding'], DATA_IMPORT_CONFIG['delimiter'], progress)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    term_assigner.invalidate()
+    term_similarity.invalidate()
+    return stats
+
+def merge_terms_from_csv(csv_path, dry_run=False, progress=None):
+    """Diff a terms CSV against the terms table on (category, term)
+
+    New terms are inserted, terms missing from the file are retired (their mappings are
+    kept) and retired terms that reappear are reactivated. Only changed rows are written;
+    with dry_run the delta is computed and rolled back.
+    """
+    conn = get_db()
+    c = conn.cursor()
+    try:
+        # Parsing the upload only writes to the temp table, so it runs without the database write lock
+        c.execute('BEGIN')
+        c.execute('''CREATE TEMP TABLE IF NOT EXISTS import_terms (
+            category TEXT NOT NULL,
+            term TEXT NOT NULL,
+            PRIMARY KEY (category, term)
+        ) WITHOUT ROWID''')
+        c.execute('DELETE FROM import_terms')
+        stats = import_terms(conn, csv_path, DATA_IMPORT_CONFIG['encoding'], DATA_IMPORT_CONFIG['delimiter'],
+                             progress, table='import_terms')
+        conn.commit()
+
+        # The delta is read inside the write transaction so it matches what gets written
+        c.execute('BEGIN' if dry_run else 'BEGIN IMMEDIATE')
+        changes = {
+            'added': '''FROM import_terms i
+                WHERE NOT EXISTS (SELECT 1 FROM terms t WHERE t.category = i.category AND t.term = i.term)''',
+            'retired': '''FROM terms t
+                WHERE t.retired_at IS NULL
+                AND NOT EXISTS (SELECT 1 FROM import_terms i WHERE i.category = t.category AND i.term = t.term)''',
+            'reactivated': '''FROM terms t
+                WHERE t.retired_at IS NOT NULL
+                AND EXISTS (SELECT 1 FROM import_terms i WHERE i.category = t.category AND i.term = t.term)'''
+        }
+        delta = {'dry_run': dry_run}
+        for name, source in changes.items():
+            delta[name] = c.execute(f'SELECT COUNT(*) {source}').fetchone()[0]
+            delta[f'{name}_examples'] = [
+                {'category': row[0], 'term': row[1]}
+                for row in c.execute(f'SELECT category, term {source} ORDER BY category, term LIMIT ?', (IMPORT_MAX_ISSUES,))
+            ]
+        delta['unchanged'] = stats['imported'] - delta['added'] - delta['reactivated']
+
+        if dry_run:
+            conn.rollback()
+        else:
+            c.execute(f"DELETE FROM term_leases WHERE term_id IN (SELECT t.id {changes['retired']})")
+            c.execute(f"UPDATE terms SET retired_at = CURRENT_TIMESTAMP WHERE id IN (SELECT t.id {changes['retired']})")
+            c.execute(f"UPDATE terms SET retired_at = NULL WHERE id IN (SELECT t.id {changes['reactivated']})")
+            c.execute(f"INSERT INTO terms (category, term) SELECT i.category, i.term {changes['added']}")
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        c.execute('DROP TABLE IF EXISTS temp.import_terms')
+        conn.close()
+
+    if not dry_run:
+        term_assigner.invalidate()
+        term_similarity.invalidate()
+    return {**stats, **delta}
 
 def import_terms_from_csv(force=False):
     """Import terms from data.CSV with category and item columns"""
@@ -336,69 +1847,160 @@ def import_terms_from_csv(force=False):
 
     # Import terms from CSV using configuration
     csv_path = DATA_IMPORT_CONFIG['csv_path']
-    encoding = DATA_IMPORT_CONFIG['encoding']
-    delimiter = DATA_IMPORT_CONFIG['delimiter']
-    
-    stats = {
-        'total_rows': 0,
-        'imported': 0,
-        'skipped_empty': 0,
-        'skipped_duplicate': 0,
-        'skipped_rows': []
-    }
-    
+    stats = None
     try:
-        with open(csv_path, 'r', encoding=encoding) as f:
-            reader = csv.DictReader(f, delimiter=delimiter)
-            for line_num, row in enumerate(reader, start=2):  # start=2 because row 1 is header
-                stats['total_rows'] += 1
-                category = row.get('Kategorie', '').strip()
-                term = row.get('Item', '').strip()
-                
-                if not category or not term:
-                    stats['skipped_empty'] += 1
-                    stats['skipped_rows'].append({
-                        'line': line_num,
-                        'reason': 'empty category or term',
-                        'category': category or '(empty)',
-                        'term': term or '(empty)'
-                    })
-                    continue
-                
-                try:
-                    c.execute('INSERT INTO terms (category, term) VALUES (?, ?)', (category, term))
-                    stats['imported'] += 1
-                except sqlite3.IntegrityError:
-                    stats['skipped_duplicate'] += 1
-                    stats['skipped_rows'].append({
-                        'line': line_num,
-                        'reason': 'duplicate',
-                        'category': category,
-                        'term': term
-                    })
-        
+        conn.execute('BEGIN IMMEDIATE')
+        stats = import_terms(conn, csv_path, DATA_IMPORT_CONFIG['encoding'], DATA_IMPORT_CONFIG['delimiter'])
         conn.commit()
-        print(f"CSV Import Summary:")
-        print(f"  Total rows in CSV: {stats['total_rows']}")
-        print(f"  Successfully imported: {stats['imported']}")
-        print(f"  Skipped (empty): {stats['skipped_empty']}")
-        print(f"  Skipped (duplicate): {stats['skipped_duplicate']}")
-        
-        if stats['skipped_rows']:
-            print(f"\nSkipped rows details:")
-            for skip in stats['skipped_rows']:
-                print(f"  Line {skip['line']}: {skip['reason']} - Category: '{skip['category']}', Term: '{skip['term']}'")
-        
+        term_assigner.invalidate()
+        term_similarity.invalidate()
+        print_import_summary(stats)
     except FileNotFoundError:
+        conn.rollback()
         print(f"WARNING: CSV file not found at {csv_path}")
     except Exception as e:
+        conn.rollback()
         print(f"ERROR importing terms: {e}")
         traceback.print_exc()
     finally:
         conn.close()
-    
+
     return stats
 
+class UploadRejected(Exception):
+    """Raised while receiving an upload that is too large or not a usable CSV"""
+
+class CSVUploadReceiver:
+    """Streams a multipart CSV upload to a temp file, checking size, encoding and header as bytes arrive"""
+    chunk_size = 256 * 1024
+    max_field_bytes = 1024
+    max_header_bytes = 64 * 1024
+
+    def __init__(self, file_field, encoding, delimiter, max_bytes):
+        self.file_field = file_field
+        self.encoding = encoding
+        self.delimiter = delimiter
+        self.max_bytes = max_bytes
+        self.fields = {}
+        self.path = None
+        self.size = 0
+        self._file = None
+        self._buffer = bytearray()
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._head = b''
+        self._header_checked = False
+        self._file_data = []
+        self._file_seen = False
+        self._part = None
+
+    # python-multipart callbacks; file data is only collected here and written in _consume()
+    def _on_part_begin(self):
+        self._part = {'headers': {}, 'header_field': b'', 'header_value': b'', 'kind': None, 'name': None, 'data': b''}
+
+    def _on_header_field(self, data, start, end):
+        self._part['header_field'] += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._part['header_value'] += data[start:end]
+
+    def _on_header_end(self):
+        self._part['headers'][self._part['header_field'].lower()] = self._part['header_value']
+        self._part['header_field'] = self._part['header_value'] = b''
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._part['headers'].get(b'content-disposition', b''))
+        name = options.get(b'name', b'').decode('utf-8', 'replace')
+        self._part['name'] = name
+        if b'filename' in options:
+            # Only the first part of the file field is kept
+            self._part['kind'] = 'file' if name == self.file_field and not self._file_seen else 'skip'
+            self._file_seen = self._file_seen or self._part['kind'] == 'file'
+        else:
+            self._part['kind'] = 'field'
+
+    def _on_part_data(self, data, start, end):
+        if self._part['kind'] == 'file':
+            self._file_data.append(data[start:end])
+        elif self._part['kind'] == 'field' and len(self._part['data']) < self.max_field_bytes:
+            self._part['data'] += data[start:end]
+
+    def _on_part_end(self):
+        if self._part['kind'] == 'field':
+            self.fields[self._part['name']] = self._part['data'].decode('utf-8', 'replace')
+
+    def _check_header(self, final=False):
+        if b'\n' not in self._head and not final:
+            if len(self._head) > self.max_header_bytes:
+                raise UploadRejected("First line of the CSV file is too long to be a header")
+            return
+        line = self._head.split(b'\n', 1)[0].decode(self.encoding, 'replace')
+        header = next(csv.reader([line], delimiter=self.delimiter), [])
+        missing = [f"'{column}'" for column in ('Kategorie', 'Item') if column not in header]
+        if missing:
+            raise UploadRejected("Missing required column: " + ", ".join(missing))
+        self._header_checked = True
+
+    async def _consume(self, final=False):
+        data = b''.join(self._file_data)
+        self._file_data.clear()
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadRejected(f"File is larger than the maximum of {self.max_bytes / (1024 * 1024):g} MB")
+        try:
+            self._decoder.decode(data, final)
+        except UnicodeDecodeError as e:
+            raise UploadRejected(f"Encoding error: Unable to read file with {self.encoding} encoding - {e}") from e
+        if final and self.size == 0:
+            raise UploadRejected("No CSV file was uploaded")
+        if not self._header_checked:
+            self._head += data[:self.max_header_bytes + 1]
+            self._check_header(final)
+        self._buffer += data
+        if len(self._buffer) >= self.chunk_size or (final and self._buffer):
+            await run_in_threadpool(self._file.write, bytes(self._buffer))
+            self._buffer.clear()
+
+    async def receive(self, request):
+        """Receive the upload, returns (temp file path, form fields); nothing is kept on errors"""
+        _, params = parse_options_header(request.headers.get('content-type', ''))
+        boundary = params.get(b'boundary')
+        if not boundary:
+            raise UploadRejected("Expected a multipart/form-data upload")
+        content_length = request.headers.get('content-length')
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes + self.max_header_bytes:
+            raise UploadRejected(f"File is larger than the maximum of {self.max_bytes / (1024 * 1024):g} MB")
+
+        parser = MultipartParser(boundary, {
+            'on_part_begin': self._on_part_begin,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end,
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished
+        })
+        self._file = await run_in_threadpool(tempfile.NamedTemporaryFile, mode='wb', delete=False, suffix='.csv')
+        self.path = self._file.name
+        try:
+            try:
+                async for chunk in request.stream():
+                    parser.write(chunk)
+                    if self._file_data:
+                        await self._consume()
+                parser.finalize()
+            except MultipartParseError as e:
+                raise UploadRejected(f"Malformed upload: {e}") from e
+            # Browsers always send the file part (empty when nothing was chosen), so a missing one is a bad request
+            if not self._file_seen:
+                raise HTTPException(status_code=400, detail=f"Missing file field '{self.file_field}'")
+            await self._consume(final=True)
+            await run_in_threadpool(self._file.close)
+        except BaseException:
+            self._file.close()
+            os.unlink(self.path)
+            raise
+        return self.path, self.fields
+
 def get_current_user(request: Request):
     """Get current user from session"""
     user_id = request.session.get('user_id')
@@ -407,39 +2009,184 @@ def get_current_user(request: Request):
         return None
     return {'user_id': user_id, 'username': username}
 
-def get_terms_for_session(count=15, user_id=None):
-    """Get terms with lowest number of UNIQUE ratings (prioritize <2 unique users)"""
+class TermAssigner:
+    """Hands out session terms from buckets keyed by effective coverage.
+
+    A term's effective coverage is its number of unique raters plus the live leases on it,
+    so terms handed to open sessions count toward coverage until they are rated or the
+    lease expires. Leases are persisted in term_leases; the in-memory buckets are rebuilt
+    from the database every few seconds to pick up other workers' ratings and leases.
+    """
+
+    def __init__(self, lease_seconds, resync_seconds):
+        self.lease_seconds = lease_seconds
+        self.resync_seconds = resync_seconds
+        self._lock = threading.Lock()
+        self._synced_at = None
+        self._buckets = {}   # effective coverage -> list of term ids
+        self._slot = {}      # term id -> (coverage, index in bucket)
+        self._leases = {}    # (term id, user id) -> (expires_at, session id)
+        self._expiry = []    # heap of (expires_at, term id, user id)
+
+    def invalidate(self):
+        """Force a full reload from the database on next use"""
+        with self._lock:
+            self._synced_at = None
+
+    def _place(self, term_id, coverage):
+        bucket = self._buckets.setdefault(coverage, [])
+        self._slot[term_id] = (coverage, len(bucket))
+        bucket.append(term_id)
+
+    def _shift(self, term_id, delta):
+        """Move a term to the bucket for its new coverage in O(1)"""
+        if term_id not in self._slot:
+            return
+        coverage, index = self._slot.pop(term_id)
+        bucket = self._buckets[coverage]
+        last = bucket.pop()
+        if last != term_id:
+            bucket[index] = last
+            self._slot[last] = (coverage, index)
+        if not bucket:
+            del self._buckets[coverage]
+        self._place(term_id, max(coverage + delta, 0))
+
+    def _sync(self, conn, now):
+        c = conn.cursor()
+        c.execute('DELETE FROM term_leases WHERE expires_at <= ?', (now,))
+        conn.commit()
+        self._buckets, self._slot, self._leases, self._expiry = {}, {}, {}, []
+        live = {}
+        for row in c.execute('SELECT term_id, user_id, session_id, expires_at FROM term_leases'):
+            self._leases[(row[0], row[1])] = (row[3], row[2])
+            heapq.heappush(self._expiry, (row[3], row[0], row[1]))
+            live[row[0]] = live.get(row[0], 0) + 1
+        for term_id, rater_count in c.execute('SELECT id, rater_count FROM terms WHERE retired_at IS NULL'):
+            self._place(term_id, rater_count + live.get(term_id, 0))
+        self._synced_at = now
+
+    def _expire(self, now):
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, term_id, user_id = heapq.heappop(self._expiry)
+            lease = self._leases.get((term_id, user_id))
+            # Skip heap entries for leases that were released or renewed meanwhile
+            if lease and lease[0] == expires_at:
+                del self._leases[(term_id, user_id)]
+                self._shift(term_id, -1)
+
+    def _drop_lease(self, term_id, user_id):
+        if self._leases.pop((term_id, user_id), None) is not None:
+            self._shift(term_id, -1)
+            return True
+        return False
+
+    def _draw(self, bucket, tried, k):
+        """Pick up to k untried members of a bucket at random"""
+        if len(tried) * 2 < len(bucket):
+            picks = set()
+            attempts = 0
+            while len(picks) < k and attempts < k * 4:
+                term_id = bucket[random.randrange(len(bucket))]
+                attempts += 1
+                if term_id not in tried:
+                    picks.add(term_id)
+            if picks:
+                return list(picks)
+        untried = [term_id for term_id in bucket if term_id not in tried]
+        return random.sample(untried, min(k, len(untried)))
+
+    def assign(self, conn, user_id, session_id, count):
+        """Lease up to count terms with the lowest coverage the user has not rated yet"""
+        now = time.time()
+        with self._lock:
+            if self._synced_at is None or now - self._synced_at > self.resync_seconds:
+                self._sync(conn, now)
+            self._expire(now)
+
+            # A new session replaces the user's previous one, so its leases are returned
+            for term_id, leased_by in [key for key in self._leases if key[1] == user_id]:
+                self._drop_lease(term_id, leased_by)
+            conn.execute('DELETE FROM term_leases WHERE user_id = ?', (user_id,))
+
+            chosen = []
+            for coverage in sorted(self._buckets):
+                bucket = self._buckets[coverage]
+                tried = set()
+                while len(chosen) < count and len(tried) < len(bucket):
+                    batch = self._draw(bucket, tried, 2 * (count - len(chosen)))
+                    tried.update(batch)
+                    placeholders = ','.join('?' * len(batch))
+                    rated = {row[0] for row in conn.execute(
+                        f'SELECT term_id FROM mappings WHERE user_id = ? AND term_id IN ({placeholders})',
+                        (user_id, *batch))}
+                    chosen.extend(t for t in batch if t not in rated)
+                    del chosen[count:]
+                if len(chosen) >= count:
+                    break
+
+            expires_at = now + self.lease_seconds
+            conn.executemany(
+                'INSERT OR REPLACE INTO term_leases (term_id, user_id, session_id, expires_at) VALUES (?, ?, ?, ?)',
+                [(term_id, user_id, session_id, expires_at) for term_id in chosen])
+            conn.commit()
+            for term_id in chosen:
+                self._leases[(term_id, user_id)] = (expires_at, session_id)
+                heapq.heappush(self._expiry, (expires_at, term_id, user_id))
+                self._shift(term_id, +1)
+        return chosen
+
+    def rated(self, term_id, user_id):
+        """A rating replaces the user's lease on the term (or adds coverage without one)"""
+        with self._lock:
+            if self._leases.pop((term_id, user_id), None) is None:
+                self._shift(term_id, +1)
+
+    def release_session(self, session_id):
+        """Return the leases of a finished session for terms that were not rated"""
+        with self._lock:
+            for term_id, user_id in [key for key, lease in self._leases.items() if lease[1] == session_id]:
+                self._drop_lease(term_id, user_id)
+
+term_assigner = TermAssigner(LEASE_SECONDS, ASSIGNMENT_RESYNC_SECONDS)
+
+def get_terms_for_session(count=15, user_id=None, session_id=None):
+    """Lease the terms with lowest number of UNIQUE ratings (incl. open leases) for a session"""
+    conn = get_db()
+    term_ids = term_assigner.assign(conn, user_id, session_id, count)
+
+    placeholders = ','.join('?' * len(term_ids))
+    c = conn.execute(f'''
+        SELECT id, category, term, rater_count as mapping_count
+        FROM terms WHERE id IN ({placeholders})
+    ''', term_ids)
+    terms = {row['id']: dict(row) for row in c.fetchall()}
+    conn.close()
+    # Keep the assignment order (least covered first)
+    return [terms[term_id] for term_id in term_ids if term_id in terms]
+
+def get_term(term_id):
+    """Get a single term with its current number of unique raters"""
     conn = get_db()
     c = conn.cursor()
+    c.execute('SELECT id, category, term, rater_count as mapping_count FROM terms WHERE id = ?', (term_id,))
+    row = c.fetchone()
+    conn.close()
+    return dict(row) if row else None
 
-    # Get terms with count of DISTINCT users who have rated them
-    # Exclude terms this user has already rated
-    if user_id:
-        c.execute('''
-            SELECT t.id, t.category, t.term,
-                   COUNT(DISTINCT m.user_id) as mapping_count
-            FROM terms t
-            LEFT JOIN mappings m ON t.id = m.term_id
-            WHERE t.id NOT IN (
-                SELECT term_id FROM mappings WHERE user_id = ?
-            )
-            GROUP BY t.id
-            ORDER BY mapping_count ASC, RANDOM()
-            LIMIT ?
-        ''', (user_id, count))
-    else:
-        c.execute('''
-            SELECT t.id, t.category, t.term,
-                   COUNT(DISTINCT m.user_id) as mapping_count
-            FROM terms t
-            LEFT JOIN mappings m ON t.id = m.term_id
-            GROUP BY t.id
-            ORDER BY mapping_count ASC, RANDOM()
-            LIMIT ?
-        ''', (count,))
-
-    terms = [dict(row) for row in c.fetchall()]
+def get_session_batch(term_ids, user_id):
+    """The terms of a session in session order, each with the similar terms the user already mapped"""
+    conn = get_db()
+    placeholders = ','.join('?' * len(term_ids))
+    rows = {row['id']: dict(row) for row in conn.execute(
+        f'SELECT id, category, term, rater_count as mapping_count FROM terms WHERE id IN ({placeholders})',
+        tuple(term_ids))}
     conn.close()
+    # Terms removed by an admin reset while the session was open are returned as None
+    terms = [rows.get(term_id) for term_id in term_ids]
+    for term in terms:
+        if term is not None:
+            term['similar'] = get_similar_mapped_terms(term['id'], term['term'], user_id)
     return terms
 
 def get_user_stats(user_id):
@@ -476,19 +2223,12 @@ def get_overall_progress():
     conn = get_db()
     c = conn.cursor()
 
-    # Total terms
-    c.execute('SELECT COUNT(*) FROM terms')
+    # Total terms (retired terms no longer count)
+    c.execute('SELECT COUNT(*) FROM terms WHERE retired_at IS NULL')
     total_terms = c.fetchone()[0]
 
     # Terms with at least REQUIRED_RATERS mappings from UNIQUE users
-    c.execute('''
-        SELECT COUNT(*) FROM (
-            SELECT term_id
-            FROM mappings
-            GROUP BY term_id
-            HAVING COUNT(DISTINCT user_id) >= ?
-        )
-    ''', (REQUIRED_RATERS,))
+    c.execute('SELECT COUNT(*) FROM terms WHERE retired_at IS NULL AND rater_count >= ?', (REQUIRED_RATERS,))
     completed_terms = c.fetchone()[0]
 
     conn.close()
@@ -498,52 +2238,1234 @@ def get_overall_progress():
         'percentage': round((completed_terms / total_terms * 100) if total_terms > 0 else 0, 1)
     }
 
-def get_user_progress(user_id):
-    """Get user-specific progress statistics"""
+def get_user_progress(user_id):
+    """Get user-specific progress statistics"""
+    conn = get_db()
+    c = conn.cursor()
+
+    # Total terms
+    c.execute('SELECT COUNT(*) FROM terms WHERE retired_at IS NULL')
+    total_terms = c.fetchone()[0]
+
+    # Terms this user has mapped (one mapping per user and term)
+    c.execute('''
+        SELECT COUNT(*) FROM mappings m
+        JOIN terms t ON t.id = m.term_id
+        WHERE m.user_id = ? AND t.retired_at IS NULL
+    ''', (user_id,))
+    user_mapped_terms = c.fetchone()[0]
+
+    # Terms remaining for this user
+    remaining_terms = total_terms - user_mapped_terms
+
+    conn.close()
+    return {
+        'total_terms': total_terms,
+        'mapped_terms': user_mapped_terms,
+        'remaining_terms': remaining_terms,
+        'percentage': round((user_mapped_terms / total_terms * 100) if total_terms > 0 else 0, 1)
+    }
+
+def get_leaderboard(limit=10):
+    """Get top users by total mappings"""
+    conn = get_db()
+    c = conn.cursor()
+
+    # users.total_points is kept equal to the user's number of mappings by triggers
+    c.execute('''
+        SELECT username, total_points as mappings_count
+        FROM users
+        ORDER BY total_points DESC, id ASC
+        LIMIT ?
+    ''', (limit,))
+
+    leaderboard = [dict(row) for row in c.fetchall()]
+    conn.close()
+    return leaderboard
+
+def count_users():
+    """Number of registered users"""
+    conn = get_db()
+    count = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+    conn.close()
+    return count
+
+def get_user_rank(user_id, total_users):
+    """Get the user's rank and the users directly above and below on the leaderboard"""
+    conn = get_db()
+    c = conn.cursor()
+
+    c.execute('SELECT total_points FROM users WHERE id = ?', (user_id,))
+    row = c.fetchone()
+    if row is None:
+        conn.close()
+        return None
+    points = row[0]
+
+    # Competition rank: 1 + users with more points, counted on idx_users_points from the top
+    c.execute('SELECT COUNT(*) FROM users WHERE total_points > ?', (points,))
+    rank = c.fetchone()[0] + 1
+
+    # Neighbours in leaderboard order (total_points DESC, id ASC), both served by idx_users_points
+    c.execute('SELECT username, total_points as mappings_count FROM users WHERE total_points = ? AND id < ? ORDER BY id DESC LIMIT 1',
+              (points, user_id))
+    above = c.fetchone()
+    if above is None:
+        c.execute('SELECT username, total_points as mappings_count FROM users WHERE total_points > ? ORDER BY total_points ASC, id DESC LIMIT 1',
+                  (points,))
+        above = c.fetchone()
+    c.execute('SELECT username, total_points as mappings_count FROM users WHERE total_points = ? AND id > ? ORDER BY id ASC LIMIT 1',
+              (points, user_id))
+    below = c.fetchone()
+    if below is None:
+        c.execute('SELECT username, total_points as mappings_count FROM users WHERE total_points < ? ORDER BY total_points DESC, id ASC LIMIT 1',
+                  (points,))
+        below = c.fetchone()
+
+    conn.close()
+    return {
+        'rank': rank,
+        'total_users': total_users,
+        'points': points,
+        'above': dict(above) if above else None,
+        'below': dict(below) if below else None
+    }
+
+def _term_trigrams(text):
+    """Trigrams of a term, ignoring case, accents, spaces and punctuation ("Aufnahme-Datum" == "Aufnahmedatum")"""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = re.sub(r'[\W_]+', '', ''.join(ch for ch in text if not unicodedata.combining(ch)))
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class TermSimilarityIndex:
+    """Inverted trigram index over terms.term for similar-term lookups without LIKE scans
+
+    Similarity is the Jaccard index of the trigram sets; candidates are scored with one
+    numpy bincount over the posting lists of the query's trigrams. Terms are only ever
+    inserted or deleted (ids are AUTOINCREMENT), so new rows are added incrementally and
+    the index is only rebuilt when rows have disappeared.
+    """
+
+    def __init__(self, resync_seconds):
+        self.resync_seconds = resync_seconds
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._clear()
+
+    def _clear(self):
+        self._postings = {}               # trigram -> array of term positions
+        self._ids = array('i')            # position -> term id
+        self._sizes = array('i')          # position -> number of trigrams
+        self._position = {}               # term id -> position
+        self._last_id = 0
+
+    def invalidate(self):
+        """Check the terms table for changes on next use"""
+        with self._lock:
+            self._checked_at = None
+
+    def _add(self, rows):
+        for term_id, term in rows:
+            position = len(self._ids)
+            trigrams = _term_trigrams(term)
+            for trigram in trigrams:
+                postings = self._postings.get(trigram)
+                if postings is None:
+                    postings = self._postings[trigram] = array('i')
+                postings.append(position)
+            self._ids.append(term_id)
+            self._sizes.append(len(trigrams))
+            self._position[term_id] = position
+            self._last_id = max(self._last_id, term_id)
+
+    def _refresh(self, conn):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.resync_seconds:
+            return
+        max_id, count = conn.execute('SELECT MAX(id), COUNT(*) FROM terms').fetchone()
+        if (max_id or 0) > self._last_id:
+            self._add(conn.execute('SELECT id, term FROM terms WHERE id > ? ORDER BY id', (self._last_id,)))
+        if count != len(self._ids):
+            # Terms were deleted (reset or replace import)
+            self._clear()
+            self._add(conn.execute('SELECT id, term FROM terms ORDER BY id'))
+        self._checked_at = now
+
+    def refresh(self, conn):
+        with self._lock:
+            self._refresh(conn)
+
+    def _scores(self, trigrams):
+        lists = [self._postings[t] for t in trigrams if t in self._postings]
+        if not lists or not trigrams:
+            return None
+        shared = np.bincount(np.concatenate([np.frombuffer(p, dtype=np.int32) for p in lists]),
+                             minlength=len(self._ids))
+        sizes = np.frombuffer(self._sizes, dtype=np.int32)
+        return shared / (sizes + len(trigrams) - shared)
+
+    def search(self, conn, text, limit, min_similarity=0.0, exclude=None):
+        """[(term id, similarity)] of the terms most similar to text, best first"""
+        with self._lock:
+            self._refresh(conn)
+            scores = self._scores(_term_trigrams(text))
+            if scores is None:
+                return []
+            if exclude is not None and exclude in self._position:
+                scores[self._position[exclude]] = 0.0
+            k = min(limit, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind='stable')]
+            return [(self._ids[i], round(float(scores[i]), 3)) for i in top if scores[i] > 0 and scores[i] >= min_similarity]
+
+term_similarity = TermSimilarityIndex(ASSIGNMENT_RESYNC_SECONDS)
+
+def refresh_term_similarity():
+    """Bring the similar-term index up to date with the terms table (after imports)"""
+    conn = get_db()
+    term_similarity.refresh(conn)
+    conn.close()
+
+def get_similar_mapped_terms(term_id, term, user_id):
+    """Terms similar to term that this user already mapped, with the codes they chose"""
+    if not SIMILAR_TERMS_SHOWN:
+        return []
+    conn = get_db()
+    # Only the rater's own mappings are shown, other raters' codes would bias the agreement
+    candidates = term_similarity.search(conn, term, SIMILAR_TERMS_CANDIDATES,
+                                        SIMILAR_TERMS_MIN_SIMILARITY, exclude=term_id)
+    if not candidates:
+        conn.close()
+        return []
+    similarity = dict(candidates)
+    placeholders = ','.join('?' * len(similarity))
+    rows = conn.execute(f'''
+        SELECT t.id, t.category, t.term, m.no_code_found, mc.code, mc.vocabulary, mc.display_text
+        FROM mappings m
+        JOIN terms t ON t.id = m.term_id
+        LEFT JOIN mapping_codes mc ON mc.mapping_id = m.id
+        WHERE m.user_id = ? AND m.term_id IN ({placeholders})
+        ORDER BY mc.position
+    ''', (user_id, *similarity)).fetchall()
+    conn.close()
+
+    terms = {}
+    for row in rows:
+        entry = terms.setdefault(row['id'], {
+            'id': row['id'], 'category': row['category'], 'term': row['term'],
+            'similarity': similarity[row['id']], 'no_code_found': bool(row['no_code_found']), 'codes': []
+        })
+        if row['code'] or row['display_text']:
+            entry['codes'].append({'code': row['code'], 'vocabulary': row['vocabulary'],
+                                   'display_text': row['display_text']})
+    return sorted(terms.values(), key=lambda t: -t['similarity'])[:SIMILAR_TERMS_SHOWN]
+
+def search_catalogue(query, limit=25):
+    """Catalogue terms most similar to query, for the admin console"""
+    conn = get_db()
+    matches = term_similarity.search(conn, query, limit)
+    if not matches:
+        conn.close()
+        return []
+    similarity = dict(matches)
+    placeholders = ','.join('?' * len(similarity))
+    rows = conn.execute(f'''SELECT id, category, term, rater_count, retired_at FROM terms
+                            WHERE id IN ({placeholders})''', tuple(similarity)).fetchall()
+    conn.close()
+    results = [{**dict(row), 'similarity': similarity[row['id']]} for row in rows]
+    return sorted(results, key=lambda t: -t['similarity'])
+
+def get_or_create_user(username):
+    """Return the id of the given user, creating the user on first login"""
+    conn = get_db()
+    c = conn.cursor()
+
+    # Check if user exists
+    c.execute('SELECT id FROM users WHERE username = ?', (username,))
+    user = c.fetchone()
+
+    if user:
+        user_id = user[0]
+    else:
+        # Create new user
+        c.execute('INSERT INTO users (username) VALUES (?)', (username,))
+        user_id = c.lastrowid
+        conn.commit()
+
+    conn.close()
+    return user_id
+
+def create_session(user_id, count):
+    """Create a session row and return its id"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('INSERT INTO sessions (user_id, terms_count) VALUES (?, ?)',
+              (user_id, count))
+    session_id = c.lastrowid
+    conn.commit()
+    conn.close()
+    return session_id
+
+MAPPING_CODES_INSERT = '''INSERT INTO mapping_codes
+    (mapping_id, term_id, user_id, position, code, vocabulary, exact_match, display_text)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)'''
+
+VALIDATED_CODES_INSERT = '''INSERT INTO mapping_codes
+    (mapping_id, term_id, user_id, position, code, vocabulary, exact_match, display_text,
+     normalized_code, is_valid, validation_error, validator_version)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+
+def mapping_code_rows(mapping_id, term_id, user_id, codes_json, display_texts_json):
+    """Turn the submitted codes/display_texts JSON into mapping_codes rows"""
+    try:
+        codes = json.loads(codes_json or '[]')
+        display_texts = json.loads(display_texts_json or '[]')
+    except ValueError:
+        return []
+    if not isinstance(codes, list):
+        return []
+    if not isinstance(display_texts, list):
+        display_texts = []
+
+    rows = []
+    for position, item in enumerate(codes):
+        if not isinstance(item, dict):
+            continue
+        # The form sends approximate_match, older submissions stored exact_match
+        if 'approximate_match' in item:
+            exact_match = not item['approximate_match']
+        else:
+            exact_match = item.get('exact_match')
+        display_text = display_texts[position] if position < len(display_texts) else item.get('display_text')
+        rows.append((mapping_id, term_id, user_id, position, str(item.get('code') or '').strip(),
+                     item.get('vocabulary'), exact_match, display_text))
+    return rows
+
+def save_mappings(items):
+    """Store a batch of mappings in one transaction, returns per item False if the user already rated the term
+
+    Each item is (term_id, user_id, codes_json, display_texts_json, no_code_found, propose_new, comment).
+    A savepoint per item lets a duplicate fail on its own without rolling back the rest of the batch.
+    """
+    conn = get_db()
+    c = conn.cursor()
+    results = []
+    try:
+        c.execute('BEGIN IMMEDIATE')
+        for term_id, user_id, codes_json, display_texts_json, no_code_found, propose_new, comment in items:
+            c.execute('SAVEPOINT mapping')
+            try:
+                c.execute('INSERT INTO mappings (term_id, user_id, codes, display_texts, no_code_found, propose_new, comment) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                          (term_id, user_id, codes_json, display_texts_json, no_code_found, propose_new, comment))
+                c.executemany(VALIDATED_CODES_INSERT,
+                              [(*row, *validate_code(row[5], row[4]), VALIDATOR_VERSION)
+                               for row in mapping_code_rows(c.lastrowid, term_id, user_id, codes_json, display_texts_json)])
+                c.execute('DELETE FROM term_leases WHERE term_id = ? AND user_id = ?', (term_id, user_id))
+                c.execute('RELEASE mapping')
+                results.append(True)
+            except sqlite3.IntegrityError:
+                # User already rated this term - skip it
+                c.execute('ROLLBACK TO mapping')
+                c.execute('RELEASE mapping')
+                results.append(False)
+        conn.commit()
+    finally:
+        conn.close()
+    MAPPING_BATCH_SIZE.observe(len(items))
+    MAPPINGS_WRITTEN.inc(sum(results))
+    for item, saved in zip(items, results):
+        if saved:
+            term_assigner.rated(item[0], item[1])
+    return results
+
+def save_mapping(term_id, user_id, codes_json, display_texts_json, no_code_found, propose_new, comment):
+    """Store a mapping, returns False if the user already rated this term"""
+    return save_mappings([(term_id, user_id, codes_json, display_texts_json, no_code_found, propose_new, comment)])[0]
+
+class MappingWriter:
+    """Per-worker group commit for mapping submissions
+
+    Submissions are queued and written by one task in batched transactions: after the
+    first submission arrives, the writer waits up to the commit window for others and
+    stores up to max_batch of them at once. Each caller gets its own result once the
+    batch is committed.
+    """
+
+    def __init__(self, window, max_batch):
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Write what is still queued, then end the writer task"""
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, *mapping):
+        """Queue a mapping and wait until its batch is committed, returns False for a duplicate"""
+        if self._task is None or self._task.done():
+            return await run_db(save_mapping, *mapping)
+        future = asyncio.get_running_loop().create_future()
+        # The writer task runs outside the request, so the route travels with the mapping
+        self._queue.put_nowait((mapping, current_route(), future))
+        return await future
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            entry = await self._queue.get()
+            if entry is None:
+                break
+            batch = [entry]
+            if self.window and self._queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.window)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                entry = self._queue.get_nowait()
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            routes = sorted({route for _, route, _ in batch if route})
+            try:
+                results = await run_db(save_mappings, [mapping for mapping, _, _ in batch],
+                                       route=', '.join(routes) or None)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, _, future), saved in zip(batch, results):
+                if not future.done():
+                    future.set_result(saved)
+
+mapping_writer = MappingWriter(DB_WRITE_WINDOW_MS / 1000, DB_WRITE_BATCH_SIZE)
+
+def fetch_unvalidated_codes(after_id, limit):
+    """Next mapping_codes rows after after_id that the current validator has not checked"""
+    conn = get_db()
+    rows = conn.execute('''SELECT id, vocabulary, code FROM mapping_codes
+                           WHERE id > ? AND (validator_version IS NULL OR validator_version < ?)
+                           ORDER BY id LIMIT ?''', (after_id, VALIDATOR_VERSION, limit)).fetchall()
+    conn.close()
+    return [tuple(row) for row in rows]
+
+def store_code_validation(results):
+    """Write validate_codes() results in one short transaction"""
+    conn = get_db()
+    try:
+        conn.executemany('''UPDATE mapping_codes
+                            SET normalized_code = ?, is_valid = ?, validation_error = ?, validator_version = ?
+                            WHERE id = ?''', results)
+        conn.commit()
+    finally:
+        conn.close()
+
+class CodeValidationSweep:
+    """Re-validates mapping_codes rows batch by batch across a process pool
+
+    Only reads and short per-batch UPDATE transactions touch the database, so raters
+    keep submitting while the sweep runs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {'running': False}
+
+    @property
+    def running(self):
+        with self._lock:
+            return self._state['running']
+
+    def _update(self, **values):
+        with self._lock:
+            self._state.update(values)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._state)
+
+    async def run(self):
+        with self._lock:
+            if self._state['running']:
+                return self._state
+            self._state = {'running': True, 'checked': 0, 'invalid': 0, 'started_at': time.time()}
+        loop = asyncio.get_running_loop()
+        try:
+            # spawn: forking a process that runs DB and event loop threads is unsafe. validate_codes
+            # lives in code_validation.py, so the children import that module and not the app
+            with ProcessPoolExecutor(VALIDATION_PROCESSES, mp_context=multiprocessing.get_context('spawn')) as pool:
+                after_id = 0
+                while True:
+                    rows = await run_db(fetch_unvalidated_codes, after_id, VALIDATION_BATCH_SIZE * VALIDATION_PROCESSES)
+                    if not rows:
+                        break
+                    chunks = [rows[i:i + VALIDATION_BATCH_SIZE] for i in range(0, len(rows), VALIDATION_BATCH_SIZE)]
+                    parts = await asyncio.gather(*(loop.run_in_executor(pool, validate_codes, chunk) for chunk in chunks))
+                    results = [result for part in parts for result in part]
+                    await run_db(store_code_validation, results)
+                    after_id = rows[-1][0]
+                    state = self.snapshot()
+                    self._update(checked=state['checked'] + len(results),
+                                 invalid=state['invalid'] + sum(1 for result in results if result[1] is False))
+        except Exception as e:
+            traceback.print_exc()
+            self._update(running=False, finished_at=time.time(), error=str(e))
+            return self.snapshot()
+        self._update(running=False, finished_at=time.time())
+        return self.snapshot()
+
+code_validation = CodeValidationSweep()
+
+def finish_session(user_id, session_id):
+    """Mark a session as completed and return the number of mappings made during it"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('UPDATE sessions SET completed_at = CURRENT_TIMESTAMP WHERE id = ?',
+              (session_id,))
+    c.execute('DELETE FROM term_leases WHERE session_id = ?', (session_id,))
+
+    # Get session stats
+    c.execute('SELECT COUNT(*) FROM mappings WHERE user_id = ? AND created_at > (SELECT started_at FROM sessions WHERE id = ?)',
+              (user_id, session_id))
+    mappings_count = c.fetchone()[0]
+
+    conn.commit()
+    conn.close()
+    term_assigner.release_session(session_id)
+    return mappings_count
+
+def _fleiss_kappa(p_bar, totals):
+    """Fleiss' kappa from the mean per-term agreement and the label totals"""
+    totals = np.asarray(totals, dtype=float)
+    if totals.sum() == 0:
+        return None
+    p = totals / totals.sum()
+    p_e = float(np.dot(p, p))
+    if p_e >= 1.0:
+        return None
+    return (p_bar - p_e) / (1.0 - p_e)
+
+class AgreementEngine:
+    """Inter-rater agreement state per term, caught up incrementally from new mapping rows
+
+    A rating's label is the set of (vocabulary, code) pairs it chose, or NO_CODE. Agreement
+    on code sets and on "no code found" is tracked per term, Cohen's kappa per rater pair,
+    and Fleiss' kappa (for varying numbers of raters) overall and per category.
+    """
+    NO_CODE = frozenset()
+    # Per-term columns: raters, sum of squared label counts, no-code ratings, summed pairwise code-set overlap
+    RATERS, SUMSQ, NOCODE, OVERLAP = range(4)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.last_id = 0
+        self.deleted = None
+        self.ratings = {}
+        self.slots = {}
+        self.category_index = {}
+        self.term_category = np.zeros(0, dtype=np.int64)
+        self.term_stats = np.zeros((0, 4))
+        # Label totals over terms with at least two raters, per category index
+        self.label_totals = {}
+        # (user_a, user_b) -> [shared terms, agreements, a's label counts, b's label counts, expected agreements]
+        self.pairs = {}
+
+    def invalidate(self):
+        with self._lock:
+            self._reset()
+
+    def _slot(self, term_id, category):
+        slot = self.slots.get(term_id)
+        if slot is None:
+            slot = len(self.slots)
+            self.slots[term_id] = slot
+            if slot >= len(self.term_stats):
+                grow = max(1024, len(self.term_stats))
+                self.term_stats = np.vstack([self.term_stats, np.zeros((grow, 4))])
+                self.term_category = np.concatenate([self.term_category, np.zeros(grow, dtype=np.int64)])
+            self.term_category[slot] = self.category_index.setdefault(category, len(self.category_index))
+            self.ratings[term_id] = {}
+        return slot
+
+    def _add(self, term_id, category, user_id, label):
+        slot = self._slot(term_id, category)
+        raters = self.ratings[term_id]
+        if user_id in raters:
+            return
+        stats = self.term_stats[slot]
+        totals = self.label_totals.setdefault(int(self.term_category[slot]), {})
+
+        # Remove the term's old contribution to the label totals, re-added below
+        if len(raters) >= 2:
+            for other in raters.values():
+                totals[other] -= 1
+
+        same = 0
+        for other_id, other in raters.items():
+            same += other == label
+            union = len(label | other)
+            stats[self.OVERLAP] += len(label & other) / union if union else 1.0
+            key = (min(user_id, other_id), max(user_id, other_id))
+            pair = self.pairs.setdefault(key, [0, 0, {}, {}, 0])
+            pair[0] += 1
+            pair[1] += other == label
+            mine, theirs = (pair[2], pair[3]) if key[0] == user_id else (pair[3], pair[2])
+            # Keeps pair[4] equal to the dot product of the two raters' label counts
+            pair[4] += theirs.get(label, 0) + mine.get(other, 0) + (label == other)
+            mine[label] = mine.get(label, 0) + 1
+            theirs[other] = theirs.get(other, 0) + 1
+
+        raters[user_id] = label
+        stats[self.RATERS] += 1
+        stats[self.SUMSQ] += 2 * same + 1
+        stats[self.NOCODE] += label == self.NO_CODE
+        if len(raters) >= 2:
+            for other in raters.values():
+                totals[other] = totals.get(other, 0) + 1
+
+    def refresh(self, conn):
+        """Apply mappings added since the last refresh; rebuild if any were deleted"""
+        conn.execute('BEGIN')
+        try:
+            # Bumped by a trigger on every mapping delete
+            deleted = conn.execute('SELECT deleted FROM mapping_deletions WHERE id = 1').fetchone()[0]
+            if deleted != self.deleted:
+                self._reset()
+                self.deleted = deleted
+            rows = conn.execute('''
+                SELECT m.id, m.term_id, m.user_id, t.category
+                FROM mappings m
+                JOIN terms t ON t.id = m.term_id
+                WHERE m.id > ?
+                ORDER BY m.id
+            ''', (self.last_id,)).fetchall()
+            codes = {}
+            for mapping_id, vocabulary, code in conn.execute(
+                    "SELECT mapping_id, vocabulary, code FROM mapping_codes WHERE mapping_id > ? AND code != ''",
+                    (self.last_id,)):
+                codes.setdefault(mapping_id, set()).add(((vocabulary or '').upper(), code.upper()))
+        finally:
+            conn.commit()
+
+        for mapping_id, term_id, user_id, category in rows:
+            self._add(term_id, category, user_id, frozenset(codes.get(mapping_id, ())))
+            self.last_id = mapping_id
+
+    def _summary(self, stats, label_totals):
+        """Agreement figures for a set of term rows (terms with a single rater are ignored)"""
+        stats = stats[stats[:, self.RATERS] >= 2]
+        n = stats[:, self.RATERS]
+        pairs = n * (n - 1) / 2
+        total_pairs = pairs.sum()
+        if total_pairs == 0:
+            return {'terms': 0, 'ratings': 0, 'exact_agreement': None, 'overlap': None,
+                    'no_code_agreement': None, 'kappa': None, 'no_code_kappa': None}
+        k = stats[:, self.NOCODE]
+        p_i = (stats[:, self.SUMSQ] - n) / (n * (n - 1))
+        no_code_p_i = (k * k + (n - k) * (n - k) - n) / (n * (n - 1))
+        return {
+            'terms': int(len(stats)),
+            'ratings': int(n.sum()),
+            'exact_agreement': float((stats[:, self.SUMSQ] - n).sum() / 2 / total_pairs),
+            'overlap': float(stats[:, self.OVERLAP].sum() / total_pairs),
+            'no_code_agreement': float((k * (k - 1) / 2 + (n - k) * (n - k - 1) / 2).sum() / total_pairs),
+            'kappa': _fleiss_kappa(float(p_i.mean()), label_totals),
+            'no_code_kappa': _fleiss_kappa(float(no_code_p_i.mean()), [k.sum(), (n - k).sum()])
+        }
+
+    def snapshot(self, conn, max_pairs=20):
+        """Catch up and return overall, per-category and per-rater-pair agreement"""
+        with self._lock:
+            self.refresh(conn)
+            used = len(self.slots)
+            stats = self.term_stats[:used]
+            term_category = self.term_category[:used]
+
+            overall_totals = {}
+            for totals in self.label_totals.values():
+                for label, count in totals.items():
+                    overall_totals[label] = overall_totals.get(label, 0) + count
+            overall = self._summary(stats, list(overall_totals.values()))
+
+            categories = []
+            for category, index in sorted(self.category_index.items()):
+                summary = self._summary(stats[term_category == index],
+                                        list(self.label_totals.get(index, {}).values()))
+                if summary['terms']:
+                    categories.append({'category': category, **summary})
+
+            # Cohen's kappa for every rater pair, vectorized over the pairs
+            keys = list(self.pairs)
+            shared = np.array([self.pairs[key][0] for key in keys], dtype=float)
+            agree = np.array([self.pairs[key][1] for key in keys], dtype=float)
+            expected = np.array([self.pairs[key][4] for key in keys], dtype=float)
+            pairs = []
+            if keys:
+                p_o = agree / shared
+                p_e = expected / (shared * shared)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    kappa = np.where(p_e < 1.0, (p_o - p_e) / (1.0 - p_e), np.nan)
+                for i in np.argsort(-shared, kind='stable')[:max_pairs]:
+                    pairs.append({'users': keys[i], 'shared': int(shared[i]), 'agreement': float(p_o[i]),
+                                  'kappa': None if np.isnan(kappa[i]) else float(kappa[i])})
+
+        if pairs:
+            ids = sorted({user_id for pair in pairs for user_id in pair['users']})
+            names = dict(conn.execute(f"SELECT id, username FROM users WHERE id IN ({','.join('?' * len(ids))})", ids).fetchall())
+            for pair in pairs:
+                pair['rater_a'], pair['rater_b'] = (names.get(user_id, f'#{user_id}') for user_id in pair['users'])
+
+        return {'overall': overall, 'categories': categories, 'pairs': pairs, 'rater_pairs': len(keys)}
+
+agreement_engine = AgreementEngine()
+
+def get_agreement():
+    """Current inter-rater agreement figures"""
+    conn = get_db()
+    try:
+        return agreement_engine.snapshot(conn)
+    finally:
+        conn.close()
+
+def get_admin_stats():
+    """Get statistics shown in the admin console"""
+    conn = get_db()
+    c = conn.cursor()
+
+    c.execute('SELECT COUNT(*) FROM terms WHERE retired_at IS NULL')
+    total_terms = c.fetchone()[0]
+
+    c.execute('SELECT COUNT(*) FROM terms WHERE retired_at IS NOT NULL')
+    retired_terms = c.fetchone()[0]
+
+    c.execute('SELECT COUNT(*) FROM mappings')
+    total_mappings = c.fetchone()[0]
+
+    c.execute('SELECT COUNT(*) FROM users')
+    total_users = c.fetchone()[0]
+
+    c.execute('SELECT COUNT(*) FROM contact_messages')
+    total_messages = c.fetchone()[0]
+
+    c.execute('SELECT COUNT(*) FROM contact_messages WHERE read = 0')
+    unread_messages = c.fetchone()[0]
+
+    c.execute('SELECT username FROM users ORDER BY username')
+    users = [row[0] for row in c.fetchall()]
+
+    c.execute('SELECT DISTINCT category FROM terms ORDER BY category')
+    categories = [row[0] for row in c.fetchall()]
+
+    c.execute("SELECT vocabulary, COUNT(*) FROM mapping_codes WHERE code != '' GROUP BY vocabulary ORDER BY COUNT(*) DESC")
+    vocabulary_counts = [(row[0], row[1]) for row in c.fetchall()]
+
+    c.execute('SELECT vocabulary, COUNT(*) FROM mapping_codes WHERE is_valid = 0 GROUP BY vocabulary')
+    invalid_codes = {row[0]: row[1] for row in c.fetchall()}
+
+    c.execute('SELECT COUNT(*) FROM mapping_codes WHERE validator_version IS NULL OR validator_version < ?',
+              (VALIDATOR_VERSION,))
+    unvalidated_codes = c.fetchone()[0]
+
+    conn.close()
+    return {
+        'total_terms': total_terms,
+        'retired_terms': retired_terms,
+        'total_mappings': total_mappings,
+        'total_users': total_users,
+        'total_messages': total_messages,
+        'unread_messages': unread_messages,
+        'users': users,
+        'categories': categories,
+        'vocabulary_counts': vocabulary_counts,
+        'invalid_codes': invalid_codes,
+        'unvalidated_codes': unvalidated_codes,
+        'pool_stats': db_pool.stats()
+    }
+
+EXPORT_CHUNK_ROWS = 1000
+
+class MappingExport:
+    """Chunked export cursor that keeps one pooled connection until exhausted or closed"""
+
+    def __init__(self, category=None, username=None, date_from=None, date_to=None, expand=False):
+        conditions = []
+        self.params = []
+        if category:
+            conditions.append('t.category = ?')
+            self.params.append(category)
+        if username:
+            conditions.append('u.username = ?')
+            self.params.append(username)
+        if date_from:
+            conditions.append('m.created_at >= ?')
+            self.params.append(date_from.isoformat())
+        if date_to:
+            # Inclusive end date: everything before the following midnight
+            conditions.append('m.created_at < ?')
+            self.params.append((date_to + timedelta(days=1)).isoformat())
+        where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+        if expand:
+            # One row per code; mappings without codes still appear once
+            self.sql = f'''
+                SELECT u.username, t.category, t.term, mc.code, mc.vocabulary, mc.exact_match, mc.display_text,
+                       mc.normalized_code, mc.is_valid, m.no_code_found, m.propose_new, m.comment, m.created_at
+                FROM mappings m
+                JOIN users u ON m.user_id = u.id
+                JOIN terms t ON m.term_id = t.id
+                LEFT JOIN mapping_codes mc ON mc.mapping_id = m.id
+                {where}
+                ORDER BY m.created_at DESC, m.id DESC, mc.position
+            '''
+        else:
+            self.sql = f'''
+                SELECT u.username, t.category, t.term, m.codes, m.display_texts, m.no_code_found, m.propose_new, m.comment, m.created_at
+                FROM mappings m
+                JOIN users u ON m.user_id = u.id
+                JOIN terms t ON m.term_id = t.id
+                {where}
+                ORDER BY m.created_at DESC, m.id DESC
+            '''
+        self.conn = None
+        self.cursor = None
+        self.done = False
+        self._lock = threading.Lock()
+
+    def fetch(self, size=EXPORT_CHUNK_ROWS):
+        """Return the next chunk of rows, an empty list once the export is exhausted"""
+        with self._lock:
+            if self.done:
+                return []
+            if self.conn is None:
+                # Not get_db(): the connection must outlive this run_db() call
+                self.conn = db_pool.acquire(timeout=DB_QUERY_TIMEOUT)
+                _apply_deadline(self.conn)
+                self.cursor = self.conn.execute(self.sql, self.params)
+            else:
+                _apply_deadline(self.conn)
+            rows = self.cursor.fetchmany(size)
+            if len(rows) < size:
+                self._close()
+            return rows
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        self.done = True
+        if self.conn is not None:
+            self.cursor.close()
+            self.conn.close()
+            self.conn = None
+
+EXPORT_COLUMNS = ['Username', 'Category', 'Term', 'Codes', 'Display Texts', 'No Code Found', 'Propose New', 'Comment', 'Created At']
+EXPORT_CODE_COLUMNS = ['username', 'category', 'term', 'code', 'vocabulary', 'exact_match', 'display_text',
+                       'normalized_code', 'is_valid', 'no_code_found', 'propose_new', 'comment', 'created_at']
+
+def encode_export_chunk(rows, fmt, expand):
+    """Encode a chunk of export rows as CSV or NDJSON text"""
+    output = io.StringIO()
+    if fmt == 'ndjson':
+        for row in rows:
+            record = dict(row)
+            if expand:
+                for key in ('exact_match', 'is_valid'):
+                    if record[key] is not None:
+                        record[key] = bool(record[key])
+            else:
+                record['codes'] = json.loads(record['codes'] or '[]')
+                record['display_texts'] = json.loads(record['display_texts'] or '[]')
+            record['no_code_found'] = bool(record['no_code_found'])
+            record['propose_new'] = bool(record['propose_new'])
+            output.write(json.dumps(record, ensure_ascii=False))
+            output.write('\n')
+    else:
+        writer = csv.writer(output)
+        writer.writerows(rows)
+    return output.getvalue()
+
+def get_terms_for_code(vocabulary, code):
+    """Terms mapped to the given code, with the number of raters who chose it"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('''
+        SELECT t.id, t.category, t.term, COUNT(DISTINCT mc.user_id) as raters
+        FROM mapping_codes mc
+        JOIN terms t ON t.id = mc.term_id
+        WHERE mc.vocabulary = ? AND mc.code = ?
+        GROUP BY t.id
+        ORDER BY raters DESC, t.id
+    ''', (vocabulary, code))
+    rows = [dict(row) for row in c.fetchall()]
+    conn.close()
+    return rows
+
+# Local terminology index (separate SQLite file, filled by 'python main.py load-terminology')
+TERMINOLOGY_VOCABULARIES = {'snomed': 'SNOMED', 'icd10gm': 'ICD10', 'loinc': 'LOINC'}
+SNOMED_FSN_TYPE = '900000000000003001'
+SNOMED_PREFERRED = '900000000000548007'
+TERMINOLOGY_PROGRESS_ROWS = 100000
+
+def init_terminology_db(conn):
+    """Create the terminology index schema if it does not exist yet"""
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS descriptions (
+            id INTEGER PRIMARY KEY,
+            vocabulary TEXT NOT NULL,
+            code TEXT NOT NULL,
+            term TEXT NOT NULL,
+            preferred INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_descriptions_concept ON descriptions(vocabulary, code);
+        CREATE TABLE IF NOT EXISTS concepts (
+            vocabulary TEXT NOT NULL,
+            code TEXT NOT NULL,
+            display TEXT NOT NULL,
+            PRIMARY KEY (vocabulary, code)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_concepts_code ON concepts(code);
+        CREATE VIRTUAL TABLE IF NOT EXISTS description_search USING fts5(
+            term, vocabulary, content='descriptions', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        );
+        CREATE TABLE IF NOT EXISTS releases (
+            vocabulary TEXT PRIMARY KEY,
+            source TEXT NOT NULL,
+            concepts INTEGER NOT NULL,
+            descriptions INTEGER NOT NULL,
+            loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+
+def _read_release(path, encoding, delimiter, header=True):
+    """Yield the rows of a release file one at a time (as dicts if it has a header)"""
+    with open(path, 'r', encoding=encoding, newline='') as f:
+        if delimiter == '\t':
+            # RF2 files are plain tab-separated text without quoting
+            reader = csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
+        else:
+            reader = csv.reader(f, delimiter=delimiter)
+        if not header:
+            yield from reader
+            return
+        columns = next(reader, None) or []
+        for row in reader:
+            yield dict(zip(columns, row))
+
+def _snomed_descriptions(path, encoding):
+    """(description id, concept id, term, type id) of the active descriptions of an RF2 description file"""
+    for row in _read_release(path, encoding, '\t'):
+        if row.get('active') == '1':
+            yield row['id'], row['conceptId'], row['term'], row['typeId']
+
+def _loinc_descriptions(path, encoding):
+    """(code, term, preferred) from Loinc.csv or the parts file Part.csv"""
+    for row in _read_release(path, encoding, ','):
+        if 'LOINC_NUM' in row:
+            if row.get('STATUS') == 'DEPRECATED':
+                continue
+            code, display, other = row['LOINC_NUM'], row.get('LONG_COMMON_NAME'), row.get('SHORTNAME')
+        elif 'PartNumber' in row:
+            if row.get('Status', 'ACTIVE') != 'ACTIVE':
+                continue
+            code, display, other = row['PartNumber'], row.get('PartDisplayName'), row.get('PartName')
+        else:
+            raise ValueError("Not a LOINC table: expected a LOINC_NUM or PartNumber column")
+        if display:
+            yield code, display, 1
+        if other and other != display:
+            yield code, other, 0
+
+def _icd10gm_descriptions(path, encoding):
+    """(code, title, preferred) from the ICD-10-GM classification file ...syst_kodes.txt"""
+    for row in _read_release(path, encoding, ';', header=False):
+        # Field 7 is the code without dagger/asterisk marks, field 9 the class title
+        if len(row) < 9:
+            raise ValueError(f"Not an ICD-10-GM codes file: expected at least 9 fields, got {len(row)}")
+        yield row[6], row[8], 1
+
+def _tsv_descriptions(path, encoding):
+    """(code, display, preferred) from a headerless 'code<TAB>display' file"""
+    for row in _read_release(path, encoding, '\t', header=False):
+        if len(row) >= 2 and row[0] and row[1]:
+            yield row[0], row[1], 1
+
+def _count_rows(rows, counter, label):
+    """Pass rows through while counting them and printing progress"""
+    for row in rows:
+        counter[0] += 1
+        if counter[0] % TERMINOLOGY_PROGRESS_ROWS == 0:
+            print(f"  {label}: {counter[0]:,} rows")
+        yield row
+
+def load_terminology(conn, fmt, path, vocabulary=None, encoding='utf-8', concepts_path=None, refset_path=None):
+    """Replace one vocabulary of the terminology index with the entries of a release file
+
+    Rows are streamed from the file straight into executemany(), so memory use does
+    not depend on the file size. SNOMED CT takes an RF2 description snapshot, plus
+    optionally the concept snapshot (to drop inactive concepts) and a language refset
+    (to use the preferred synonym instead of the FSN as display text).
+    """
+    vocabulary = vocabulary or TERMINOLOGY_VOCABULARIES[fmt]
+    counter = [0]
+    c = conn.cursor()
+    try:
+        c.execute('BEGIN IMMEDIATE')
+        # Take the vocabulary's old rows out of the external-content FTS index before deleting them
+        c.execute('''INSERT INTO description_search (description_search, rowid, term, vocabulary)
+                     SELECT 'delete', id, term, vocabulary FROM descriptions WHERE vocabulary = ?''', (vocabulary,))
+        c.execute('DELETE FROM descriptions WHERE vocabulary = ?', (vocabulary,))
+        c.execute('DELETE FROM concepts WHERE vocabulary = ?', (vocabulary,))
+
+        if fmt == 'snomed':
+            c.execute('CREATE TEMP TABLE snomed_inactive (id TEXT PRIMARY KEY) WITHOUT ROWID')
+            c.execute('CREATE TEMP TABLE snomed_preferred (id TEXT PRIMARY KEY) WITHOUT ROWID')
+            if concepts_path:
+                c.executemany('INSERT OR IGNORE INTO snomed_inactive VALUES (?)',
+                              ((row['id'],) for row in _read_release(concepts_path, encoding, '\t')
+                               if row.get('active') != '1'))
+            if refset_path:
+                c.executemany('INSERT OR IGNORE INTO snomed_preferred VALUES (?)',
+                              ((row['referencedComponentId'],) for row in _read_release(refset_path, encoding, '\t')
+                               if row.get('active') == '1' and row.get('acceptabilityId') == SNOMED_PREFERRED))
+            # FSNs are the display text unless the refset names a preferred synonym
+            c.executemany(f'''INSERT INTO descriptions (vocabulary, code, term, preferred)
+                SELECT ?1, ?3, ?4, CASE
+                    WHEN ?5 = '{SNOMED_FSN_TYPE}' THEN 1
+                    WHEN EXISTS (SELECT 1 FROM snomed_preferred WHERE id = ?2) THEN 2 ELSE 0 END
+                WHERE NOT EXISTS (SELECT 1 FROM snomed_inactive WHERE id = ?3)''',
+                ((vocabulary, *row) for row in _count_rows(_snomed_descriptions(path, encoding), counter, vocabulary)))
+            c.execute('DROP TABLE temp.snomed_inactive')
+            c.execute('DROP TABLE temp.snomed_preferred')
+        else:
+            readers = {'loinc': _loinc_descriptions, 'icd10gm': _icd10gm_descriptions, 'tsv': _tsv_descriptions}
+            c.executemany('INSERT INTO descriptions (vocabulary, code, term, preferred) VALUES (?, ?, ?, ?)',
+                          ((vocabulary, *row) for row in _count_rows(readers[fmt](path, encoding), counter, vocabulary)))
+
+        # One display text per concept: the row with the highest preferred rank
+        c.execute('''INSERT INTO concepts (vocabulary, code, display)
+                     SELECT vocabulary, code, term FROM (
+                         SELECT vocabulary, code, term, MAX(preferred) FROM descriptions
+                         WHERE vocabulary = ? GROUP BY code
+                     )''', (vocabulary,))
+        concept_count = c.rowcount
+        description_count = c.execute('SELECT COUNT(*) FROM descriptions WHERE vocabulary = ?', (vocabulary,)).fetchone()[0]
+        c.execute('''INSERT INTO description_search (rowid, term, vocabulary)
+                     SELECT id, term, vocabulary FROM descriptions WHERE vocabulary = ?''', (vocabulary,))
+        c.execute('''INSERT OR REPLACE INTO releases (vocabulary, source, concepts, descriptions)
+                     VALUES (?, ?, ?, ?)''', (vocabulary, os.path.basename(path), concept_count, description_count))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    c.execute("INSERT INTO description_search (description_search) VALUES ('optimize')")
+    conn.commit()
+    return {'vocabulary': vocabulary, 'concepts': concept_count, 'descriptions': description_count}
+
+terminology_pool = ConnectionPool(TERMINOLOGY_DATABASE, DB_THREADS,
+                                  {'query_only': 1, 'mmap_size': TERMINOLOGY_MMAP_MB * 1024 * 1024},
+                                  DB_STATEMENT_CACHE)
+
+def _fts_prefix_query(text, vocabulary=None):
+    """FTS5 query matching every word of text as a prefix, or None if text has no words"""
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    query = 'term : (' + ' '.join('"' + word + '"*' for word in words) + ')'
+    if vocabulary:
+        # Filtering inside the index keeps the ranked candidates within the vocabulary
+        query += ' AND vocabulary : "' + vocabulary.replace('"', '""') + '"'
+    return query
+
+def search_terminology(query, vocabulary=None, limit=TERMINOLOGY_SEARCH_LIMIT):
+    """Concepts whose code starts with query or whose descriptions match all its words as prefixes"""
+    query = query.strip()
+    if len(query) < TERMINOLOGY_MIN_QUERY or not os.path.exists(TERMINOLOGY_DATABASE):
+        return []
+    conn = terminology_pool.acquire(timeout=DB_QUERY_TIMEOUT)
+    _apply_deadline(conn)
+    try:
+        results = []
+        seen = set()
+        vocab_filter = 'AND vocabulary = ?' if vocabulary else ''
+        vocab_args = (vocabulary,) if vocabulary else ()
+
+        # Codes are matched first, case-insensitively, when the input looks like one
+        if ' ' not in query and any(ch.isdigit() for ch in query):
+            code = query.upper()
+            for row in conn.execute(f'''SELECT vocabulary, code, display FROM concepts
+                                        WHERE code >= ? AND code < ? {vocab_filter}
+                                        ORDER BY length(code), code LIMIT ?''',
+                                    (code, code + '\uffff', *vocab_args, limit)):
+                seen.add((row['vocabulary'], row['code']))
+                results.append({**dict(row), 'matched': row['code'], 'exact': row['code'] == code})
+
+        fts_query = _fts_prefix_query(query, vocabulary)
+        if fts_query and len(results) < limit:
+            # Ranking every hit of a short prefix like "di" takes far too long, so only the first
+            # candidates are scored; several descriptions of a concept can match, keep the best one
+            rows = conn.execute(f'''SELECT d.vocabulary, d.code, d.term, c.display
+                FROM (SELECT rowid, bm25(description_search) AS score FROM description_search
+                      WHERE description_search MATCH ? LIMIT ?) s
+                JOIN descriptions d ON d.id = s.rowid
+                JOIN concepts c ON c.vocabulary = d.vocabulary AND c.code = d.code
+                ORDER BY s.score, length(d.term) LIMIT ?''',
+                (fts_query, TERMINOLOGY_CANDIDATES, limit * 4))
+            for row in rows:
+                key = (row['vocabulary'], row['code'])
+                if key in seen:
+                    continue
+                seen.add(key)
+                results.append({'vocabulary': row['vocabulary'], 'code': row['code'], 'display': row['display'],
+                                'matched': row['term'], 'exact': False})
+                if len(results) >= limit:
+                    break
+        return results[:limit]
+    finally:
+        conn.close()
+
+def get_terminology_releases():
+    """Vocabularies loaded into the terminology index"""
+    if not os.path.exists(TERMINOLOGY_DATABASE):
+        return []
+    conn = terminology_pool.acquire(timeout=DB_QUERY_TIMEOUT)
+    _apply_deadline(conn)
+    try:
+        return [dict(row) for row in conn.execute('SELECT * FROM releases ORDER BY vocabulary')]
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+
+def clear_database(c, include_terms=False):
+    """Delete all mappings, sessions and users, optionally also all terms (caller commits)"""
+    c.execute('DELETE FROM mapping_codes')
+    c.execute('DELETE FROM mappings')
+    c.execute('DELETE FROM term_leases')
+    c.execute('DELETE FROM sessions')
+    c.execute('DELETE FROM users')
+    if include_terms:
+        c.execute('DELETE FROM terms')
+
+def reset_database(include_terms=False):
+    """Delete all mappings, sessions and users, optionally also all terms"""
+    conn = get_db()
+    clear_database(conn.cursor(), include_terms)
+    conn.commit()
+    conn.close()
+    term_assigner.invalidate()
+    term_similarity.invalidate()
+
+def delete_user_mappings(username):
+    """Delete all mappings of a user, returns False if the user does not exist"""
     conn = get_db()
     c = conn.cursor()
 
-    # Total terms
-    c.execute('SELECT COUNT(*) FROM terms')
-    total_terms = c.fetchone()[0]
+    # Get user ID
+    c.execute('SELECT id FROM users WHERE username = ?', (username,))
+    user = c.fetchone()
 
-    # Terms this user has mapped
-    c.execute('SELECT COUNT(DISTINCT term_id) FROM mappings WHERE user_id = ?', (user_id,))
-    user_mapped_terms = c.fetchone()[0]
+    if user:
+        c.execute('DELETE FROM mappings WHERE user_id = ?', (user[0],))
+        conn.commit()
+        term_assigner.invalidate()
+        term_similarity.invalidate()
 
-    # Terms remaining for this user
-    remaining_terms = total_terms - user_mapped_terms
+    conn.close()
+    return user is not None
+
+def get_contact_messages():
+    """Get all contact messages, newest first"""
+    conn = get_db()
+    c = conn.cursor()
+
+    c.execute('''SELECT m.id, m.name, m.email, m.subject, m.message, m.created_at, m.read,
+                        o.status as email_status, o.attempts as email_attempts, o.last_error as email_error
+                 FROM contact_messages m
+                 LEFT JOIN email_outbox o ON o.contact_message_id = m.id
+                 ORDER BY m.created_at DESC''')
+    messages = [dict(row) for row in c.fetchall()]
 
     conn.close()
-    return {
-        'total_terms': total_terms,
-        'mapped_terms': user_mapped_terms,
-        'remaining_terms': remaining_terms,
-        'percentage': round((user_mapped_terms / total_terms * 100) if total_terms > 0 else 0, 1)
-    }
+    return messages
 
-def get_leaderboard(limit=10):
-    """Get top users by total mappings"""
+def mark_contact_message_read(message_id):
+    """Mark a contact message as read"""
     conn = get_db()
     c = conn.cursor()
+    c.execute('UPDATE contact_messages SET read = 1 WHERE id = ?', (message_id,))
+    conn.commit()
+    conn.close()
 
-    c.execute('''
-        SELECT u.username, COUNT(m.id) as mappings_count
-        FROM users u
-        LEFT JOIN mappings m ON u.id = m.user_id
-        GROUP BY u.id
-        ORDER BY mappings_count DESC
-        LIMIT ?
-    ''', (limit,))
+def delete_contact_message(message_id):
+    """Delete a contact message"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('DELETE FROM contact_messages WHERE id = ?', (message_id,))
+    conn.commit()
+    conn.close()
 
-    leaderboard = [dict(row) for row in c.fetchall()]
+def store_contact_message(name, email, subject, message, store=True, send_email=False):
+    """Store a contact form submission and/or queue its notification email in one transaction"""
+    conn = get_db()
+    c = conn.cursor()
+    contact_message_id = None
+    if store:
+        c.execute('''INSERT INTO contact_messages (name, email, subject, message) 
+                     VALUES (?, ?, ?, ?)''',
+                  (name, email, subject, message))
+        contact_message_id = c.lastrowid
+    if send_email:
+        queue_email(c, build_contact_email(name, email, subject, message), [CONTACT_CONFIG['email']],
+                    contact_message_id)
+    conn.commit()
     conn.close()
-    return leaderboard
 
 @app.on_event("startup")
 async def startup_event():
     init_db()
     import_terms_from_csv()
+    refresh_term_similarity()
+    static_assets.build()
+    page_cache.prerender()
+    app.state.session_purger = asyncio.create_task(purge_sessions_periodically())
+    mapping_writer.start()
+    app.state.outbox_worker = None
+    app.state.code_validation = None
+    if CONTACT_CONFIG.get('send_email', False):
+        app.state.outbox_worker = asyncio.create_task(deliver_outbox_periodically())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.session_purger.cancel()
+    if app.state.outbox_worker:
+        app.state.outbox_worker.cancel()
+        try:
+            await app.state.outbox_worker
+        except asyncio.CancelledError:
+            pass
+    if app.state.code_validation and not app.state.code_validation.done():
+        app.state.code_validation.cancel()
+        try:
+            await app.state.code_validation
+        except asyncio.CancelledError:
+            pass
+    await mapping_writer.stop()
+    email_executor.shutdown(wait=True)
+    db_executor.shutdown(wait=True)
+    db_pool.close_all()
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
@@ -556,10 +3478,7 @@ async def index(request: Request):
 @app.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request):
     """Login page"""
-    return templates.TemplateResponse("login.html", {
-        "request": request,
-        "required_raters": REQUIRED_RATERS
-    })
+    return page_cache.response(request, 'login')
 
 @app.post("/login")
 async def login(request: Request, username: str = Form(...), password: str = Form(...)):
@@ -573,23 +3492,9 @@ async def login(request: Request, username: str = Form(...), password: str = For
         return templates.TemplateResponse("login.html",
             {"request": request, "error": "Invalid password"})
 
-    conn = get_db()
-    c = conn.cursor()
-
-    # Check if user exists
-    c.execute('SELECT id FROM users WHERE username = ?', (username,))
-    user = c.fetchone()
-
-    if user:
-        user_id = user[0]
-    else:
-        # Create new user
-        c.execute('INSERT INTO users (username) VALUES (?)', (username,))
-        user_id = c.lastrowid
-        conn.commit()
-
-    conn.close()
+    user_id = await run_db(get_or_create_user, username)
 
+    ServerSessionMiddleware.rotate(request)
     request.session['user_id'] = user_id
     request.session['username'] = username
     return RedirectResponse(url="/dashboard", status_code=302)
@@ -607,10 +3512,19 @@ async def dashboard(request: Request):
     if not user:
         return RedirectResponse(url="/login", status_code=302)
 
-    user_stats = get_user_stats(user['user_id'])
-    overall_progress = get_overall_progress()
-    user_progress = get_user_progress(user['user_id'])
-    leaderboard = get_leaderboard()
+    # Global aggregates are shared by all users until the next write to the database
+    version = await run_db(aggregate_cache.data_version)
+    user_stats, overall_progress, user_progress, leaderboard, total_users = await asyncio.gather(
+        aggregate_cache.get(('user_stats', user['user_id']), get_user_stats, user['user_id'],
+                            ttl=aggregate_cache.user_ttl),
+        aggregate_cache.get('overall_progress', get_overall_progress, version=version),
+        aggregate_cache.get(('user_progress', user['user_id']), get_user_progress, user['user_id'],
+                            ttl=aggregate_cache.user_ttl),
+        aggregate_cache.get('leaderboard', get_leaderboard, version=version),
+        # Only shown as "of N raters", so a count that is a few seconds old is fine
+        aggregate_cache.get('user_count', count_users, ttl=aggregate_cache.user_ttl)
+    )
+    my_rank = await run_db(get_user_rank, user['user_id'], total_users)
 
     return templates.TemplateResponse("dashboard.html", {
         "request": request,
@@ -619,6 +3533,7 @@ async def dashboard(request: Request):
         "progress": overall_progress,
         "user_progress": user_progress,
         "leaderboard": leaderboard,
+        "my_rank": my_rank,
         "required_raters": REQUIRED_RATERS
     })
 
@@ -630,16 +3545,13 @@ async def start_session(request: Request, count: int = Form(15)):
         return RedirectResponse(url="/login", status_code=302)
 
     # Create session
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('INSERT INTO sessions (user_id, terms_count) VALUES (?, ?)',
-              (user['user_id'], count))
-    session_id = c.lastrowid
-    conn.commit()
-    conn.close()
+    session_id = await run_db(create_session, user['user_id'], count)
+    aggregate_cache.invalidate_user(user['user_id'])
 
     request.session['current_session'] = session_id
-    request.session['session_terms'] = get_terms_for_session(count, user['user_id'])
+    # Only term ids are kept in the session, they are resolved against the terms table
+    terms = await run_db(get_terms_for_session, count, user['user_id'], session_id)
+    request.session['session_terms'] = [term['id'] for term in terms]
     request.session['current_index'] = 0
 
     return RedirectResponse(url="/session", status_code=302)
@@ -668,7 +3580,11 @@ async def mapping_session(request: Request, index: int = None):
     if current_index >= len(session_terms):
         return RedirectResponse(url="/session/complete", status_code=302)
 
-    current_term = session_terms[current_index]
+    current_term = await run_db(get_term, session_terms[current_index])
+    if current_term is None:
+        # Term was removed by an admin reset while the session was open
+        return RedirectResponse(url="/dashboard", status_code=302)
+    similar_terms = await run_db(get_similar_mapped_terms, current_term['id'], current_term['term'], user['user_id'])
     progress_percent = round((current_index / len(session_terms)) * 100)
 
     return templates.TemplateResponse("session.html", {
@@ -677,6 +3593,7 @@ async def mapping_session(request: Request, index: int = None):
         "current": current_index + 1,
         "total": len(session_terms),
         "progress": progress_percent,
+        "similar_terms": similar_terms,
         "required_raters": REQUIRED_RATERS
     })
 
@@ -700,20 +3617,12 @@ async def submit_mapping(
     if not session_terms or current_index is None or current_index >= len(session_terms):
         return RedirectResponse(url="/dashboard", status_code=302)
 
-    term_id = session_terms[current_index]['id']
+    term_id = session_terms[current_index]
 
-    # Save mapping (with error handling for duplicates)
-    conn = get_db()
-    c = conn.cursor()
-    try:
-        c.execute('INSERT INTO mappings (term_id, user_id, codes, display_texts, no_code_found, propose_new, comment) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                  (term_id, user['user_id'], codes_json, display_texts_json, no_code_found, propose_new, comment.strip() if comment else None))
-        conn.commit()
-    except sqlite3.IntegrityError:
-        # User already rated this term - skip it
-        pass
-    finally:
-        conn.close()
+    # Save mapping (duplicates are skipped if the user already rated this term)
+    await mapping_writer.submit(term_id, user['user_id'], codes_json, display_texts_json,
+                                no_code_found, propose_new, comment.strip() if comment else None)
+    aggregate_cache.invalidate_user(user['user_id'])
 
     # Move to next term
     next_index = current_index + 1
@@ -722,6 +3631,76 @@ async def submit_mapping(
     # Redirect to specific index to enable browser back/forward navigation
     return RedirectResponse(url=f"/session?index={next_index}", status_code=302)
 
+class MappingSubmission(BaseModel):
+    """One mapping sent by the session page through the JSON API"""
+    term_id: int
+    index: int
+    codes: list = []
+    display_texts: list = []
+    no_code_found: bool = False
+    propose_new: bool = False
+    comment: str = ''
+
+@app.get("/api/session")
+async def api_session(request: Request):
+    """All terms of the active session, so the page can move between terms without reloading"""
+    user = get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401)
+
+    session_terms = request.session.get('session_terms')
+    current_index = request.session.get('current_index')
+    if not session_terms or current_index is None:
+        raise HTTPException(status_code=404, detail="No active session")
+
+    terms = await run_db(get_session_batch, session_terms, user['user_id'])
+    return {
+        "terms": terms,
+        "current_index": current_index,
+        "total": len(session_terms),
+        "required_raters": REQUIRED_RATERS
+    }
+
+@app.post("/api/session/submit")
+async def api_submit_mapping(request: Request, submission: MappingSubmission):
+    """Submit a mapping for a term of the active session, the JSON counterpart of /session/submit"""
+    user = get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401)
+
+    session_terms = request.session.get('session_terms')
+    if not session_terms or request.session.get('current_index') is None:
+        raise HTTPException(status_code=404, detail="No active session")
+    index = submission.index
+    if not 0 <= index < len(session_terms) or session_terms[index] != submission.term_id:
+        raise HTTPException(status_code=409, detail="Term is not part of the current session")
+
+    # Same storage as the form submit; duplicates are skipped by UNIQUE(term_id, user_id)
+    saved = await mapping_writer.submit(submission.term_id, user['user_id'],
+                                        json.dumps(submission.codes), json.dumps(submission.display_texts),
+                                        submission.no_code_found, submission.propose_new,
+                                        submission.comment.strip() or None)
+    aggregate_cache.invalidate_user(user['user_id'])
+
+    # Submissions may arrive after the rater moved on, so progress only ever advances
+    next_index = index + 1
+    request.session['current_index'] = max(request.session.get('current_index') or 0, next_index)
+    return {
+        "saved": saved,
+        "duplicate": not saved,
+        "next_index": next_index,
+        "complete": request.session['current_index'] >= len(session_terms)
+    }
+
+@app.get("/api/codes/search")
+async def search_codes(request: Request, q: str = "", vocabulary: str = "", limit: int = TERMINOLOGY_SEARCH_LIMIT):
+    """Autocomplete for the code and display text inputs, backed by the local terminology index"""
+    if not get_current_user(request):
+        raise HTTPException(status_code=401)
+    limit = max(1, min(limit, 50))
+    results = await run_db(search_terminology, q, vocabulary or None, limit)
+    return {"query": q, "results": results}
+
 @app.get("/session/complete", response_class=HTMLResponse)
 async def complete_session(request: Request):
     """Complete current session"""
@@ -734,18 +3713,8 @@ async def complete_session(request: Request):
         return RedirectResponse(url="/dashboard", status_code=302)
 
     # Mark session as completed
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('UPDATE sessions SET completed_at = CURRENT_TIMESTAMP WHERE id = ?',
-              (current_session,))
-
-    # Get session stats
-    c.execute('SELECT COUNT(*) FROM mappings WHERE user_id = ? AND created_at > (SELECT started_at FROM sessions WHERE id = ?)',
-              (user['user_id'], current_session))
-    mappings_count = c.fetchone()[0]
-
-    conn.commit()
-    conn.close()
+    mappings_count = await run_db(finish_session, user['user_id'], current_session)
+    aggregate_cache.invalidate_user(user['user_id'])
 
     # Clear session data
     request.session.pop('current_session', None)
@@ -773,85 +3742,117 @@ async def admin_login(request: Request, password: str = Form(...)):
         return templates.TemplateResponse("admin_login.html",
             {"request": request, "error": "Invalid admin password"})
 
+    ServerSessionMiddleware.rotate(request)
     request.session['admin_logged_in'] = True
     return RedirectResponse(url="/admin/console", status_code=302)
 
 @app.get("/admin/console", response_class=HTMLResponse)
-async def admin_console(request: Request):
+async def admin_console(request: Request, vocabulary: str = "", code: str = "", q: str = ""):
     """Admin console dashboard"""
     if not request.session.get('admin_logged_in'):
         return RedirectResponse(url="/admin", status_code=302)
 
     # Get statistics
-    conn = get_db()
-    c = conn.cursor()
-
-    c.execute('SELECT COUNT(*) FROM terms')
-    total_terms = c.fetchone()[0]
-
-    c.execute('SELECT COUNT(*) FROM mappings')
-    total_mappings = c.fetchone()[0]
-
-    c.execute('SELECT COUNT(*) FROM users')
-    total_users = c.fetchone()[0]
+    stats = await run_db(get_admin_stats)
 
-    c.execute('SELECT COUNT(*) FROM contact_messages')
-    total_messages = c.fetchone()[0]
+    agreement = await run_db(get_agreement, timeout=DB_ADMIN_TIMEOUT)
 
-    c.execute('SELECT COUNT(*) FROM contact_messages WHERE read = 0')
-    unread_messages = c.fetchone()[0]
+    # Optional lookup of the terms mapped to one code
+    code_matches = None
+    if vocabulary and code.strip():
+        code_matches = await run_db(get_terms_for_code, vocabulary, code.strip())
 
-    c.execute('SELECT username FROM users ORDER BY username')
-    users = [row[0] for row in c.fetchall()]
+    catalogue_matches = None
+    if q.strip():
+        catalogue_matches = await run_db(search_catalogue, q.strip())
 
-    conn.close()
+    terminology_releases = await run_db(get_terminology_releases)
+    slow_queries = await run_in_threadpool(slow_query_log.top) if SLOW_QUERY_MS else None
 
     return templates.TemplateResponse("admin_console.html", {
         "request": request,
-        "total_terms": total_terms,
-        "total_mappings": total_mappings,
-        "total_users": total_users,
-        "total_messages": total_messages,
-        "unread_messages": unread_messages,
-        "users": users,
+        **stats,
+        "lookup_vocabulary": vocabulary,
+        "lookup_code": code.strip(),
+        "code_matches": code_matches,
+        "catalogue_query": q.strip(),
+        "catalogue_matches": catalogue_matches,
+        "terminology_releases": terminology_releases,
+        "slow_queries": slow_queries,
+        "slow_query_ms": SLOW_QUERY_MS,
+        "code_validation": code_validation.snapshot(),
+        "agreement": agreement,
+        "last_import": import_progress.snapshot(),
         "csv_encoding": DATA_IMPORT_CONFIG['encoding'],
         "csv_delimiter": DATA_IMPORT_CONFIG['delimiter']
     })
 
 @app.get("/admin/export")
-async def export_mappings(request: Request):
-    """Export all mappings as CSV"""
+async def export_mappings(
+    request: Request,
+    format: str = "csv",
+    category: str = "",
+    user: str = "",
+    date_from: str = "",
+    date_to: str = "",
+    expand: Optional[bool] = None,
+    compress: bool = Query(False, alias="gzip")
+):
+    """Stream mappings as CSV or NDJSON, optionally filtered and gzip-compressed"""
     if not request.session.get('admin_logged_in'):
         return RedirectResponse(url="/admin", status_code=302)
 
-    conn = get_db()
-    c = conn.cursor()
-
-    c.execute('''
-        SELECT u.username, t.category, t.term, m.codes, m.display_texts, m.no_code_found, m.propose_new, m.comment, m.created_at
-        FROM mappings m
-        JOIN users u ON m.user_id = u.id
-        JOIN terms t ON m.term_id = t.id
-        ORDER BY m.created_at DESC
-    ''')
-
-    rows = c.fetchall()
-    conn.close()
-
-    # Create CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Username', 'Category', 'Term', 'Codes', 'Display Texts', 'No Code Found', 'Propose New', 'Comment', 'Created At'])
-
-    for row in rows:
-        writer.writerow(row)
-
-    output.seek(0)
+    if format not in ('csv', 'ndjson'):
+        return RedirectResponse(url="/admin/console?error=Unknown export format", status_code=302)
+    try:
+        start = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+        end = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+    except ValueError:
+        return RedirectResponse(url="/admin/console?error=Dates must be given as YYYY-MM-DD", status_code=302)
+    # One row per code is the natural NDJSON shape; CSV keeps the JSON columns unless asked
+    if expand is None:
+        expand = format == 'ndjson'
+
+    export = MappingExport(category=category, username=user, date_from=start, date_to=end, expand=expand)
+
+    async def generate():
+        compressor = zlib.compressobj(wbits=31) if compress else None
+        try:
+            if format == 'csv':
+                header = io.StringIO()
+                csv.writer(header).writerow(EXPORT_CODE_COLUMNS if expand else EXPORT_COLUMNS)
+                chunks = [header.getvalue()]
+            else:
+                chunks = []
+            while True:
+                rows = await run_db(export.fetch, timeout=DB_ADMIN_TIMEOUT)
+                if rows:
+                    chunks.append(encode_export_chunk(rows, format, expand))
+                data = ''.join(chunks).encode('utf-8')
+                chunks = []
+                if compressor:
+                    data = compressor.compress(data)
+                if data:
+                    yield data
+                if not rows or export.done:
+                    break
+            if compressor:
+                yield compressor.flush()
+        finally:
+            # Client went away mid-stream: hand the connection back without awaiting
+            if not export.done:
+                db_executor.submit(export.close)
+
+    filename = f"mappings_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    media_type = "application/x-ndjson" if format == 'ndjson' else "text/csv"
+    if compress:
+        filename += '.gz'
+        media_type = "application/gzip"
 
     return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename=mappings_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"}
+        generate(),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
 @app.post("/admin/reset/mappings")
@@ -860,13 +3861,8 @@ async def reset_mappings(request: Request):
     if not request.session.get('admin_logged_in'):
         return RedirectResponse(url="/admin", status_code=302)
 
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('DELETE FROM mappings')
-    c.execute('DELETE FROM sessions')
-    c.execute('DELETE FROM users')
-    conn.commit()
-    conn.close()
+    await run_db(reset_database, timeout=DB_ADMIN_TIMEOUT)
+    aggregate_cache.clear()
 
     return RedirectResponse(url="/admin/console?message=All mappings and users deleted", status_code=302)
 
@@ -876,19 +3872,15 @@ async def reset_all(request: Request):
     if not request.session.get('admin_logged_in'):
         return RedirectResponse(url="/admin", status_code=302)
 
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('DELETE FROM mappings')
-    c.execute('DELETE FROM sessions')
-    c.execute('DELETE FROM users')
-    c.execute('DELETE FROM terms')
-    conn.commit()
-    conn.close()
-
-    # Re-import terms
-    import_terms_from_csv()
+    # Delete everything and re-import terms in one transaction
+    try:
+        stats = await run_tracked_import(DATA_IMPORT_CONFIG['csv_path'])
+    except (CSVImportError, OSError) as e:
+        return RedirectResponse(url=f"/admin/console?error=Reset failed, nothing was deleted: {e}", status_code=302)
+    finally:
+        aggregate_cache.clear()
 
-    return RedirectResponse(url="/admin/console?message=Database reset and terms re-imported", status_code=302)
+    return RedirectResponse(url=f"/admin/console?message=Database reset and {stats['imported']} terms re-imported", status_code=302)
 
 @app.post("/admin/reset/user")
 async def reset_user_mappings(request: Request, username: str = Form(...)):
@@ -896,90 +3888,119 @@ async def reset_user_mappings(request: Request, username: str = Form(...)):
     if not request.session.get('admin_logged_in'):
         return RedirectResponse(url="/admin", status_code=302)
 
-    conn = get_db()
-    c = conn.cursor()
-
-    # Get user ID
-    c.execute('SELECT id FROM users WHERE username = ?', (username,))
-    user = c.fetchone()
-
-    if user:
-        c.execute('DELETE FROM mappings WHERE user_id = ?', (user[0],))
-        conn.commit()
+    if await run_db(delete_user_mappings, username, timeout=DB_ADMIN_TIMEOUT):
+        aggregate_cache.clear()
         message = f"Mappings deleted for user: {username}"
     else:
         message = f"User not found: {username}"
 
-    conn.close()
-
     return RedirectResponse(url=f"/admin/console?message={message}", status_code=302)
 
+async def run_tracked_import(csv_path, merge=False, dry_run=False):
+    """Replace (or merge) the terms from csv_path, reporting progress to the admin console"""
+    import_progress.start(os.path.getsize(csv_path))
+    try:
+        if merge:
+            stats = await run_db(merge_terms_from_csv, csv_path, dry_run, import_progress, timeout=DB_ADMIN_TIMEOUT)
+        else:
+            stats = await run_db(replace_terms_from_csv, csv_path, import_progress, timeout=DB_ADMIN_TIMEOUT)
+    except Exception as e:
+        import_progress.finish(error=str(e))
+        raise
+    import_progress.finish(stats=stats)
+    if not dry_run:
+        await run_db(refresh_term_similarity, timeout=DB_ADMIN_TIMEOUT)
+    return stats
+
 @app.post("/admin/upload-csv")
-async def upload_csv(request: Request, csv_file: UploadFile = File(...)):
-    """Upload and validate a new CSV file, then re-import terms"""
+async def upload_csv(request: Request):
+    """Upload and validate a new CSV file, then replace or merge the terms"""
     if not request.session.get('admin_logged_in'):
         return RedirectResponse(url="/admin", status_code=302)
 
-    import tempfile
     import shutil
     
-    # Create a temporary file to validate the uploaded CSV
     temp_path = None
     try:
-        # Read the uploaded file
-        content = await csv_file.read()
-        
-        with tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.csv') as temp_file:
-            temp_file.write(content)
-            temp_path = temp_file.name
+        # Stream the upload to disk (the body is parsed here rather than by a Form/File
+        # dependency so size, encoding and header are checked before it is fully received)
+        receiver = CSVUploadReceiver('csv_file', DATA_IMPORT_CONFIG['encoding'], DATA_IMPORT_CONFIG['delimiter'],
+                                     MAX_UPLOAD_BYTES)
+        try:
+            temp_path, fields = await receiver.receive(request)
+        except UploadRejected as e:
+            return RedirectResponse(url=f"/admin/console?error=CSV validation failed: {e}", status_code=302)
+        mode = fields.get('mode', 'replace')
+        dry_run = fields.get('dry_run', '').lower() in ('true', 'on', '1')
         
-        # Validate the CSV file
-        encoding = DATA_IMPORT_CONFIG['encoding']
-        delimiter = DATA_IMPORT_CONFIG['delimiter']
-        is_valid, errors, warnings = validate_csv_file(temp_path, encoding, delimiter)
-        
-        if not is_valid:
+        # Validate and import in a single pass; on any problem the old data stays untouched
+        merge = mode == 'merge'
+        try:
+            stats = await run_tracked_import(temp_path, merge=merge, dry_run=merge and dry_run)
+        except CSVImportError as e:
+            os.unlink(temp_path)
+            return RedirectResponse(url=f"/admin/console?error=CSV validation failed: {e}", status_code=302)
+        finally:
+            aggregate_cache.clear()
+
+        if merge and dry_run:
             os.unlink(temp_path)
-            error_msg = "CSV validation failed: " + "; ".join(errors)
-            return RedirectResponse(url=f"/admin/console?error={error_msg}", status_code=302)
+            message = (f"Dry run: {stats['added']} terms would be added, {stats['retired']} retired and "
+                       f"{stats['reactivated']} reactivated ({stats['unchanged']} unchanged). Nothing was changed.")
+            return RedirectResponse(url=f"/admin/console?message={message}", status_code=302)
         
         # Backup the current CSV file
         csv_path = DATA_IMPORT_CONFIG['csv_path']
         backup_path = csv_path + f".backup.{datetime.now().strftime('%Y%m%d_%H%M%S')}"
         
         if os.path.exists(csv_path):
-            shutil.copy2(csv_path, backup_path)
+            await run_in_threadpool(shutil.copy2, csv_path, backup_path)
         
         # Replace the CSV file
-        shutil.move(temp_path, csv_path)
+        await run_in_threadpool(shutil.move, temp_path, csv_path)
         temp_path = None  # Moved, don't try to delete
         
-        # Delete all mappings, terms, and users
-        conn = get_db()
-        c = conn.cursor()
-        c.execute('DELETE FROM mappings')
-        c.execute('DELETE FROM sessions')
-        c.execute('DELETE FROM users')
-        c.execute('DELETE FROM terms')
-        conn.commit()
-        conn.close()
-        
-        # Re-import terms
-        import_terms_from_csv(force=True)
-        
+        issue_count = len(stats['issues']) + stats['more_issues']
         warning_msg = ""
-        if warnings:
-            warning_msg = f" (with {len(warnings)} warnings)"
+        if issue_count:
+            warning_msg = f" (with {issue_count} warnings)"
         
-        message = f"CSV file uploaded successfully{warning_msg}. Database reset and terms re-imported. Backup saved to {os.path.basename(backup_path)}"
+        if merge:
+            message = (f"CSV file merged successfully{warning_msg}: {stats['added']} terms added, {stats['retired']} retired, "
+                       f"{stats['reactivated']} reactivated, {stats['unchanged']} unchanged. Mappings were kept. "
+                       f"Backup saved to {os.path.basename(backup_path)}")
+        else:
+            message = (f"CSV file uploaded successfully{warning_msg}. Database reset and {stats['imported']} terms imported "
+                       f"({stats['skipped_duplicate']} duplicates, {stats['skipped_empty']} empty rows skipped). "
+                       f"Backup saved to {os.path.basename(backup_path)}")
         return RedirectResponse(url=f"/admin/console?message={message}", status_code=302)
-        
+
+    except HTTPException:
+        raise
     except Exception as e:
         if temp_path and os.path.exists(temp_path):
             os.unlink(temp_path)
         error_msg = f"Error uploading CSV: {str(e)}"
         return RedirectResponse(url=f"/admin/console?error={error_msg}", status_code=302)
 
+@app.get("/admin/import/progress")
+async def admin_import_progress(request: Request):
+    """Progress of the running (or last) CSV import, whichever worker runs it"""
+    if not request.session.get('admin_logged_in'):
+        raise HTTPException(status_code=403)
+    return import_progress.snapshot()
+
+@app.post("/admin/validate-codes")
+async def validate_codes_route(request: Request):
+    """Start the bulk validation of codes not yet checked by the current validator"""
+    if not request.session.get('admin_logged_in'):
+        return RedirectResponse(url="/admin", status_code=302)
+
+    if code_validation.running:
+        return RedirectResponse(url="/admin/console?error=Code validation is already running", status_code=302)
+    app.state.code_validation = asyncio.create_task(code_validation.run())
+    return RedirectResponse(url="/admin/console?message=Code validation started", status_code=302)
+
 @app.get("/admin/logout")
 async def admin_logout(request: Request):
     """Admin logout"""
@@ -992,15 +4013,7 @@ async def admin_messages(request: Request):
     if not request.session.get('admin_logged_in'):
         return RedirectResponse(url="/admin", status_code=302)
 
-    conn = get_db()
-    c = conn.cursor()
-
-    c.execute('''SELECT id, name, email, subject, message, created_at, read 
-                 FROM contact_messages 
-                 ORDER BY created_at DESC''')
-    messages = [dict(row) for row in c.fetchall()]
-
-    conn.close()
+    messages = await run_db(get_contact_messages)
 
     return templates.TemplateResponse("admin_messages.html", {
         "request": request,
@@ -1013,11 +4026,7 @@ async def mark_message_read(request: Request, message_id: int):
     if not request.session.get('admin_logged_in'):
         return RedirectResponse(url="/admin", status_code=302)
 
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('UPDATE contact_messages SET read = 1 WHERE id = ?', (message_id,))
-    conn.commit()
-    conn.close()
+    await run_db(mark_contact_message_read, message_id)
 
     return RedirectResponse(url="/admin/messages", status_code=302)
 
@@ -1027,13 +4036,67 @@ async def delete_message(request: Request, message_id: int):
     if not request.session.get('admin_logged_in'):
         return RedirectResponse(url="/admin", status_code=302)
 
+    await run_db(delete_contact_message, message_id)
+
+    return RedirectResponse(url="/admin/messages", status_code=302)
+
+# Prometheus Metrics Route
+def count_open_sessions():
+    """Mapping sessions started within the session lifetime and not completed"""
     conn = get_db()
-    c = conn.cursor()
-    c.execute('DELETE FROM contact_messages WHERE id = ?', (message_id,))
-    conn.commit()
+    count = conn.execute("SELECT COUNT(*) FROM sessions WHERE completed_at IS NULL AND started_at > datetime('now', ?)",
+                         (f'-{SESSION_TTL} seconds',)).fetchone()[0]
     conn.close()
+    return count
+
+class ScrapeTimeGauges:
+    """Gauges read from the database when /metrics is scraped, so every worker reports the same value"""
+
+    def __init__(self, values):
+        self.values = values  # (name, documentation, value)
+
+    def collect(self):
+        for name, documentation, value in self.values:
+            yield GaugeMetricFamily(name, documentation, value=value)
+
+def metrics_client_ip(request):
+    """Client address, taken from the proxy headers only when the peer is a trusted proxy"""
+    client_ip = request.client.host if request.client else None
+    if client_ip not in METRICS_TRUSTED_PROXIES:
+        return client_ip
+    forwarded = [ip.strip() for ip in request.headers.get('x-forwarded-for', '').split(',') if ip.strip()]
+    if not forwarded:
+        return request.headers.get('x-real-ip', client_ip).strip()
+    # Proxies append the address they received from, so the last untrusted one is the client
+    for ip in reversed(forwarded):
+        if ip not in METRICS_TRUSTED_PROXIES:
+            return ip
+    return forwarded[0]
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    """Prometheus metrics of all workers, for admins and the configured scraper addresses"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404)
+    if not request.session.get('admin_logged_in') and metrics_client_ip(request) not in METRICS_ALLOWED_IPS:
+        raise HTTPException(status_code=403)
+
+    if session_backend.blocking:
+        web_sessions = await run_db(session_backend.count_active)
+    else:
+        web_sessions = session_backend.count_active()
+    open_sessions = await run_db(count_open_sessions)
 
-    return RedirectResponse(url="/admin/messages", status_code=302)
+    registry = CollectorRegistry(auto_describe=False)
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(REGISTRY)
+    registry.register(ScrapeTimeGauges([
+        ('web_sessions_active', 'Logged-in sessions that have not expired', web_sessions),
+        ('mapping_sessions_open', 'Mapping sessions started within the session lifetime and not completed', open_sessions)
+    ]))
+    return Response(await run_in_threadpool(generate_latest, registry), headers={"Content-Type": CONTENT_TYPE_LATEST})
 
 # Robots.txt Route
 @app.get("/robots.txt")
@@ -1049,10 +4112,7 @@ async def imprint(request: Request):
     if not IMPRINT_CONFIG.get('enabled', True):
         raise HTTPException(status_code=404, detail="Imprint not available")
 
-    return templates.TemplateResponse("imprint.html", {
-        "request": request,
-        "imprint": IMPRINT_CONFIG
-    })
+    return page_cache.response(request, 'imprint')
 
 # Data Protection Route
 @app.get("/datenschutz", response_class=HTMLResponse)
@@ -1061,10 +4121,7 @@ async def datenschutz(request: Request):
     if not DATENSCHUTZ_CONFIG.get('enabled', True):
         raise HTTPException(status_code=404, detail="Data protection page not available")
 
-    return templates.TemplateResponse("datenschutz.html", {
-        "request": request,
-        "datenschutz": DATENSCHUTZ_CONFIG
-    })
+    return page_cache.response(request, 'datenschutz')
 
 # Contact Form Routes
 @app.get("/contact", response_class=HTMLResponse)
@@ -1097,21 +4154,13 @@ async def submit_contact(request: Request,
             "error": "Bitte füllen Sie alle erforderlichen Felder aus."
         })
 
-    # Store in database if enabled
-    if CONTACT_CONFIG.get('store_in_db', True):
-        conn = get_db()
-        c = conn.cursor()
-        c.execute('''INSERT INTO contact_messages (name, email, subject, message) 
-                     VALUES (?, ?, ?, ?)''',
-                  (name, email, subject, message))
-        conn.commit()
-        conn.close()
-
-    # Send email if enabled
-    if CONTACT_CONFIG.get('send_email', False):
-        email_sent = send_contact_email(name, email, subject, message)
-        if not email_sent:
-            print("Warning: Failed to send contact form email")
+    # Store in database and/or queue the email; delivery happens in the background
+    store = CONTACT_CONFIG.get('store_in_db', True)
+    send_email = CONTACT_CONFIG.get('send_email', False)
+    if store or send_email:
+        await run_db(store_contact_message, name, email, subject, message, store, send_email)
+    if send_email:
+        outbox_wakeup.set()
 
     # Redirect to contact page with success message
     return RedirectResponse(url="/contact?success=true", status_code=302)
@@ -1120,12 +4169,96 @@ async def submit_contact(request: Request,
 @app.get("/manual", response_class=HTMLResponse)
 async def manual(request: Request):
     """Display manual/help page"""
-    user = get_current_user(request)
-    return templates.TemplateResponse("manual.html", {
-        "request": request,
-        "user": user
-    })
+    return page_cache.response(request, 'manual')
+
+def rebuild_counts_command():
+    """Recompute the maintained per-term rater counts and per-user points of an existing database"""
+    init_db()
+    conn = get_db()
+    rebuild_rater_counts(conn)
+    rebuild_user_points(conn)
+    conn.commit()
+    conn.close()
+    print("Per-term rater counts and per-user points rebuilt")
+
+def migrate_command(check=False):
+    """Apply pending migrations, or with check=True verify the schema and query plans"""
+    conn = get_db()
+    current = get_schema_version(conn)
+    latest = MIGRATIONS[-1][0]
+    print(f"Schema version: {current} (latest: {latest})")
+    if not check:
+        migrate(conn, verbose=True)
+        conn.close()
+        return 0
+
+    failed = False
+    if current < latest:
+        print(f"FAIL: {latest - current} pending migration(s)")
+        failed = True
+    else:
+        for name, detail in check_query_plans(conn):
+            print(f"FAIL: {name}: {detail}")
+            failed = True
+    conn.close()
+    if not failed:
+        print(f"OK: {len(HOT_QUERIES)} hot queries use indexes")
+    return 1 if failed else 0
+
+def load_terminology_command(fmt, path, vocabulary=None, encoding='utf-8', concepts_path=None, refset_path=None):
+    """Load a release file into the terminology index used by the code search"""
+    conn = sqlite3.connect(TERMINOLOGY_DATABASE)
+    conn.execute('PRAGMA journal_mode = WAL')
+    init_terminology_db(conn)
+    print(f"Loading {path} into {TERMINOLOGY_DATABASE}...")
+    start = time.monotonic()
+    stats = load_terminology(conn, fmt, path, vocabulary, encoding, concepts_path, refset_path)
+    conn.close()
+    print(f"{stats['vocabulary']}: {stats['concepts']:,} concepts, {stats['descriptions']:,} descriptions "
+          f"indexed in {time.monotonic() - start:.1f}s")
+
+def validate_codes_command():
+    """Validate all mapping codes not yet checked by the current validator"""
+    init_db()
+    state = asyncio.run(code_validation.run())
+    print(f"Validated {state['checked']} codes, {state['invalid']} invalid")
+    return 1 if state.get('error') else 0
 
 if __name__ == '__main__':
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=5000)
+    import argparse
+    parser = argparse.ArgumentParser(description="Medical Term Mapper")
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('serve', help='Run the development server (default)')
+    subparsers.add_parser('rebuild-counts', help='Recompute per-term rater counts and per-user points from the mappings table')
+    migrate_parser = subparsers.add_parser('migrate', help='Apply pending schema migrations')
+    migrate_parser.add_argument('--check', action='store_true',
+                                help='Apply nothing; fail if migrations are pending or a hot query does a full table scan')
+    subparsers.add_parser('validate-codes', help='Normalize and validate mapping codes not checked by the current validator')
+    terminology_parser = subparsers.add_parser('load-terminology',
+                                               help='Load a terminology release file into the code search index')
+    terminology_parser.add_argument('format', choices=['snomed', 'icd10gm', 'loinc', 'tsv'],
+                                    help='snomed: RF2 description snapshot, icd10gm: ...syst_kodes.txt, '
+                                         'loinc: Loinc.csv or Part.csv, tsv: code<TAB>display')
+    terminology_parser.add_argument('path', help='Release file to load')
+    terminology_parser.add_argument('--vocabulary', help='Vocabulary name to store the codes under '
+                                                         '(default: SNOMED, ICD10 or LOINC; required for tsv)')
+    terminology_parser.add_argument('--encoding', default='utf-8', help='File encoding (default: utf-8)')
+    terminology_parser.add_argument('--concepts', help='SNOMED CT: RF2 concept snapshot, drops inactive concepts')
+    terminology_parser.add_argument('--language-refset', help='SNOMED CT: RF2 language refset snapshot, '
+                                                              'uses preferred synonyms as display texts')
+    args = parser.parse_args()
+
+    if args.command == 'rebuild-counts':
+        rebuild_counts_command()
+    elif args.command == 'migrate':
+        sys.exit(migrate_command(args.check))
+    elif args.command == 'validate-codes':
+        sys.exit(validate_codes_command())
+    elif args.command == 'load-terminology':
+        if args.format == 'tsv' and not args.vocabulary:
+            parser.error('--vocabulary is required for tsv files')
+        load_terminology_command(args.format, args.path, args.vocabulary, args.encoding,
+                                 args.concepts, args.language_refset)
+    else:
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=5000)
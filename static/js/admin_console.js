@@ -0,0 +1,29 @@
+// Ask before destructive form submissions; with data-confirm-mode only for that mode
+document.querySelectorAll('form[data-confirm]').forEach(function(form) {
+    form.addEventListener('submit', function(event) {
+        if (form.dataset.confirmMode && form.mode.value !== form.dataset.confirmMode) return;
+        if (!confirm(form.dataset.confirm)) event.preventDefault();
+    });
+});
+
+// Show import progress while the upload request is running
+const uploadForm = document.getElementById('uploadForm');
+if (uploadForm) {
+    uploadForm.addEventListener('submit', function(event) {
+        if (event.defaultPrevented) return;
+        const status = document.getElementById('importProgress');
+        status.hidden = false;
+        status.textContent = 'Uploading...';
+        setInterval(async function() {
+            try {
+                const response = await fetch('/admin/import/progress');
+                const progress = await response.json();
+                if (progress.running) {
+                    status.textContent = `Importing: ${progress.rows} rows (${progress.percentage || 0}%)`;
+                }
+            } catch (e) {
+                // Keep the last status, the page is about to be replaced anyway
+            }
+        }, 1000);
+    });
+}
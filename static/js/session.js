@@ -0,0 +1,751 @@
+let codeCount = 1;
+// The term on the page and its position in the session, set by the template
+let currentTermId = Number(document.getElementById('mappingForm').dataset.termId);
+let currentIndex = Number(document.getElementById('mappingForm').dataset.index);
+
+// Auto-detect vocabulary based on code pattern
+function detectVocabulary(code) {
+    code = code.trim();
+
+    // SNOMED CT: typically 6-18 digits
+    if (/^\d{6,18}$/.test(code)) {
+        return 'SNOMED';
+    }
+
+    // ICD-10: starts with letter, followed by 2 digits, optional dot and more chars
+    // Examples: I10, E11.9, S72.001A
+    if (/^[A-TV-Z]\d{2}(\.\d{1,4}[A-Z]?)?$/i.test(code)) {
+        return 'ICD10';
+    }
+
+    // LOINC: typically LP or just digits followed by dash and digit
+    // Examples: LP12345-6, 1234-5
+    if (/^(LP)?\d{4,6}-\d$/i.test(code)) {
+        return 'LOINC';
+    }
+
+    return null;
+}
+
+// Add event listeners to code inputs for auto-detection
+function setupCodeInput(index) {
+    const input = document.querySelector(`input.code-input[data-code-index="${index}"]`);
+    const radios = document.querySelectorAll(`input[name="vocab_${index}"]`);
+
+    input.addEventListener('input', function() {
+        const detected = detectVocabulary(this.value);
+        if (detected) {
+            radios.forEach(radio => {
+                if (radio.value === detected) {
+                    radio.checked = true;
+                }
+            });
+        }
+    });
+}
+
+// Setup initial input
+setupCodeInput(0);
+
+// Suggest codes and display texts from the local terminology index while typing
+const suggestBox = document.createElement('ul');
+suggestBox.className = 'code-suggestions';
+suggestBox.style.display = 'none';
+document.body.appendChild(suggestBox);
+let suggestInput = null;
+let suggestItems = [];
+let suggestActive = -1;
+let suggestTimer = null;
+let suggestRequest = null;
+
+function hideSuggestions() {
+    suggestBox.style.display = 'none';
+    suggestItems = [];
+    suggestActive = -1;
+}
+
+function fillCodeEntry(entry, code, displayText, vocabulary) {
+    const index = entry.dataset.index;
+    entry.querySelector(`input.code-input[data-code-index="${index}"]`).value = code || '';
+    entry.querySelector(`input.display-text-input[data-display-index="${index}"]`).value = displayText || '';
+    const radios = Array.from(entry.querySelectorAll(`input[name="vocab_${index}"]`));
+    const radio = radios.find(r => r.value === vocabulary) || radios.find(r => r.value === 'OTHER');
+    radio.checked = true;
+    radio.dispatchEvent(new Event('change'));
+    if (radio.value === 'OTHER') {
+        entry.querySelector(`.vocab-other-text[data-vocab-index="${index}"]`).value = vocabulary || '';
+    }
+}
+
+function applySuggestion(item) {
+    fillCodeEntry(suggestInput.closest('.code-entry'), item.code, item.display, item.vocabulary);
+    hideSuggestions();
+}
+
+// Copy the codes of a similar term the rater mapped before into the form
+document.getElementById('similarTerms').addEventListener('click', function(e) {
+    const button = e.target.closest('.use-codes-btn');
+    if (!button) {
+        return;
+    }
+    const codes = JSON.parse(button.dataset.codes);
+    while (document.querySelectorAll('.code-entry').length < codes.length) {
+        document.getElementById('addCodeBtn').click();
+    }
+    const entries = document.querySelectorAll('.code-entry');
+    codes.forEach((code, i) => fillCodeEntry(entries[i], code.code, code.display_text, code.vocabulary));
+});
+
+function showSuggestions(input, results) {
+    suggestBox.innerHTML = '';
+    suggestInput = input;
+    suggestItems = results;
+    suggestActive = -1;
+    if (!results.length) {
+        hideSuggestions();
+        return;
+    }
+    results.forEach(item => {
+        const li = document.createElement('li');
+        const code = document.createElement('span');
+        code.className = 'suggestion-code';
+        code.textContent = `${item.vocabulary} ${item.code}`;
+        const display = document.createElement('span');
+        display.className = 'suggestion-display';
+        display.textContent = item.display;
+        li.append(code, display);
+        if (item.matched !== item.display && item.matched !== item.code) {
+            const matched = document.createElement('span');
+            matched.className = 'help-text suggestion-matched';
+            matched.textContent = item.matched;
+            li.append(matched);
+        }
+        // mousedown fires before the input loses focus
+        li.addEventListener('mousedown', e => {
+            e.preventDefault();
+            applySuggestion(item);
+        });
+        suggestBox.appendChild(li);
+    });
+    const rect = input.getBoundingClientRect();
+    suggestBox.style.left = `${rect.left + window.scrollX}px`;
+    suggestBox.style.top = `${rect.bottom + window.scrollY}px`;
+    suggestBox.style.minWidth = `${rect.width}px`;
+    suggestBox.style.display = 'block';
+}
+
+function requestSuggestions(input) {
+    const query = input.value.trim();
+    if (suggestRequest) {
+        suggestRequest.abort();
+    }
+    if (query.length < 2) {
+        hideSuggestions();
+        return;
+    }
+    const params = new URLSearchParams({q: query});
+    if (input.classList.contains('code-input')) {
+        const detected = detectVocabulary(query);
+        if (detected) {
+            params.set('vocabulary', detected);
+        }
+    }
+    suggestRequest = new AbortController();
+    fetch(`/api/codes/search?${params}`, {signal: suggestRequest.signal})
+        .then(response => response.ok ? response.json() : {results: []})
+        .then(data => {
+            if (document.activeElement === input) {
+                showSuggestions(input, data.results);
+            }
+        })
+        .catch(() => {});
+}
+
+document.getElementById('codesContainer').addEventListener('input', function(e) {
+    if (!e.target.matches('.code-input, .display-text-input')) {
+        return;
+    }
+    clearTimeout(suggestTimer);
+    suggestTimer = setTimeout(() => requestSuggestions(e.target), 120);
+});
+
+document.getElementById('codesContainer').addEventListener('keydown', function(e) {
+    if (e.target !== suggestInput || !suggestItems.length) {
+        return;
+    }
+    if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+        e.preventDefault();
+        const step = e.key === 'ArrowDown' ? 1 : -1;
+        suggestActive = (suggestActive + step + suggestItems.length) % suggestItems.length;
+        suggestBox.querySelectorAll('li').forEach((li, i) => li.classList.toggle('active', i === suggestActive));
+    } else if (e.key === 'Enter' && !e.ctrlKey && suggestActive >= 0) {
+        applySuggestion(suggestItems[suggestActive]);
+    } else if (e.key === 'Escape') {
+        hideSuggestions();
+    }
+});
+
+document.getElementById('codesContainer').addEventListener('focusout', hideSuggestions);
+
+// Setup vocabulary "Other" option toggle
+function setupVocabOtherToggle(index) {
+    const otherRadio = document.querySelector(`input.vocab-other-radio[data-vocab-index="${index}"]`);
+    const otherInput = document.querySelector(`.vocab-other-input[data-vocab-index="${index}"]`);
+    const allRadios = document.querySelectorAll(`input[name="vocab_${index}"]`);
+
+    allRadios.forEach(radio => {
+        radio.addEventListener('change', function() {
+            if (this.value === 'OTHER') {
+                otherInput.style.display = 'block';
+                otherInput.querySelector('.vocab-other-text').focus();
+            } else {
+                otherInput.style.display = 'none';
+                otherInput.querySelector('.vocab-other-text').value = '';
+            }
+        });
+    });
+}
+
+// Setup initial vocabulary toggle
+setupVocabOtherToggle(0);
+
+// Add another code entry
+document.getElementById('addCodeBtn').addEventListener('click', function() {
+    const container = document.getElementById('codesContainer');
+    const newIndex = codeCount;
+
+    const newEntry = document.createElement('div');
+    newEntry.className = 'code-entry';
+    newEntry.dataset.index = newIndex;
+    newEntry.innerHTML = `
+        <div class="code-entry-header">
+            <label>Concept #${newIndex + 1}</label>
+            <button type="button" class="btn-remove-code" data-remove-index="${newIndex}">Remove</button>
+        </div>
+        <div class="code-entry-body">
+            <div class="form-row" style="display: flex; gap: 15px;">
+                <div class="form-group" style="flex: 1;">
+                    <label class="input-label">Code <span class="help-text">(unique identifier)</span></label>
+                    <input type="text" class="code-input" data-code-index="${newIndex}"
+                           placeholder="e.g., 123456789, I10, LP12345-6">
+                </div>
+                <div class="form-group" style="flex: 1;">
+                    <label class="input-label">Display Text <span class="help-text">(human-readable description)</span></label>
+                    <input type="text" class="display-text-input" data-display-index="${newIndex}"
+                           placeholder="e.g., Essential (primary) hypertension">
+                </div>
+            </div>
+            <div class="form-row">
+                <div class="vocab-selector">
+                    <label class="vocab-label">Vocabulary:</label>
+                    <div class="radio-group">
+                        <label class="radio-option">
+                            <input type="radio" name="vocab_${newIndex}" value="SNOMED" checked>
+                            <span>SNOMED CT</span>
+                        </label>
+                        <label class="radio-option">
+                            <input type="radio" name="vocab_${newIndex}" value="ICD10">
+                            <span>ICD-10</span>
+                        </label>
+                        <label class="radio-option">
+                            <input type="radio" name="vocab_${newIndex}" value="LOINC">
+                            <span>LOINC</span>
+                        </label>
+                        <label class="radio-option">
+                            <input type="radio" name="vocab_${newIndex}" value="OTHER" class="vocab-other-radio" data-vocab-index="${newIndex}">
+                            <span>Other</span>
+                        </label>
+                    </div>
+                    <div class="vocab-other-input" data-vocab-index="${newIndex}" style="display: none; margin-top: 10px;">
+                        <input type="text" class="vocab-other-text" data-vocab-index="${newIndex}"
+                               placeholder="Enter vocabulary name (required)" 
+                               style="width: 100%; padding: 8px; border: 1px solid #e2e8f0; border-radius: 4px;">
+                    </div>
+                </div>
+            </div>
+            <div class="form-row">
+                <label class="checkbox-option">
+                    <input type="checkbox" class="approximate-match-checkbox" data-approx-index="${newIndex}">
+                    <span>Approximate match</span>
+                </label>
+                <span class="help-text" style="margin-left: 10px;">Check if the code doesn't exactly match the term</span>
+            </div>
+        </div>
+    `;
+
+    container.appendChild(newEntry);
+    setupCodeInput(newIndex);
+    setupVocabOtherToggle(newIndex);
+
+    // Setup remove button
+    newEntry.querySelector('.btn-remove-code').addEventListener('click', function() {
+        newEntry.remove();
+    });
+
+    codeCount++;
+
+    // Focus on new input
+    newEntry.querySelector('.code-input').focus();
+});
+
+// Handle "No Code Found" button - propose new concept
+document.getElementById('noCodeBtn').addEventListener('click', function() {
+    const displayText = prompt('No existing code found. Please propose a new concept by entering a display text (description):');
+    
+    if (displayText && displayText.trim()) {
+        // User is proposing a new concept - only display text, no code
+        const newConcept = [{
+            code: '',
+            display_text: displayText.trim(),
+            vocabulary: 'NEW_CONCEPT',
+            approximate_match: false
+        }];
+        
+        sendMapping(newConcept, [displayText.trim()], true, true);
+    } else if (displayText !== null) {
+        // User clicked OK but didn't enter text
+        alert('Please enter a description for the new concept, or click Cancel if you changed your mind.');
+    }
+    // If null (clicked Cancel), do nothing
+});
+
+// Handle form submission
+document.getElementById('mappingForm').addEventListener('submit', function(e) {
+    e.preventDefault();
+
+    // Collect all codes and display texts
+    const codes = [];
+    const displayTexts = [];
+    const codeEntries = document.querySelectorAll('.code-entry');
+    let validationError = false;
+
+    codeEntries.forEach(entry => {
+        const index = entry.dataset.index;
+        const codeInput = entry.querySelector(`input.code-input[data-code-index="${index}"]`);
+        const displayTextInput = entry.querySelector(`input.display-text-input[data-display-index="${index}"]`);
+        const vocabRadio = entry.querySelector(`input[name="vocab_${index}"]:checked`);
+        const approxCheckbox = entry.querySelector(`input.approximate-match-checkbox[data-approx-index="${index}"]`);
+
+        const code = codeInput.value.trim();
+        const displayText = displayTextInput.value.trim();
+        
+        if (code || displayText) {
+            let vocabulary = vocabRadio ? vocabRadio.value : 'SNOMED';
+            
+            // If "Other" is selected, get the custom vocabulary name
+            if (vocabulary === 'OTHER') {
+                const otherInput = entry.querySelector(`.vocab-other-text[data-vocab-index="${index}"]`);
+                const otherValue = otherInput ? otherInput.value.trim() : '';
+                
+                if (!otherValue) {
+                    alert('Please enter a vocabulary name for "Other" or select a different vocabulary option.');
+                    otherInput.focus();
+                    validationError = true;
+                    return;
+                }
+                
+                vocabulary = otherValue;
+            }
+            
+            codes.push({
+                code: code,
+                vocabulary: vocabulary,
+                approximate_match: approxCheckbox ? approxCheckbox.checked : false
+            });
+            
+            displayTexts.push(displayText);
+        }
+    });
+
+    if (validationError) {
+        return;
+    }
+
+    sendMapping(codes, displayTexts, false, false);
+});
+
+// Prevent Enter key from submitting the form
+document.getElementById('mappingForm').addEventListener('keydown', function(e) {
+    if (e.key === 'Enter' && !e.ctrlKey) {
+        e.preventDefault();
+        return false;
+    }
+});
+
+// Keyboard shortcuts
+document.addEventListener('keydown', function(e) {
+    // Ctrl+Enter to submit
+    if (e.ctrlKey && e.key === 'Enter') {
+        e.preventDefault();
+        document.getElementById('submitBtn').click();
+    }
+
+    // Ctrl+N for no code found
+    if (e.ctrlKey && e.key === 'n') {
+        e.preventDefault();
+        document.getElementById('noCodeBtn').click();
+    }
+});
+
+// Store form data in sessionStorage before navigation
+function saveFormData() {
+    const termId = currentTermId;
+    const formData = {
+        codes: [],
+        comment: document.getElementById('comment').value
+    };
+    
+    document.querySelectorAll('.code-entry').forEach(entry => {
+        const index = entry.dataset.index;
+        const codeInput = entry.querySelector(`input.code-input[data-code-index="${index}"]`);
+        const displayTextInput = entry.querySelector(`input.display-text-input[data-display-index="${index}"]`);
+        const vocabRadio = entry.querySelector(`input[name="vocab_${index}"]:checked`);
+        const approxCheckbox = entry.querySelector(`input.approximate-match-checkbox[data-approx-index="${index}"]`);
+        
+        let vocabulary = vocabRadio ? vocabRadio.value : 'SNOMED';
+        if (vocabulary === 'OTHER') {
+            const otherInput = entry.querySelector(`.vocab-other-text[data-vocab-index="${index}"]`);
+            vocabulary = otherInput ? otherInput.value.trim() : '';
+        }
+        
+        formData.codes.push({
+            code: codeInput.value,
+            displayText: displayTextInput.value,
+            vocabulary: vocabulary,
+            approximateMatch: approxCheckbox ? approxCheckbox.checked : false
+        });
+    });
+    
+    sessionStorage.setItem(`term_draft_${termId}`, JSON.stringify(formData));
+}
+
+// Restore form data from sessionStorage
+function restoreFormData() {
+    const termId = currentTermId;
+    const savedData = sessionStorage.getItem(`term_draft_${termId}`);
+    
+    if (savedData) {
+        const formData = JSON.parse(savedData);
+        
+        // Restore comment
+        if (formData.comment) {
+            document.getElementById('comment').value = formData.comment;
+        }
+        
+        // Restore code entries
+        if (formData.codes && formData.codes.length > 0) {
+            // Clear default entry
+            const container = document.getElementById('codesContainer');
+            container.innerHTML = '';
+            
+            formData.codes.forEach((codeData, index) => {
+                if (index > 0) {
+                    // Add additional entries
+                    document.getElementById('addCodeBtn').click();
+                }
+                
+                // Wait for DOM to update
+                setTimeout(() => {
+                    const entry = container.querySelector(`[data-index="${index}"]`);
+                    if (!entry) {
+                        // Create the entry manually
+                        createCodeEntry(index);
+                    }
+                    
+                    const codeInput = container.querySelector(`input.code-input[data-code-index="${index}"]`);
+                    const displayTextInput = container.querySelector(`input.display-text-input[data-display-index="${index}"]`);
+                    const approxCheckbox = container.querySelector(`input.approximate-match-checkbox[data-approx-index="${index}"]`);
+                    
+                    if (codeInput) codeInput.value = codeData.code || '';
+                    if (displayTextInput) displayTextInput.value = codeData.displayText || '';
+                    if (approxCheckbox) approxCheckbox.checked = codeData.approximateMatch || false;
+                    
+                    // Set vocabulary
+                    const vocabRadios = container.querySelectorAll(`input[name="vocab_${index}"]`);
+                    let vocabSet = false;
+                    vocabRadios.forEach(radio => {
+                        if (radio.value === codeData.vocabulary) {
+                            radio.checked = true;
+                            vocabSet = true;
+                        }
+                    });
+                    
+                    // If custom vocabulary, set Other and the text field
+                    if (!vocabSet && codeData.vocabulary) {
+                        const otherRadio = container.querySelector(`input.vocab-other-radio[data-vocab-index="${index}"]`);
+                        if (otherRadio) {
+                            otherRadio.checked = true;
+                            const otherInput = container.querySelector(`.vocab-other-input[data-vocab-index="${index}"]`);
+                            if (otherInput) {
+                                otherInput.style.display = 'block';
+                                const textInput = otherInput.querySelector('.vocab-other-text');
+                                if (textInput) textInput.value = codeData.vocabulary;
+                            }
+                        }
+                    }
+                }, 100 * index);
+            });
+        }
+    }
+}
+
+function createCodeEntry(index) {
+    const container = document.getElementById('codesContainer');
+    const newEntry = document.createElement('div');
+    newEntry.className = 'code-entry';
+    newEntry.dataset.index = index;
+    newEntry.innerHTML = `
+        <div class="code-entry-header">
+            <label>Concept #${index + 1}</label>
+            ${index > 0 ? `<button type="button" class="btn-remove-code" data-remove-index="${index}">Remove</button>` : ''}
+        </div>
+        <div class="code-entry-body">
+            <div class="form-row" style="display: flex; gap: 15px;">
+                <div class="form-group" style="flex: 1;">
+                    <label class="input-label">Code <span class="help-text">(unique identifier)</span></label>
+                    <input type="text" class="code-input" data-code-index="${index}"
+                           placeholder="e.g., 123456789, I10, LP12345-6"${index === 0 ? ' autofocus' : ''}>
+                </div>
+                <div class="form-group" style="flex: 1;">
+                    <label class="input-label">Display Text <span class="help-text">(human-readable description)</span></label>
+                    <input type="text" class="display-text-input" data-display-index="${index}"
+                           placeholder="e.g., Essential (primary) hypertension">
+                </div>
+            </div>
+            <div class="form-row">
+                <div class="vocab-selector">
+                    <label class="vocab-label">Vocabulary:</label>
+                    <div class="radio-group">
+                        <label class="radio-option">
+                            <input type="radio" name="vocab_${index}" value="SNOMED" checked>
+                            <span>SNOMED CT</span>
+                        </label>
+                        <label class="radio-option">
+                            <input type="radio" name="vocab_${index}" value="ICD10">
+                            <span>ICD-10</span>
+                        </label>
+                        <label class="radio-option">
+                            <input type="radio" name="vocab_${index}" value="LOINC">
+                            <span>LOINC</span>
+                        </label>
+                        <label class="radio-option">
+                            <input type="radio" name="vocab_${index}" value="OTHER" class="vocab-other-radio" data-vocab-index="${index}">
+                            <span>Other</span>
+                        </label>
+                    </div>
+                    <div class="vocab-other-input" data-vocab-index="${index}" style="display: none; margin-top: 10px;">
+                        <input type="text" class="vocab-other-text" data-vocab-index="${index}"
+                               placeholder="Enter vocabulary name (required)" 
+                               style="width: 100%; padding: 8px; border: 1px solid #e2e8f0; border-radius: 4px;">
+                    </div>
+                </div>
+            </div>
+            <div class="form-row">
+                <label class="checkbox-option">
+                    <input type="checkbox" class="approximate-match-checkbox" data-approx-index="${index}">
+                    <span>Approximate match</span>
+                </label>
+                <span class="help-text" style="margin-left: 10px;">Check if the code doesn't exactly match the term</span>
+            </div>
+        </div>
+    `;
+    container.appendChild(newEntry);
+    setupCodeInput(index);
+    setupVocabOtherToggle(index);
+    
+    if (index > 0) {
+        newEntry.querySelector('.btn-remove-code')?.addEventListener('click', function() {
+            newEntry.remove();
+        });
+    }
+}
+
+// With the session batch loaded, mappings are posted in the background and the next
+// term is shown right away; without it the page falls back to the plain form post
+let sessionBatch = null;
+const submitQueue = [];
+let submitting = false;
+
+fetch('/api/session')
+    .then(response => response.ok ? response.json() : null)
+    .then(data => {
+        if (data && data.terms[currentIndex] && data.terms[currentIndex].id === currentTermId) {
+            sessionBatch = data;
+        }
+    })
+    .catch(() => {});
+
+function sendMapping(codes, displayTexts, noCodeFound, proposeNew) {
+    const comment = document.getElementById('comment').value;
+    if (!sessionBatch) {
+        document.getElementById('codesJson').value = JSON.stringify(codes);
+        document.getElementById('displayTextsJson').value = JSON.stringify(displayTexts);
+        document.getElementById('noCodeFound').value = noCodeFound ? 'true' : 'false';
+        document.getElementById('proposeNew').value = proposeNew ? 'true' : 'false';
+        document.getElementById('mappingForm').submit();
+        return;
+    }
+    submitQueue.push({
+        term_id: currentTermId,
+        index: currentIndex,
+        codes: codes,
+        display_texts: displayTexts,
+        no_code_found: noCodeFound,
+        propose_new: proposeNew,
+        comment: comment
+    });
+    sessionStorage.removeItem(`term_draft_${currentTermId}`);
+    processSubmitQueue();
+    showTerm(currentIndex + 1);
+}
+
+function setSaveStatus(text) {
+    document.getElementById('saveStatus').textContent = text;
+}
+
+// One request at a time, in order, so the server's session state is never raced
+function processSubmitQueue(delay = 0) {
+    if (submitting || !submitQueue.length) {
+        if (!submitQueue.length) {
+            setSaveStatus('');
+        }
+        return;
+    }
+    submitting = true;
+    setSaveStatus(`Saving ${submitQueue.length} mapping${submitQueue.length > 1 ? 's' : ''}...`);
+    setTimeout(() => {
+        fetch('/api/session/submit', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(submitQueue[0])
+        }).then(response => {
+            if (response.status === 401) {
+                window.location.href = '/login';
+                return;
+            }
+            if (!response.ok && response.status < 500) {
+                // The server session changed (e.g. a new session in another tab); start over from it
+                submitQueue.length = 0;
+                window.location.href = '/session';
+                return;
+            }
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            submitQueue.shift();
+            submitting = false;
+            processSubmitQueue();
+            if (!submitQueue.length && currentIndex >= sessionBatch.total) {
+                window.location.href = '/session/complete';
+            }
+        }).catch(() => {
+            // Network or server error: keep the mapping and retry with backoff
+            submitting = false;
+            setSaveStatus('Connection problem, retrying...');
+            processSubmitQueue(Math.min(Math.max(delay * 2, 1000), 30000));
+        });
+    }, delay);
+}
+
+function renderSimilarTerms(similarTerms) {
+    const container = document.getElementById('similarTerms');
+    container.innerHTML = '';
+    if (!similarTerms || !similarTerms.length) {
+        return;
+    }
+    const intro = document.createElement('p');
+    intro.className = 'help-text';
+    intro.textContent = 'You already mapped similar terms:';
+    container.appendChild(intro);
+    similarTerms.forEach(similar => {
+        const hasCodes = similar.codes.length && !similar.no_code_found;
+        const row = document.createElement('div');
+        row.className = 'similar-term';
+        const info = document.createElement('div');
+        const name = document.createElement('div');
+        name.className = 'similar-term-name';
+        name.textContent = `${similar.term} `;
+        const category = document.createElement('span');
+        category.className = 'help-text';
+        category.textContent = `(${similar.category})`;
+        name.appendChild(category);
+        const codes = document.createElement('div');
+        codes.className = 'similar-term-codes';
+        if (hasCodes) {
+            similar.codes.forEach((code, i) => {
+                const codeText = document.createElement('code');
+                codeText.textContent = `${code.vocabulary} ${code.code}`;
+                codes.append(codeText, ` ${code.display_text || ''}${i < similar.codes.length - 1 ? '; ' : ''}`);
+            });
+        } else {
+            codes.textContent = 'No code found';
+        }
+        info.append(name, codes);
+        row.appendChild(info);
+        if (hasCodes) {
+            const button = document.createElement('button');
+            button.type = 'button';
+            button.className = 'btn btn-secondary use-codes-btn';
+            button.dataset.codes = JSON.stringify(similar.codes);
+            button.textContent = 'Use these codes';
+            row.appendChild(button);
+        }
+        container.appendChild(row);
+    });
+}
+
+function showTerm(index) {
+    const total = sessionBatch.total;
+    // Skip terms removed by an admin while the session was open
+    while (index < total && !sessionBatch.terms[index]) {
+        index++;
+    }
+    currentIndex = index;
+    if (index >= total) {
+        document.getElementById('progressLabel').textContent = `Term ${total} of ${total}`;
+        document.getElementById('progressBar').style.width = '100%';
+        document.getElementById('submitBtn').disabled = true;
+        document.getElementById('noCodeBtn').disabled = true;
+        if (!submitQueue.length) {
+            window.location.href = '/session/complete';
+        }
+        return;
+    }
+
+    const term = sessionBatch.terms[index];
+    currentTermId = term.id;
+    document.getElementById('termCategory').textContent = term.category;
+    document.getElementById('termText').textContent = term.term;
+    document.getElementById('progressLabel').textContent = `Term ${index + 1} of ${total}`;
+    document.getElementById('progressBar').style.width = `${Math.round(index / total * 100)}%`;
+    document.getElementById('mappingCount').textContent = term.mapping_count;
+    document.getElementById('needsMoreMappings').style.display = term.mapping_count < sessionBatch.required_raters ? '' : 'none';
+    document.getElementById('statCompleted').textContent = index;
+    document.getElementById('statRemaining').textContent = total - index;
+    renderSimilarTerms(term.similar);
+
+    hideSuggestions();
+    document.getElementById('codesContainer').innerHTML = '';
+    document.getElementById('comment').value = '';
+    createCodeEntry(0);
+    codeCount = 1;
+    restoreFormData();
+    document.querySelector('input.code-input[data-code-index="0"]').focus();
+    history.pushState({index: index}, '', `/session?index=${index}`);
+}
+
+// Earlier terms are not kept in the page; let the server render them
+window.addEventListener('popstate', () => window.location.reload());
+
+// Save form data periodically and before navigation
+setInterval(saveFormData, 2000);
+window.addEventListener('beforeunload', function(e) {
+    saveFormData();
+    if (submitQueue.length) {
+        e.preventDefault();
+        e.returnValue = '';
+    }
+});
+
+// Restore form data on page load
+restoreFormData();